@@ -3,34 +3,24 @@ Created by Ivan Danylenko
 Date 11.11.21
 """
 
-from PIL import Image
+import os
+import sys
 import numpy as np
 from matplotlib import cm
 from matplotlib import pyplot as plt
 
-fig, ax = plt.subplots(subplot_kw={"projection": "3d"})
-
-im = Image.open('Heightmaps/heightmap40.jpg', 'r')
-im = im.transpose(Image.FLIP_TOP_BOTTOM)
-width, height = im.size
-pixel_values = list(im.getdata())
-pixel_alpha = []
-z = []
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from terrain import load_heights
 
-# 0, 1, 2, 3
-# 4, 5, 6, 7
-# 8, 9, 10, 11
-
-for pixel in pixel_values:
-    pixel_alpha.append(round(pixel[0], 3))
+fig, ax = plt.subplots(subplot_kw={"projection": "3d"})
 
-for i in range(0, len(pixel_alpha), width):
-    z.append(pixel_alpha[i:i+width])
+# строки карты переворачиваются, чтобы верхний край изображения оказался в конце оси Y
+z = load_heights('Heightmaps/heightmap40.jpg')[::-1]
+height, width = z.shape
 
 x = np.arange(width)
 y = np.arange(height)
 x, y = np.meshgrid(x, y)
-z = np.array(z)
 
 surf = ax.plot_surface(x, y, z, cmap=cm.coolwarm,
                        linewidth=0, antialiased=False)
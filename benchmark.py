@@ -0,0 +1,202 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+#  Замер производительности: построение водоема, распространение звука и поиск источника субмаринами.
+#       python benchmark.py --output results.json
+#       python benchmark.py --output new.json --compare results.json --tolerance 1.25
+#  При сравнении код возврата равен 1, если какая-либо фаза стала медленнее более чем в tolerance раз.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+from PIL import Image
+from classes import Pool
+from instrumentation import Instrumentation
+from terrain import load_heights
+
+DEFAULT_MAPS = ['Heightmaps/heightmap15.jpg', 'Heightmaps/heightmap20.jpg', 'Heightmaps/heightmap40.jpg',
+                'Heightmaps/heightmap_flat.jpg', 'Heightmaps/heightmap_demonstration.jpg',
+                'Heightmaps/heightmap_robocik.jpg']
+# режимы распространения звука: (название в отчете, mode, enhanced_realism)
+MODES = [('curves', 'curves', False), ('curves_enhanced', 'curves', True), ('wavefront', 'wavefront', True),
+         ('eikonal', 'eikonal', True), ('visibility', 'visibility', True)]
+
+
+def scaled_heightmap(heightmap, scale, directory):
+    """ Создает синтетическую карту высот, увеличенную в scale раз по X и Y, и возвращает путь к ней. """
+
+    im = Image.open(heightmap, 'r')
+    name = os.path.splitext(os.path.basename(heightmap))[0] + '_x' + str(scale) + '.png'
+    path = os.path.join(directory, name)
+    im.resize((im.size[0] * scale, im.size[1] * scale), Image.BILINEAR).save(path)
+    return path
+
+
+def measure(setup, function, track_memory=True):
+    """ Замеряет фазу.
+
+    Время замеряется без трассировки памяти, поскольку tracemalloc многократно замедляет код на чистом Python; пиковая
+    память замеряется отдельным повторным запуском фазы на свежих данных.
+
+    Args:
+        setup (callable): функция без аргументов, подготавливающая аргументы фазы (не замеряется)
+        function (callable): замеряемая фаза; получает результат setup()
+        track_memory (bool): если False, пиковая память не замеряется
+
+    Returns:
+        tuple: (результат фазы, время в секундах, пиковая память в байтах или None)
+
+    """
+
+    prepared = setup()
+    start = time.perf_counter()
+    result = function(prepared)
+    seconds = time.perf_counter() - start
+
+    peak = None
+    if track_memory:
+        prepared = setup()
+        tracemalloc.start()
+        function(prepared)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def search(pool, starts):
+    """ Проводит субмарины из всех стартовых точек до источника звука и возвращает суммарное количество шагов. """
+
+    steps = 0
+    for x_position, y_position in starts:
+        pool.add_submarine(x_position, y_position)
+        steps += len(pool.submarine.move(True))
+    return steps
+
+
+def benchmark_map(heightmap, storages, modes, submarines, max_curve_cells, max_object_cells, seed, track_memory=True):
+    """ Замеряет все фазы для одной карты высот и возвращает список записей отчета. """
+
+    heights = load_heights(heightmap)
+    height = int(heights.max()) + 1
+    cells = height * heights.size
+    source = (heights.shape[1] // 2, heights.shape[0] // 2)
+    rng = random.Random(seed)
+    starts = [(rng.randrange(heights.shape[1]), rng.randrange(heights.shape[0])) for i in range(submarines)]
+
+    records = []
+    for storage in storages:
+        if storage == 'objects' and cells > max_object_cells:
+            continue
+        base = {'map': os.path.basename(heightmap), 'cells': cells, 'storage': storage}
+
+        def new_pool():
+            return Pool(height, heightmap, storage, Instrumentation(quiet=True))
+
+        result, seconds, peak = measure(lambda: None, lambda prepared: new_pool(), track_memory)
+        records.append(dict(base, mode=None, phase='pool_init', seconds=seconds, peak_bytes=peak))
+
+        for name, mode, enhanced_realism in modes:
+            if mode == 'curves' and cells > max_curve_cells:
+                continue
+
+            def add_sound_source(pool):
+                pool.add_sound_source(x_position=source[0], y_position=source[1], enhanced_realism=enhanced_realism,
+                                      mode=mode)
+                random.seed(seed)  # высоты субмарин выбираются случайно
+                return pool
+
+            result, seconds, peak = measure(new_pool, add_sound_source, track_memory)
+            records.append(dict(base, mode=name, phase='add_sound_source', seconds=seconds, peak_bytes=peak))
+
+            steps, seconds, peak = measure(lambda: add_sound_source(new_pool()), lambda pool: search(pool, starts),
+                                           track_memory)
+            records.append(dict(base, mode=name, phase='submarine_move', seconds=seconds, peak_bytes=peak,
+                                steps=steps))
+    return records
+
+
+def compare(records, baseline, tolerance, min_seconds=0.01):
+    """ Сравнивает записи с эталонным отчетом и возвращает список фаз, ставших медленнее более чем в tolerance раз.
+    Фазы короче min_seconds не сравниваются: их время определяется в основном шумом измерения. """
+
+    def key(record):
+        return record['map'], record['storage'], record['mode'], record['phase']
+
+    reference = {key(record): record for record in baseline['results']}
+    regressions = []
+    for record in records:
+        previous = reference.get(key(record))
+        if previous is None or max(record['seconds'], previous['seconds']) < min_seconds:
+            continue
+        if record['seconds'] > previous['seconds'] * tolerance:
+            regressions.append({'key': key(record), 'seconds': record['seconds'], 'baseline': previous['seconds'],
+                                'ratio': record['seconds'] / previous['seconds']})
+    return regressions
+
+
+def git_revision():
+    """ Возвращает хэш текущего коммита или None, если он недоступен. """
+
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark pool construction, sound propagation and submarine search.')
+    parser.add_argument('--maps', nargs='+', default=DEFAULT_MAPS, help='heightmaps to benchmark')
+    parser.add_argument('--scales', nargs='*', type=int, default=[2, 4],
+                        help='also benchmark synthetic maps scaled up from the last map by these factors')
+    parser.add_argument('--storages', nargs='+', default=['objects', 'arrays', 'columns'])
+    parser.add_argument('--modes', nargs='+', default=[name for name, mode, enhanced_realism in MODES])
+    parser.add_argument('--submarines', type=int, default=20, help='submarines sent to the source per field')
+    parser.add_argument('--max-curve-cells', type=int, default=50000,
+                        help='skip the curves modes on pools with more cubes than this')
+    parser.add_argument('--max-object-cells', type=int, default=200000,
+                        help='skip storage="objects" on pools with more cubes than this')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='do not measure peak memory (halves the run time)')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='previous results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='allowed slowdown ratio when comparing')
+    parser.add_argument('--min-seconds', type=float, default=0.01, help='phases faster than this are not compared')
+    args = parser.parse_args(argv)
+
+    modes = [mode for mode in MODES if mode[0] in args.modes]
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        maps = list(args.maps) + [scaled_heightmap(args.maps[-1], scale, directory) for scale in args.scales]
+        for heightmap in maps:
+            print('Benchmarking', heightmap, flush=True)
+            records += benchmark_map(heightmap, args.storages, modes, args.submarines, args.max_curve_cells,
+                                     args.max_object_cells, args.seed, not args.no_memory)
+
+    report = {'meta': {'timestamp': time.time(), 'revision': git_revision(), 'python': platform.python_version(),
+                       'numpy': np.__version__, 'platform': platform.platform()},
+              'results': records}
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=1)
+    print('Results written to', args.output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(records, json.load(file), args.tolerance, args.min_seconds)
+        for regression in regressions:
+            print('Regression:', regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
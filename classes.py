@@ -4,9 +4,26 @@ Date 09.11.21
 """
 
 from copy import deepcopy
-from PIL import Image
-from random import randint
+from random import randint, choice
 from math import sqrt
+import numpy as np
+from terrain import ColumnTerrain, load_heights
+import kernels
+from instrumentation import Instrumentation
+
+# смещения (dx, dy, dz) к 26 соседям кубометра; порядок совпадает с порядком списка CubicMetre.neighbours
+NEIGHBOUR_OFFSETS = [(1, 0, 0), (-1, 0, 0), (0, 0, 1), (0, 0, -1), (0, 1, 0), (0, -1, 0),
+                     (1, 0, -1), (1, 0, 1), (1, 1, 0), (1, -1, 0),
+                     (-1, 0, -1), (-1, 0, 1), (-1, 1, 0), (-1, -1, 0),
+                     (0, 1, -1), (0, 1, 1), (0, -1, 1), (0, -1, -1),
+                     (1, 1, -1), (1, 1, 1), (1, -1, 1), (1, -1, -1),
+                     (-1, 1, -1), (-1, 1, 1), (-1, -1, 1), (-1, -1, -1)]
+
+# смещения к соседям в виде массива для вычислительных ядер (kernels.py)
+_OFFSETS_ARRAY = np.array(NEIGHBOUR_OFFSETS, dtype=np.int64)
+
+# способы распространения звука, поддерживаемые методом Pool.add_sound_source()
+PROPAGATION_MODES = ('curves', 'wavefront', 'eikonal', 'visibility')
 
 
 class CubicMetre:
@@ -48,6 +65,91 @@ class CubicMetre:
         self.neighbours = deepcopy([None] * 26)
 
 
+class CubicMetreView(CubicMetre):
+    """ Легковесное представление кубометра водоема, данные которого хранятся в массивах NumPy (storage='arrays' или
+    storage='columns').
+
+    Не хранит собственного состояния: параметры is_water и sound_intensity читаются и записываются напрямую в данные
+    водоема, а список соседей вычисляется по NEIGHBOUR_OFFSETS при каждом обращении.
+
+    Attributes:
+        x_position (int): координата кубометра по оси X
+        y_position (int): координата кубометра по оси Y
+        z_position (int): координата кубометра по оси Z
+        pool (Pool): водоем, в массивах которого хранятся данные кубометра
+
+    """
+
+    def __init__(self, pool, x_position, y_position, z_position):
+        """ Инициализация представления кубометра
+
+        Args:
+            pool (Pool): водоем с хранением в массивах
+            x_position (int): координата кубометра по оси X
+            y_position (int): координата кубометра по оси Y
+            z_position (int): координата кубометра по оси Z
+
+        """
+
+        self.pool = pool
+        self.x_position = x_position
+        self.y_position = y_position
+        self.z_position = z_position
+
+    @property
+    def is_water(self):
+        return self.pool.is_water(self.x_position, self.y_position, self.z_position)
+
+    @is_water.setter
+    def is_water(self, value):
+        self.pool.set_water(self.x_position, self.y_position, self.z_position, value)
+
+    @property
+    def sound_intensity(self):
+        value = self.pool.intensity[self.z_position, self.y_position, self.x_position]
+        return None if np.isnan(value) else float(value)
+
+    @sound_intensity.setter
+    def sound_intensity(self, value):
+        self.pool.intensity[self.z_position, self.y_position, self.x_position] = np.nan if value is None else value
+
+    @property
+    def neighbours(self):
+        neighbours = []
+        for xyz in self.pool.neighbours(self.x_position, self.y_position, self.z_position):
+            neighbours.append(None if xyz is None else CubicMetreView(self.pool, *xyz))
+        return neighbours
+
+    def __eq__(self, other):
+        return isinstance(other, CubicMetreView) and other.pool is self.pool and \
+            (other.x_position, other.y_position, other.z_position) == (self.x_position, self.y_position, self.z_position)
+
+    def __hash__(self):
+        return hash((id(self.pool), self.x_position, self.y_position, self.z_position))
+
+
+class _FillingAxis:
+    """ Представление pool.filling для водоема с хранением в массивах: поддерживает индексацию вида
+    pool.filling[z][y][x], возвращая экземпляры CubicMetreView(). """
+
+    def __init__(self, pool, prefix=()):
+        self.pool = pool
+        self.prefix = prefix
+
+    def __len__(self):
+        return (self.pool.height, self.pool.width, self.pool.length)[len(self.prefix)]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Pool filling index out of range')
+        if len(self.prefix) < 2:
+            return _FillingAxis(self.pool, self.prefix + (index,))
+        z_position, y_position = self.prefix
+        return CubicMetreView(self.pool, index, y_position, z_position)
+
+
 class Pool:
     """ Класс "водоем". В экземпляре такого класса проводится симуляция водной среды и работы подводного аппарата.
 
@@ -61,97 +163,401 @@ class Pool:
         length (int): длина водоема (значение по X)
         width (int): ширина водоема (значение по Y)
         height (int): высота водоема (значение по Z)
-        filling (list): наполнение водоема - трехмерный массив из экземпляров класса CubicMetre()
+        storage (str): способ хранения кубов - 'objects', 'arrays' или 'columns'
+        terrain (ColumnTerrain): компактное представление ландшафта по столбцам карты высот
+        heightmap (str|None): расположение карты высот, по которой построен водоем; None, если водоем построен без
+            карты высот или его ландшафт изменялся (edit_terrain, set_box, set_heights)
+        filling (list|_FillingAxis): наполнение водоема - трехмерный массив из экземпляров класса CubicMetre()
+        water (numpy.ndarray): маска воды с индексацией [z, y, x] (только для storage='arrays')
+        intensity (numpy.ndarray|LazyIntensity): интенсивности звука float32 с индексацией [z, y, x], NaN - не
+            определена (только для storage='arrays' и storage='columns')
         sound_source (CubicMetre): источник звука - экземпляр класса CubicMetre()
+        navigation (NavigationField|None): предвычисленное поле переходов субмарины (см. precompute_navigation)
+        propagation (tuple|None): (mode, enhanced_realism) последнего вызова add_sound_source; None, если звук еще не
+            распространялся
+        sound_sources (SoundSources|None): несколько источников звука (sources.SoundSources), если они добавлены
+        instrumentation (Instrumentation): сообщения, прогресс, время фаз и счетчики вычислений водоема
+        path_lengths (numpy.ndarray|None): длины путей звука от источника с индексацией [z, y, x] (только для режимов
+            распространения, вычисляющих поле длин целиком; None, если поле загружено из кэша)
         submarine (Submarine): субмарина, подводный аппарат - экземпляр класса Submarine()
 
     Methods:
         add_sound_source: добавляет источник звука в водоем и для каждого куба воды определяет параметр sound_intensity
+        place_sound_source: добавляет источник звука в водоем, не определяя параметр sound_intensity кубов воды
+        source_position: определяет координаты источника звука по правилам add_sound_source
+        sound_source_positions: возвращает координаты всех источников звука водоема
         add_submarine: добавляет субмарину (подводный аппарат) в водоем
+        from_arrays: создает водоем с хранением в массивах напрямую из маски воды
+        neighbours: возвращает координаты 26 соседей кубометра
+        is_water: проверяет, состоит ли кубометр на заданных координатах из воды
+        set_water: делает кубометр водой или ландшафтом
+        edit_terrain: делает кубы водой или ландшафтом и восстанавливает затронутую часть поля звука
+        set_box: делает прямоугольную область водой или ландшафтом
+        set_heights: заменяет участок карты высот
+        water_mask: возвращает маску воды в виде массива NumPy
+        intensity_field: возвращает интенсивности звука в виде массива NumPy
+        set_path_lengths: определяет интенсивности звука в кубах воды по длинам путей от источника
+        set_intensity_field: задает интенсивности звука всего водоема из массива
+        precompute_navigation: предвычисляет поле переходов субмарины
+        sample_intensity: возвращает интерполированные интенсивности звука в произвольных точках водоема
 
     """
 
-    def __init__(self, height, heightmap):
+    def __init__(self, height, heightmap, storage='objects', instrumentation=None):
         """ Инициализация водоема: заполнение кубами, создание соседских связей, добавление ландшафта
 
         Args:
             height (int): высота водоема
-            heightmap (str): расположение карты высот, как файла .jpg
+            heightmap (str): расположение карты высот (.jpg, .png или .npy, см. terrain.load_heights)
+            storage (str): способ хранения кубов. 'objects' - трехмерный массив экземпляров CubicMetre() со связями
+                между соседями; 'arrays' - плотные массивы NumPy (маска воды bool и интенсивности float32), а
+                pool.filling[z][y][x] возвращает легковесные представления CubicMetreView(); 'columns' - как 'arrays',
+                но маска воды не хранится, а вычисляется по карте высот (ColumnTerrain)
+            instrumentation (Instrumentation|None): сбор сообщений, прогресса, времени фаз и счетчиков водоема; если
+                не задан, создается Instrumentation(), выводящий сообщения и прогресс в консоль
 
         Raises:
-            ValueError: если заданная высота бассейна ниже или равняется максимальной высоте ландшафта
+            ValueError: если заданная высота бассейна ниже или равняется максимальной высоте ландшафта или карта высот
+                некорректна
 
         """
 
-        im = Image.open(heightmap, 'r')  # читаю карту высот как изображение
-        assert height > max(round(pixel[0]) for pixel in list(im.getdata())), \
-            ValueError('The height parameter must be greater than ' + str(max(round(pixel[0]) for pixel in list(im.getdata()))))
+        assert storage in ('objects', 'arrays', 'columns'), \
+            ValueError('Parameter "storage" must be "objects", "arrays" or "columns".')
 
-        length, width = im.size  # вытягиваю параметры карты по которым построю бассейн
+        # двухмерный массив значений высоты ландшафта h от положения по XY (индексация [y, x])
+        heights = load_heights(heightmap)
+        assert height > heights.max(), ValueError('The height parameter must be greater than ' + str(heights.max()))
+
+        width, length = heights.shape  # вытягиваю параметры карты по которым построю бассейн
 
         # задаю основные параметры бассейна
         self.height = height  # z
         self.width = width  # y
         self.length = length  # x
+        self.storage = storage
+        self.heightmap = heightmap
+        self.navigation = None
+        self.propagation = None
+        self.sound_sources = None
+        self.instrumentation = Instrumentation() if instrumentation is None else instrumentation
+        self.terrain = ColumnTerrain(heights, height)
+
+        if storage == 'columns':
+            # ландшафт хранится только по столбцам, интенсивности звука - в плотном массиве
+            self.intensity = np.full((height, width, length), np.nan, dtype=np.float32)
+            self.filling = _FillingAxis(self)
+            return
+        if storage == 'arrays':
+            # маска воды и интенсивности звука хранятся в плотных массивах с индексацией [z, y, x];
+            # ландшафтом являются все кубы ниже высоты h в точке (x; y), NaN означает неопределенную интенсивность
+            self.instrumentation.message('Создаю массивы водоема...')
+            with self.instrumentation.phase('terrain_carving'):
+                self.water = np.arange(height)[:, None, None] >= heights[None, :, :]
+            self.intensity = np.full((height, width, length), np.nan, dtype=np.float32)
+            self.filling = _FillingAxis(self)
+            return
 
         # создаю водные кубы в бассейне
-        print('Создаю водные кубы в бассейне:')
-        self.filling = []
-        for z_position in range(height):
-            layer = []
-            for y_position in range(width):
-                layer.append(deepcopy([None] * length))
-            self.filling.append(deepcopy(layer))
-
-        for z_position in range(height):
-            for y_position in range(width):
-                for x_position in range(length):
-                    self.filling[z_position][y_position][x_position] = CubicMetre(x_position, y_position, z_position, True)
-            print('\tLayer', z_position, 'completed.')
+        instrumentation = self.instrumentation
+        instrumentation.message('Создаю водные кубы в бассейне:')
+        with instrumentation.phase('cube_creation'):
+            self.filling = []
+            for z_position in range(height):
+                layer = []
+                for y_position in range(width):
+                    layer.append(deepcopy([None] * length))
+                self.filling.append(deepcopy(layer))
+
+            for z_position in range(height):
+                for y_position in range(width):
+                    for x_position in range(length):
+                        self.filling[z_position][y_position][x_position] = CubicMetre(x_position, y_position, z_position, True)
+                instrumentation.progress('cube_creation', z_position + 1, height)
+        instrumentation.count('cubes', height * width * length)
 
         # создаю связи между соседними кубами
-        print('Создаю связи между соседними кубами:')
-        change = [(1, 0, 0), (-1, 0, 0), (0, 0, 1), (0, 0, -1), (0, 1, 0), (0, -1, 0),
-                  (1, 0, -1), (1, 0, 1), (1, 1, 0), (1, -1, 0),
-                  (-1, 0, -1), (-1, 0, 1), (-1, 1, 0), (-1, -1, 0),
-                  (0, 1, -1), (0, 1, 1), (0, -1, 1), (0, -1, -1),
-                  (1, 1, -1), (1, 1, 1), (1, -1, 1), (1, -1, -1),
-                  (-1, 1, -1), (-1, 1, 1), (-1, -1, 1), (-1, -1, -1)]
-        for z_position in range(self.height):
-            for y_position in range(self.width):
-                for x_position in range(self.length):
-                    for i in range(26):
-                        if x_position + change[i][0] < 0 or x_position + change[i][0] > self.length - 1:
-                            continue
-                        if y_position + change[i][1] < 0 or y_position + change[i][1] > self.width - 1:
-                            continue
-                        if z_position + change[i][2] < 0 or z_position + change[i][2] > self.height - 1:
-                            continue
-                        self.filling[z_position][y_position][x_position].neighbours[i] = \
-                        self.filling[z_position + change[i][2]][y_position + change[i][1]][x_position + change[i][0]]
-            print('\tLayer', z_position, 'completed.')
+        instrumentation.message('Создаю связи между соседними кубами:')
+        with instrumentation.phase('neighbour_linking'):
+            if kernels.ENABLED:
+                # по таблице плоских индексов соседей (массив (N, 26) - только вместе с остальными ядрами)
+                cubes = [cube for layer in self.filling for row in layer for cube in row]
+                table = kernels.neighbour_table(height, width, length, NEIGHBOUR_OFFSETS).tolist()
+                layer_size = width * length
+                for z_position in range(self.height):
+                    for i in range(z_position * layer_size, (z_position + 1) * layer_size):
+                        cubes[i].neighbours = [None if j < 0 else cubes[j] for j in table[i]]
+                    instrumentation.progress('neighbour_linking', z_position + 1, height)
+            else:
+                for z_position in range(self.height):
+                    for y_position in range(self.width):
+                        for x_position in range(self.length):
+                            for i in range(26):
+                                dx, dy, dz = NEIGHBOUR_OFFSETS[i]
+                                if x_position + dx < 0 or x_position + dx > self.length - 1:
+                                    continue
+                                if y_position + dy < 0 or y_position + dy > self.width - 1:
+                                    continue
+                                if z_position + dz < 0 or z_position + dz > self.height - 1:
+                                    continue
+                                self.filling[z_position][y_position][x_position].neighbours[i] = \
+                                    self.filling[z_position + dz][y_position + dy][x_position + dx]
+                    instrumentation.progress('neighbour_linking', z_position + 1, height)
 
         # заменяю водные кубы на кубы ландшафта по карте высот
-        print('Заменяю водные кубы на кубы ландшафта по карте высот...')
-        pixel_values = list(im.getdata())
-        pixel_alpha = []
-        z = []
-
-        for pixel in pixel_values:
-            pixel_alpha.append(round(pixel[0]))
-
-        # создаю двухмерный массив значений высоты ландшафта h от положения по XY
-        for i in range(0, len(pixel_alpha), width):
-            z.append(pixel_alpha[i:i + width])
-
-        for x_position in range(length):
-            for y_position in range(width):
-                # по всей высоте h ландшафта в точке (x; y) водные кубы заменяются на кубы ландшафта
-                h = z[y_position][x_position]
-                for z_position in range(h):
-                    self.filling[z_position][y_position][x_position].is_water = False
-
-    def add_sound_source(self, sound_intensity=1000, x_position=None, y_position=None, z_position=None, enhanced_realism=True):
+        instrumentation.message('Заменяю водные кубы на кубы ландшафта по карте высот...')
+        with instrumentation.phase('terrain_carving'):
+            for x_position in range(length):
+                for y_position in range(width):
+                    # по всей высоте h ландшафта в точке (x; y) водные кубы заменяются на кубы ландшафта
+                    h = heights[y_position][x_position]
+                    for z_position in range(h):
+                        self.filling[z_position][y_position][x_position].is_water = False
+
+    @classmethod
+    def from_arrays(cls, water, intensity=None):
+        """ Создает водоем с хранением в массивах (storage='arrays') напрямую из маски воды, без карты высот
+
+        Args:
+            water (numpy.ndarray): маска воды с индексацией [z, y, x]
+            intensity (numpy.ndarray|None): интенсивности звука float32 с индексацией [z, y, x]; если не заданы,
+                интенсивность во всех кубах не определена
+
+        Returns:
+            Pool: водоем, использующий переданные массивы без копирования; сообщения и прогресс такого водоема не
+            выводятся в консоль (Instrumentation(quiet=True))
+
+        """
+
+        pool = cls.__new__(cls)
+        pool.height, pool.width, pool.length = water.shape
+        pool.storage = 'arrays'
+        pool.heightmap = None
+        pool.navigation = None
+        pool.propagation = None
+        pool.sound_sources = None
+        pool.instrumentation = Instrumentation(quiet=True)
+        pool.terrain = ColumnTerrain.from_mask(water)
+        pool.water = water
+        pool.intensity = np.full(water.shape, np.nan, dtype=np.float32) if intensity is None else intensity
+        pool.filling = _FillingAxis(pool)
+        return pool
+
+    def neighbours(self, x_position, y_position, z_position):
+        """ Возвращает координаты 26 соседей кубометра в порядке NEIGHBOUR_OFFSETS
+
+        Args:
+            x_position (int): координата кубометра по оси X
+            y_position (int): координата кубометра по оси Y
+            z_position (int): координата кубометра по оси Z
+
+        Returns:
+            list: список кортежей (x, y, z); на месте соседей, выходящих за пределы водоема, стоит None
+
+        """
+
+        neighbours = []
+        for dx, dy, dz in NEIGHBOUR_OFFSETS:
+            x, y, z = x_position + dx, y_position + dy, z_position + dz
+            if 0 <= x < self.length and 0 <= y < self.width and 0 <= z < self.height:
+                neighbours.append((x, y, z))
+            else:
+                neighbours.append(None)
+        return neighbours
+
+    def is_water(self, x_position, y_position, z_position):
+        """ Возвращает True, если кубометр на заданных координатах состоит из воды """
+
+        if self.storage == 'arrays':
+            return bool(self.water[z_position, y_position, x_position])
+        if self.storage == 'columns':
+            return self.terrain.is_water(x_position, y_position, z_position)
+        return self.filling[z_position][y_position][x_position].is_water
+
+    def set_water(self, x_position, y_position, z_position, is_water):
+        """ Делает кубометр на заданных координатах водой (is_water=True) или ландшафтом (is_water=False) """
+
+        self.terrain.set_water(x_position, y_position, z_position, is_water)
+        if self.storage == 'arrays':
+            self.water[z_position, y_position, x_position] = is_water
+        elif self.storage == 'objects':
+            self.filling[z_position][y_position][x_position].is_water = is_water
+
+    def edit_terrain(self, cells, is_water):
+        """ Делает кубы водой (is_water=True) или ландшафтом (is_water=False) и восстанавливает поле звука только в
+        затронутой части водоема (см. _repair_field). Куб источника звука не изменяется.
+
+        Args:
+            cells (list): координаты (x, y, z) изменяемых кубов
+            is_water (bool): True - кубы становятся водой, False - ландшафтом
+
+        Returns:
+            int: количество кубов, которые действительно изменились
+
+        """
+
+        source = getattr(self, 'sound_source', None)
+        source = None if source is None else (source.x_position, source.y_position, source.z_position)
+        changed = []
+        seen = set()  # повторы в cells отбрасываются за O(1)
+        for x_position, y_position, z_position in cells:
+            xyz = (int(x_position), int(y_position), int(z_position))
+            if xyz != source and xyz not in seen and self.is_water(*xyz) != is_water:
+                self.set_water(*xyz, is_water)
+                changed.append(xyz)
+            seen.add(xyz)
+
+        if changed:
+            self.heightmap = None  # ландшафт больше не соответствует карте высот (и ключам кэша полей)
+            self._repair_field([] if is_water else changed, changed if is_water else [])
+        return len(changed)
+
+    def set_box(self, x_start, y_start, z_start, x_stop, y_stop, z_stop, is_water):
+        """ Делает водой или ландшафтом все кубы области [x_start; x_stop) x [y_start; y_stop) x [z_start; z_stop)
+        (например, затонувший корабль) и восстанавливает затронутую часть поля звука. Одиночный куб - область 1x1x1.
+
+        Returns:
+            int: количество кубов, которые действительно изменились
+
+        """
+
+        x_start, y_start, z_start = max(x_start, 0), max(y_start, 0), max(z_start, 0)
+        x_stop, y_stop, z_stop = min(x_stop, self.length), min(y_stop, self.width), min(z_stop, self.height)
+        if x_start >= x_stop or y_start >= y_stop or z_start >= z_stop:
+            return 0
+        water = self.terrain.block(x_start, x_stop, y_start, y_stop)[z_start:z_stop]
+        cells = np.argwhere(water != is_water) + (z_start, y_start, x_start)
+        return self.edit_terrain(cells[:, ::-1].tolist(), is_water)
+
+    def set_heights(self, x_start, y_start, heights):
+        """ Заменяет участок карты высот, начинающийся в точке (x_start; y_start), и восстанавливает затронутую часть
+        поля звука. Столбцы участка становятся ландшафтом ниже новой высоты и водой выше нее; куб источника звука не
+        изменяется.
+
+        Args:
+            x_start (int): координата участка по оси X
+            y_start (int): координата участка по оси Y
+            heights (numpy.ndarray): новые высоты ландшафта участка с индексацией [y, x]
+
+        Raises:
+            ValueError: если участок выходит за пределы водоема или новая высота не ниже высоты водоема
+
+        """
+
+        heights = np.asarray(heights, dtype=int)
+        x_stop, y_stop = x_start + heights.shape[1], y_start + heights.shape[0]
+        assert 0 <= x_start and 0 <= y_start and x_stop <= self.length and y_stop <= self.width, \
+            ValueError('The heights patch must lie inside the pool')
+        assert heights.size == 0 or heights.max() < self.height, \
+            ValueError('The heights must be less than ' + str(self.height))
+
+        old = self.terrain.block(x_start, x_stop, y_start, y_stop)
+        new = np.arange(self.height)[:, None, None] >= heights[None, :, :]
+        self.terrain.set_heights(x_start, y_start, heights)
+        source = getattr(self, 'sound_source', None)
+        if source is not None and x_start <= source.x_position < x_stop and y_start <= source.y_position < y_stop:
+            new[source.z_position, source.y_position - y_start, source.x_position - x_start] = False
+            self.terrain.set_water(source.x_position, source.y_position, source.z_position, False)
+
+        cells = np.argwhere(old != new)
+        blocked = [(x + x_start, y + y_start, z) for z, y, x in cells[~new[tuple(cells.T)]].tolist()]
+        opened = [(x + x_start, y + y_start, z) for z, y, x in cells[new[tuple(cells.T)]].tolist()]
+        if self.storage == 'arrays':
+            self.water[:, y_start:y_stop, x_start:x_stop] = new
+        elif self.storage == 'objects':
+            for x_position, y_position, z_position in blocked + opened:
+                self.filling[z_position][y_position][x_position].is_water = bool(new[z_position, y_position - y_start,
+                                                                                     x_position - x_start])
+        if blocked or opened:
+            self.heightmap = None
+            self._repair_field(blocked, opened)
+
+    def _repair_field(self, blocked, opened):
+        """ Восстанавливает поле звука после изменения ландшафта.
+
+        Для режима 'wavefront' длины путей восстанавливаются только там, где они изменились
+        (propagation.repair_path_lengths), и интенсивности пересчитываются только в этих кубах. Ленивое поле
+        (lazy_field.LazyIntensity) забывает запомненные значения, а несколько источников (sources.SoundSources)
+        восстанавливают свои поля. Для остальных режимов поле вычисляется заново. Поле переходов субмарины
+        сбрасывается.
+
+        Args:
+            blocked (list): координаты (x, y, z) кубов, ставших ландшафтом
+            opened (list): координаты (x, y, z) кубов, ставших водой
+
+        """
+
+        self.navigation = None
+        if self.sound_sources is not None:
+            self.sound_sources.repair(blocked, opened)
+            return
+        if self.propagation is None:
+            return
+
+        mode, enhanced_realism = self.propagation
+        instrumentation = self.instrumentation
+        if self.storage != 'objects' and not isinstance(self.intensity, np.ndarray):
+            self.intensity.invalidate()
+            return
+
+        sound_intensity = self.sound_source.sound_intensity
+        if mode != 'wavefront' or self.path_lengths is None:
+            # длины путей неизвестны, если поле вычислено не волновым фронтом или загружено из кэша
+            instrumentation.message('Ландшафт изменен, определяю звуковое давление заново...')
+            self.set_intensity_field(np.full((self.height, self.width, self.length), np.nan, dtype=np.float32))
+            self.sound_source.sound_intensity = sound_intensity
+            self._propagate(mode, enhanced_realism, None)
+            return
+
+        from propagation import repair_path_lengths
+
+        ss_xyz = (self.sound_source.x_position, self.sound_source.y_position, self.sound_source.z_position)
+        with instrumentation.phase('field_repair'):
+            water = self.water_mask()
+            path_lengths, recomputed = repair_path_lengths(water, self.path_lengths, ss_xyz, blocked, opened)
+            changed = np.argwhere(path_lengths != self.path_lengths)
+            self.path_lengths = path_lengths
+            z, y, x = changed.T
+            lengths = path_lengths[z, y, x]
+            with np.errstate(divide='ignore'):
+                values = np.where(water[z, y, x] & np.isfinite(lengths) & (lengths > 0), sound_intensity / lengths ** 2,
+                                  np.nan)
+            if self.storage != 'objects':
+                self.intensity[z, y, x] = values
+            else:
+                for (z_position, y_position, x_position), value in zip(changed.tolist(), values.tolist()):
+                    self.filling[z_position][y_position][x_position].sound_intensity = None if value != value else value
+        instrumentation.count('recomputed_cubes', recomputed)
+
+    def water_mask(self):
+        """ Возвращает маску воды водоема - булев массив NumPy с индексацией [z, y, x].
+
+        Для storage='arrays' возвращается сам массив водоема, для остальных способов хранения - собранная копия.
+
+        """
+
+        if self.storage == 'arrays':
+            return self.water
+        if self.storage == 'columns':
+            return self.terrain.to_mask()
+        return np.array([[[cube.is_water for cube in row] for row in layer] for layer in self.filling], dtype=bool)
+
+    def intensity_field(self):
+        """ Возвращает интенсивности звука водоема - массив float32 с индексацией [z, y, x], где NaN означает, что
+        интенсивность в кубометре не определена.
+
+        Для storage='arrays' и storage='columns' возвращается сам массив водоема, для storage='objects' - собранная
+        копия.
+
+        """
+
+        if self.storage != 'objects':
+            return self.intensity
+        return np.array([[[np.nan if cube.sound_intensity is None else cube.sound_intensity for cube in row]
+                          for row in layer] for layer in self.filling], dtype=np.float32)
+
+    def add_sound_source(self, sound_intensity=1000, x_position=None, y_position=None, z_position=None, enhanced_realism=True,
+                         mode='curves', workers=None, cache=None, lazy_capacity=None):
         """ Метод добавляет источник звука в водоем и для каждого куба воды определяет параметр sound_intensity
         (силу звука в нем)
 
@@ -162,78 +568,315 @@ class Pool:
             z_position (int|None): координата источника звука по оси Z
             enhanced_realism (bool): если True - более реалистичное огибание препятствий звуковыми волнами, но огромная
                 вычислительная сложность. В ином случае - низкореалистичное распространение кривых, но очень низкая
-                вычислительная сложность
+                вычислительная сложность. Используется только в режиме mode='curves'
+            mode (str): способ распространения звука. 'curves' - для каждого куба воды отдельно строится кратчайшая
+                кривая функцией shortest_curve(); 'wavefront' - длины путей от источника до всех кубов воды
+                определяются за один проход волнового фронта (алгоритм Дейкстры по 26 соседям с евклидовыми весами);
+                'eikonal' - гладкое геодезическое расстояние вокруг препятствий, решение уравнения эйконала методом
+                быстрого продвижения (fast marching); 'visibility' - пути, огибающие ландшафт по прямым отрезкам между
+                точками излома (Lazy Theta* с проверкой прямой видимости по маске воды), ближе всего к истинной
+                геодезической
+            workers (int|None): количество процессов для параллельного построения кривых в режиме mode='curves';
+                None или 1 - кривые строятся последовательно в текущем процессе
+            cache (FieldCache|None): дисковый кэш полей интенсивности (field_cache.FieldCache); если поле для той же
+                карты высот, высоты водоема, источника звука и режима уже вычислялось, оно загружается из кэша
+            lazy_capacity (int|None): если задано, интенсивности не вычисляются заранее: pool.intensity заменяется
+                полем lazy_field.LazyIntensity, которое вычисляет интенсивность куба при первом обращении и запоминает
+                не больше lazy_capacity кубов. Только для mode='curves' и storage='arrays' или 'columns'; параметры
+                workers и cache в этом случае не используются
+
+        Raises:
+            ValueError: если задан неизвестный режим распространения звука или ленивое поле недоступно
 
         """
 
-        print('Добавляю источник звука...')
-        # задаю координаты источника звука (если параметры не заданы, координаты определяются случайным образом)
-        if x_position is not None and 0 <= x_position < self.length:  # для иксов
-            x_position = x_position
-        else:
-            x_position = randint(0, self.length - 1)
+        assert mode in PROPAGATION_MODES, ValueError('Parameter "mode" must be one of ' + str(PROPAGATION_MODES))
+        assert self.sound_sources is None, ValueError('The pool already has several sound sources (SoundSources)')
+        assert lazy_capacity is None or (mode == 'curves' and self.storage != 'objects'), \
+            ValueError('Lazy intensity requires mode "curves" and storage "arrays" or "columns"')
+
+        self.instrumentation.message('Добавляю источник звука...')
+        x_position, y_position, z_position = self.place_sound_source(sound_intensity, x_position, y_position,
+                                                                     z_position)
+        self.propagation = (mode, enhanced_realism)
+
+        if lazy_capacity is not None:
+            from lazy_field import LazyIntensity
+
+            self.intensity = LazyIntensity(self, enhanced_realism, lazy_capacity)
+            self.intensity[z_position, y_position, x_position] = sound_intensity
+            return
+
+        # если поле уже вычислялось для той же карты высот и того же источника, загружаю его из кэша
+        cache_key = None
+        if cache is not None and self.heightmap is not None:
+            cache_key = cache.key(self.heightmap, self.height, (x_position, y_position, z_position), sound_intensity, mode,
+                                  enhanced_realism)
+            field = cache.load(cache_key)
+            if field is not None:
+                self.instrumentation.message('Загружаю звуковое давление из кэша...')
+                self.instrumentation.count('cache_hits')
+                self.set_intensity_field(field)
+                return
+            self.instrumentation.count('cache_misses')
+
+        self._propagate(mode, enhanced_realism, workers)
+
+        if cache_key is not None:
+            cache.store(cache_key, self.intensity_field())
+
+    def place_sound_source(self, sound_intensity=1000, x_position=None, y_position=None, z_position=None):
+        """ Добавляет источник звука в водоем, не определяя звуковое давление в кубах воды. Используется методом
+        add_sound_source() и для фонового вычисления поля (progressive.ProgressiveField).
 
-        if y_position is not None and 0 <= y_position < self.width:  # для игреков
-            y_position = y_position
-        else:
-            y_position = randint(0, self.width - 1)
+        Args:
+            sound_intensity (float|int): сила (интенсивность) звука издаваемого источником
+            x_position (int|None): координата источника звука по оси X
+            y_position (int|None): координата источника звука по оси Y
+            z_position (int|None): координата источника звука по оси Z
+
+        Returns:
+            tuple: координаты (x, y, z) добавленного источника звука
 
-        # определяю минимально возможное положение по вертикальной оси
-        z_min = 1
-        while self.filling[z_min][y_position][x_position].is_water is False:
-            z_min += 1
+        """
+
+        self.navigation = None  # поле переходов построено по прежним интенсивностям
+        self.path_lengths = None
+        x_position, y_position, z_position = self.source_position(x_position, y_position, z_position)
+
+        # добавляю в водоем источник звука, заменяя им куб воды
+        self.filling[z_position][y_position][x_position].sound_intensity = sound_intensity
+        self.set_water(x_position, y_position, z_position, False)
+        self.sound_source = self.filling[z_position][y_position][x_position]
+        return x_position, y_position, z_position
+
+    def source_position(self, x_position=None, y_position=None, z_position=None):
+        """ Определяет координаты источника звука по правилам add_sound_source(): незаданные или выходящие за
+        пределы водоема координаты X и Y выбираются случайно, а источник по умолчанию лежит на дне
+
+        Returns:
+            tuple: координаты (x, y, z) источника звука
+
+        Raises:
+            ValueError: если в заданном столбце (x; y) нет воды (например, он заполнен ландшафтом через set_box)
+
+        """
+
+        # задаю координаты источника звука (если параметры не заданы, координаты определяются случайным образом) и
+        # минимально возможное положение по вертикальной оси
+        x_position, y_position, z_min = _water_column(self, x_position, y_position)
         # "ложу" источник звука на дно, либо на заданную высоту
         if z_position is not None and z_min <= z_position < self.height:
             z_position = z_position
         else:
             z_position = z_min
-
-        # добавляю в водоем источник звука, заменяя им куб воды
-        self.filling[z_position][y_position][x_position].sound_intensity = sound_intensity
-        self.filling[z_position][y_position][x_position].is_water = False
-        self.sound_source = self.filling[z_position][y_position][x_position]
+        return x_position, y_position, z_position
+
+    def _propagate(self, mode, enhanced_realism, workers):
+        """ Определяет параметр sound_intensity для каждого куба воды выбранным способом распространения звука.
+        Параметры описаны в add_sound_source(). """
+
+        x_position = self.sound_source.x_position
+        y_position = self.sound_source.y_position
+        z_position = self.sound_source.z_position
+        instrumentation = self.instrumentation
+
+        if mode == 'wavefront':
+            from propagation import wavefront_path_lengths
+
+            instrumentation.message('Определяю звуковое давление волновым фронтом...')
+            with instrumentation.phase('intensity_computation'):
+                self.set_path_lengths(wavefront_path_lengths(self.water_mask(), (x_position, y_position, z_position)))
+            return
+        if mode == 'eikonal':
+            from propagation import eikonal_path_lengths
+
+            instrumentation.message('Определяю звуковое давление решением уравнения эйконала...')
+            with instrumentation.phase('intensity_computation'):
+                self.set_path_lengths(eikonal_path_lengths(self.water_mask(), (x_position, y_position, z_position)))
+            return
+        if mode == 'visibility':
+            from propagation import visibility_path_lengths
+
+            instrumentation.message('Определяю звуковое давление по путям прямой видимости...')
+            with instrumentation.phase('intensity_computation'):
+                self.set_path_lengths(visibility_path_lengths(self.water_mask(), (x_position, y_position, z_position)))
+            return
 
         # сканирую весь бассейн и определяю размеры паралелепипеда допущений
-        parallelepiped_length = self.length  # x
-        parallelepiped_width = self.width  # y
-
-        for z_position in range(self.height):
-            # вдоль иксов
-            for y_position in range(self.width):
-                x_count = 0
-                for x_position in range(self.length):
-                    if self.filling[z_position][y_position][x_position].is_water is False:
-                        x_count += 1
-                    elif x_count < parallelepiped_length and x_count != 0:
-                        parallelepiped_length = x_count
-                        x_count = 0
-                if x_count < parallelepiped_length and x_count != 0:
-                    parallelepiped_length = x_count
+        with instrumentation.phase('parallelepiped_scan'):
+            parallelepiped_length, parallelepiped_width = self.terrain.parallelepiped_dimensions()
 
-            # вдоль игреков
-            for x_position in range(self.width):
-                y_count = 0
-                for y_position in range(self.length):
-                    if self.filling[z_position][y_position][x_position].is_water is False:
-                        y_count += 1
-                    elif y_count < parallelepiped_width and y_count != 0:
-                        parallelepiped_width = y_count
-                        y_count = 0
-                if y_count < parallelepiped_width and y_count != 0:
-                    parallelepiped_width = y_count
+        if workers is not None and workers > 1:
+            from propagation import parallel_curve_path_lengths
+
+            instrumentation.message('Определяю звуковое давление для каждого кубометра в', workers, 'процессах...')
+            with instrumentation.phase('intensity_computation'):
+                self.set_path_lengths(parallel_curve_path_lengths(self.water_mask(), (x_position, y_position, z_position),
+                                                                  (parallelepiped_length, parallelepiped_width),
+                                                                  enhanced_realism, workers, instrumentation))
+            return
 
         # определяю звуковое давление для каждого кубометра
-        print('Определяю звуковое давление для каждого кубометра...')
-        for z_position in range(self.height):
-            for y_position in range(self.width):
-                for x_position in range(self.length):
-                    if self.filling[z_position][y_position][x_position].is_water is True:
-                        curve_length = shortest_curve(self, (self.sound_source.x_position, self.sound_source.y_position, self.sound_source.z_position),
-                                                      (x_position, y_position, z_position),
-                                                      (parallelepiped_length, parallelepiped_width),
-                                                      enhanced_realism)
-                        self.filling[z_position][y_position][x_position].sound_intensity = self.sound_source.sound_intensity / (curve_length ** 2)
-            print('\tLayer', z_position, 'completed.')
+        instrumentation.message('Определяю звуковое давление для каждого кубометра...')
+        if kernels.ENABLED and self.storage != 'objects':
+            self._propagate_curves_kernel((parallelepiped_length, parallelepiped_width), enhanced_realism)
+            return
+        with instrumentation.phase('intensity_computation'):
+            for z_position in range(self.height):
+                for y_position in range(self.width):
+                    for x_position in range(self.length):
+                        if self.is_water(x_position, y_position, z_position) is True:
+                            curve_length = shortest_curve(self, (self.sound_source.x_position, self.sound_source.y_position, self.sound_source.z_position),
+                                                          (x_position, y_position, z_position),
+                                                          (parallelepiped_length, parallelepiped_width),
+                                                          enhanced_realism)
+                            self.filling[z_position][y_position][x_position].sound_intensity = self.sound_source.sound_intensity / (curve_length ** 2)
+                instrumentation.progress('intensity_computation', z_position + 1, self.height)
+
+    def _propagate_curves_kernel(self, prl_lw, enhanced_realism):
+        """ Режим 'curves' для водоема с хранением в массивах: кривые всех кубов воды слоя строятся ядром
+        kernels.curve_layer_kernel. Результат совпадает с последовательным построением кривых shortest_curve(). """
+
+        instrumentation = self.instrumentation
+        ss_xyz = (self.sound_source.x_position, self.sound_source.y_position, self.sound_source.z_position)
+        water = self.water_mask()
+        with instrumentation.phase('intensity_computation'):
+            for z_position in range(self.height):
+                lengths, steps = kernels.curve_layer_kernel(water, z_position, *ss_xyz, *prl_lw, enhanced_realism)
+                reached = np.isfinite(lengths)
+                self.intensity[z_position][reached] = self.sound_source.sound_intensity / lengths[reached] ** 2
+                instrumentation.count('shortest_curve_calls', int(reached.sum()))
+                instrumentation.count('shortest_curve_steps', int(steps))
+                instrumentation.progress('intensity_computation', z_position + 1, self.height)
+
+    def set_intensity_field(self, field):
+        """ Задает интенсивности звука всего водоема из массива
+
+        Args:
+            field (numpy.ndarray): интенсивности звука float32 с индексацией [z, y, x], NaN - не определена. Для
+                storage='arrays' и storage='columns' массив используется без копирования (в том числе отображенный в
+                память numpy.memmap)
+
+        """
+
+        if self.storage != 'objects':
+            self.intensity = field
+            return
+        for z_position, layer in enumerate(np.asarray(field).tolist()):
+            for y_position, row in enumerate(layer):
+                for x_position, value in enumerate(row):
+                    self.filling[z_position][y_position][x_position].sound_intensity = None if value != value else value
+
+    def set_path_lengths(self, path_lengths):
+        """ Определяет параметр sound_intensity для каждого куба воды по длинам путей звука от источника
+
+        Args:
+            path_lengths (numpy.ndarray): длины путей от источника звука с индексацией [z, y, x]; inf - куб недостижим
+
+        """
+
+        path_lengths = np.asarray(path_lengths)
+        self.path_lengths = path_lengths
+        reached = self.water_mask() & np.isfinite(path_lengths) & (path_lengths > 0)
+        intensity = self.sound_source.sound_intensity / path_lengths[reached] ** 2
+
+        if self.storage != 'objects':
+            self.intensity[reached] = intensity
+            return
+        for (z_position, y_position, x_position), value in zip(np.argwhere(reached).tolist(), intensity.tolist()):
+            self.filling[z_position][y_position][x_position].sound_intensity = value
+
+    def sample_intensity(self, points, gradient=False):
+        """ Возвращает интенсивности звука в произвольных точках водоема трилинейной интерполяцией по кубам воды.
+
+        Значение кубометра (x, y, z) относится к точке с координатами (x, y, z). В интерполяции участвуют только
+        кубы с определенной интенсивностью, а их веса нормируются; если ни у одного из восьми ближайших кубов
+        интенсивность не определена, или точка лежит вне водоема, возвращается NaN. Все точки обрабатываются
+        средствами NumPy без цикла по точкам.
+
+        Args:
+            points (numpy.ndarray): координаты точек, массив (N, 3) в порядке (x, y, z)
+            gradient (bool): если True, дополнительно возвращаются градиенты интерполированного поля
+
+        Returns:
+            numpy.ndarray|tuple: интенсивности (N,); при gradient=True - кортеж (интенсивности, градиенты (N, 3) в
+            порядке (d/dx, d/dy, d/dz))
+
+        """
+
+        field = np.asarray(self.intensity_field(), dtype=np.float64)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+
+        corners = []
+        inside = np.ones(len(points), dtype=bool)
+        for axis, size in enumerate((self.length, self.width, self.height)):
+            coordinate = points[:, axis]
+            inside &= (coordinate >= 0) & (coordinate <= size - 1)
+            low = np.clip(np.floor(coordinate), 0, max(size - 2, 0)).astype(np.int64)
+            high = np.minimum(low + 1, size - 1)
+            fraction = np.clip(coordinate - low, 0, 1)
+            # (индекс, вес, производная веса по координате) для нижнего и верхнего соседа
+            corners.append(((low, 1 - fraction, -1.0), (high, fraction, 1.0)))
+
+        total = np.zeros(len(points))
+        weights = np.zeros(len(points))
+        if gradient:
+            total_derivative = np.zeros((len(points), 3))
+            weights_derivative = np.zeros((len(points), 3))
+        for x_corner in corners[0]:
+            for y_corner in corners[1]:
+                for z_corner in corners[2]:
+                    values = field[z_corner[0], y_corner[0], x_corner[0]]
+                    defined = ~np.isnan(values)
+                    values = np.where(defined, values, 0)
+                    weight = np.where(defined, x_corner[1] * y_corner[1] * z_corner[1], 0)
+                    total += weight * values
+                    weights += weight
+                    if gradient:
+                        derivatives = np.where(defined[:, None], np.stack([x_corner[2] * y_corner[1] * z_corner[1],
+                                                                           x_corner[1] * y_corner[2] * z_corner[1],
+                                                                           x_corner[1] * y_corner[1] * z_corner[2]],
+                                                                          axis=1), 0)
+                        total_derivative += derivatives * values[:, None]
+                        weights_derivative += derivatives
+
+        valid = inside & (weights > 0)
+        safe_weights = np.where(valid, weights, 1)
+        intensity = np.where(valid, total / safe_weights, np.nan)
+        if not gradient:
+            return intensity
+        gradients = (total_derivative * safe_weights[:, None] - total[:, None] * weights_derivative) / \
+            safe_weights[:, None] ** 2
+        return intensity, np.where(valid[:, None], gradients, np.nan)
+
+    def sound_source_positions(self):
+        """ Возвращает координаты (x, y, z) всех источников звука водоема: источников sources.SoundSources, если они
+        добавлены, иначе источника add_sound_source (place_sound_source); пустой список, если источников нет """
+
+        if self.sound_sources is not None:
+            return list(self.sound_sources.positions.values())
+        source = getattr(self, 'sound_source', None)
+        if source is None:
+            return []
+        return [(source.x_position, source.y_position, source.z_position)]
+
+    def precompute_navigation(self):
+        """ Предвычисляет поле переходов субмарины (navigation.NavigationField) по текущим интенсивностям звука.
+
+        После этого Submarine.move перемещается по готовому полю, не сравнивая соседей на каждом шаге. Поле
+        сбрасывается при следующем вызове add_sound_source.
+
+        Returns:
+            NavigationField: поле переходов, также сохраняемое в атрибуте navigation
+
+        """
+
+        from navigation import NavigationField
+
+        with self.instrumentation.phase('navigation'):
+            self.navigation = NavigationField(self)
+        return self.navigation
 
     def add_submarine(self, x_position=None, y_position=None, z_position=None):
         """ Метод, добавляющий субмарину в водоем
@@ -264,6 +907,7 @@ class Submarine:
     Methods:
         move: перемещает субмарину по координатам в сторону источника звука и по окончании возвращает список координат
         всех посещенных кубометров
+        search: ищет источник звука выбранной стратегией поиска и возвращает путь и метрики поиска
 
     """
 
@@ -278,21 +922,9 @@ class Submarine:
 
         """
 
-        # задаю координаты субмарины (если параметры не заданы, координаты определяются случайным образом)
-        if x_position is not None and 0 <= x_position < pool.length:  # для иксов
-            x_position = x_position
-        else:
-            x_position = randint(0, pool.length - 1)
-
-        if y_position is not None and 0 <= y_position < pool.width:  # для игреков
-            y_position = y_position
-        else:
-            y_position = randint(0, pool.width - 1)
-
-        # определяю минимально возможное положение по вертикальной оси
-        z_min = 1
-        while pool.filling[z_min][y_position][x_position].is_water is False:
-            z_min += 1
+        # задаю координаты субмарины (если параметры не заданы, координаты определяются случайным образом) и
+        # минимально возможное положение по вертикальной оси
+        x_position, y_position, z_min = _water_column(pool, x_position, y_position)
         # размещаю субмарину случайным образом в интервале [z_min; pool.height), либо на заданную высоту
         if z_position is not None and z_min <= z_position < pool.height:
             z_position = z_position
@@ -308,6 +940,9 @@ class Submarine:
         """ Метод перемещает субмарину по координатам в сторону источника звука и по окончании возвращает список
         координат всех посещенных кубометров.
 
+        Если для водоема предвычислено поле переходов (Pool.precompute_navigation), путь восстанавливается по нему;
+        в этом случае субмарина останавливается в локальном максимуме, а не перемещается между соседями бесконечно.
+
         Args:
             metres (int|bool): метры для преодоления. Если True, то плывем до источника звука
 
@@ -321,6 +956,20 @@ class Submarine:
 
         assert (metres >= 1) or (metres is True), ValueError('Parameter "metres" must be greater integer than 0 or boolean True.')
 
+        # если для водоема предвычислено поле переходов, путь восстанавливается переходами по нему
+        if self.pool.navigation is not None:
+            positions, xyz_to_move = self.pool.navigation.walk(self.x_position, self.y_position, self.z_position, metres)
+            self.x_position, self.y_position, self.z_position = xyz_to_move
+            self.pool.instrumentation.count('submarine_steps', len(positions))
+            return positions
+
+        # для поля в плотном массиве перемещение выполняет ядро kernels.climb_kernel
+        if kernels.ENABLED and isinstance(getattr(self.pool, 'intensity', None), np.ndarray):
+            return self._move_kernel(metres)
+        # без ядер поле в плотном массиве читается напрямую, а не через 26 объектов CubicMetreView на каждый шаг
+        if self.pool.storage != 'objects' and isinstance(self.pool.intensity, np.ndarray):
+            return self._move_array(metres)
+
         xyz_to_move = (self.x_position, self.y_position, self.z_position)  # стартовая точка
 
         positions = []  # все пройденные точки, начиная от стартовой
@@ -339,6 +988,7 @@ class Submarine:
             xyz_to_move = comparison[-1][1]  # выбираю соседа с самой большой силой звука
             # если в соседе с самой большой силой звука сила звука такая же как в текущем кубометре, значит дошли до источника звука
             if comparison[-1][0] == self.pool.filling[self.z_position][self.y_position][self.x_position].sound_intensity:
+                self.pool.instrumentation.count('submarine_steps', len(positions))
                 return positions
             if metres is not True:
                 metres -= 1
@@ -348,8 +998,115 @@ class Submarine:
             self.y_position = xyz_to_move[1]
             self.z_position = xyz_to_move[2]
 
+        self.pool.instrumentation.count('submarine_steps', len(positions))
         return positions
 
+    def search(self, strategy='greedy', metres=True):
+        """ Перемещает субмарину к источнику звука выбранной стратегией поиска (strategies.py) и возвращает путь и
+        метрики поиска: количество шагов, обращений к интенсивностям звука и время.
+
+        Args:
+            strategy (str|Strategy): 'greedy' - жадный подъем, как move(); 'momentum' - следование градиенту с
+                инерцией; 'tabu' - табу-поиск, проходящий плато; 'astar' - планировщик A* с эвристикой по полю
+                интенсивности; либо экземпляр стратегии с заданными параметрами
+            metres (int|bool): наибольшее количество перемещений. Если True, то плывем до остановки
+
+        Returns:
+            dict: путь, состояние и метрики поиска (см. strategies.Strategy.search)
+
+        """
+
+        from strategies import make_strategy
+
+        result = make_strategy(strategy).search(self.pool, (self.x_position, self.y_position, self.z_position), metres)
+        self.x_position, self.y_position, self.z_position = result['end']
+        return result
+
+    def _move_array(self, metres):
+        """ Submarine.move по плотному полю интенсивности без ядер: на каждом шаге читается блок 3x3x3 вокруг
+        субмарины. Результат совпадает с перемещением по соседям. """
+
+        pool = self.pool
+        intensity = pool.intensity
+        x_position, y_position, z_position = self.x_position, self.y_position, self.z_position
+
+        positions = []  # все пройденные точки, начиная от стартовой
+        while metres:
+            positions.append((x_position, y_position, z_position))
+            x_start, y_start, z_start = max(x_position - 1, 0), max(y_position - 1, 0), max(z_position - 1, 0)
+            block = intensity[z_start:z_position + 2, y_start:y_position + 2, x_start:x_position + 2].tolist()
+
+            # сосед с самой большой силой звука; при равенстве - последний в порядке NEIGHBOUR_OFFSETS, как после
+            # устойчивой сортировки по возрастанию в перемещении по соседям
+            best_value = None
+            for dx, dy, dz in NEIGHBOUR_OFFSETS:
+                x, y, z = x_position + dx, y_position + dy, z_position + dz
+                if 0 <= x < pool.length and 0 <= y < pool.width and 0 <= z < pool.height:
+                    value = block[z - z_start][y - y_start][x - x_start]
+                    if value == value and (best_value is None or value >= best_value):
+                        best_value = value
+                        xyz_to_move = (x, y, z)
+            if best_value is None:
+                self.x_position, self.y_position, self.z_position = x_position, y_position, z_position
+                # как и перемещение по соседям, субмарина не может выбрать соседа без определенной силы звука
+                raise IndexError('No neighbour of the submarine has a defined sound intensity')
+
+            # если в соседе с самой большой силой звука сила звука такая же как в текущем кубометре, значит дошли до
+            # источника звука
+            if best_value == block[z_position - z_start][y_position - y_start][x_position - x_start]:
+                break
+            if metres is not True:
+                metres -= 1
+            x_position, y_position, z_position = xyz_to_move
+
+        self.x_position, self.y_position, self.z_position = x_position, y_position, z_position
+        pool.instrumentation.count('submarine_steps', len(positions))
+        return positions
+
+    def _move_kernel(self, metres):
+        """ Submarine.move по плотному полю интенсивности ядром kernels.climb_kernel; результат совпадает с
+        перемещением по соседям. """
+
+        positions, x_position, y_position, z_position, found = kernels.climb_kernel(
+            self.pool.intensity, self.x_position, self.y_position, self.z_position, -1 if metres is True else metres,
+            _OFFSETS_ARRAY)
+        self.x_position, self.y_position, self.z_position = int(x_position), int(y_position), int(z_position)
+        if not found:
+            # как и перемещение по соседям, субмарина не может выбрать соседа без определенной силы звука
+            raise IndexError('No neighbour of the submarine has a defined sound intensity')
+        positions = [tuple(xyz) for xyz in positions.tolist()]
+        self.pool.instrumentation.count('submarine_steps', len(positions))
+        return positions
+
+
+def _water_column(pool, x_position, y_position):
+    """ Возвращает (x, y, дно) столбца водоема, в котором есть вода. Незаданные или выходящие за пределы водоема
+    координаты выбираются случайно; если в выбранном столбце воды нет (он заполнен ландшафтом, например через
+    Pool.set_box), выбирается случайный столбец с водой среди допустимых.
+
+    Raises:
+        ValueError: если в заданном столбце или во всех допустимых столбцах нет воды
+
+    """
+
+    fixed_x = x_position is not None and 0 <= x_position < pool.length
+    fixed_y = y_position is not None and 0 <= y_position < pool.width
+    if not fixed_x:
+        x_position = randint(0, pool.length - 1)
+    if not fixed_y:
+        y_position = randint(0, pool.width - 1)
+
+    z_min = pool.terrain.seabed(x_position, y_position)
+    if z_min is None and not (fixed_x and fixed_y):
+        columns = [(x, y) for x in ([x_position] if fixed_x else range(pool.length))
+                   for y in ([y_position] if fixed_y else range(pool.width)) if pool.terrain.seabed(x, y) is not None]
+        if columns:
+            x_position, y_position = choice(columns)
+            z_min = pool.terrain.seabed(x_position, y_position)
+    assert z_min is not None, \
+        ValueError('There is no water in column (' + str(x_position) + ', ' + str(y_position) + ')')
+    return x_position, y_position, z_min
+
 
 def shortest_curve(pool: Pool, ss_xyz, cube_xyz, prl_lw, enhanced_realism=True):
     """ Функция возвращает длину кратчайшей кривой, по которой должен пройти звук, чтобы достиь определенного кубометра.
@@ -373,10 +1130,17 @@ def shortest_curve(pool: Pool, ss_xyz, cube_xyz, prl_lw, enhanced_realism=True):
     # проверяю является ли выбранный кубометр водой
     assert pool.filling[cube_xyz[2]][cube_xyz[1]][cube_xyz[0]].is_water is True, \
         ValueError('To determine the intensity of the sound, the cube must be composed of water')
+    pool.instrumentation.count('shortest_curve_calls')
     # если кубометр уже имеет заданную интенсивность звука, функция вернет текущее значение интенсивности звука
     if pool.filling[cube_xyz[2]][cube_xyz[1]][cube_xyz[0]].sound_intensity is not None:
         return pool.filling[cube_xyz[2]][cube_xyz[1]][cube_xyz[0]].sound_intensity
 
+    # для маски воды в плотном массиве кривую строит ядро kernels.curve_kernel
+    if kernels.ENABLED and pool.storage == 'arrays':
+        curve_len, steps = kernels.curve_kernel(pool.water, *ss_xyz, *cube_xyz, *prl_lw, enhanced_realism is True)
+        pool.instrumentation.count('shortest_curve_steps', steps)
+        return curve_len
+
     # определяю значения для первой проверки в цикле
     x_dto = abs(cube_xyz[0] - ss_xyz[0])  # distance to overcome
     y_dto = abs(cube_xyz[1] - ss_xyz[1])
@@ -389,9 +1153,11 @@ def shortest_curve(pool: Pool, ss_xyz, cube_xyz, prl_lw, enhanced_realism=True):
     z_poss.sort(key=lambda x: x[0])
 
     curve_len = 0
+    steps = 0  # количество опорных точек кривой, для счетчика shortest_curve_steps
 
     while x_dto + y_dto + z_dto != 0:
         np_xyz = ss_xyz  # new point XYZ
+        steps += 1
 
         if enhanced_realism is True:
             xyz_poss = []
@@ -421,7 +1187,7 @@ def shortest_curve(pool: Pool, ss_xyz, cube_xyz, prl_lw, enhanced_realism=True):
                         x_pos = xyz_poss[i][2][0]
                         y_pos = xyz_poss[i][2][1]
                         z_pos = xyz_poss[i][2][2]
-                        if pool.filling[z_pos][y_pos][x_pos].is_water is True:
+                        if pool.is_water(x_pos, y_pos, z_pos) is True:
                             # если по координатам попадаю в водный куб, то выбираю его как новый опорный т.к. он самый оптимальный
                             np_xyz = (x_pos, y_pos, z_pos)
                             break
@@ -451,7 +1217,7 @@ def shortest_curve(pool: Pool, ss_xyz, cube_xyz, prl_lw, enhanced_realism=True):
                 for j in range(len(z_poss)):
                     # выбираю лучшую координату по Z
                     z_pos = z_poss[j][1]
-                    if pool.filling[z_pos][y_pos][x_pos].is_water is True:
+                    if pool.is_water(x_pos, y_pos, z_pos) is True:
                         # если по координатам попадаю в водный куб, то выбираю его как новый опорный т.к. он самый оптимальный
                         np_xyz = (x_pos, y_pos, z_pos)
                         break
@@ -467,4 +1233,53 @@ def shortest_curve(pool: Pool, ss_xyz, cube_xyz, prl_lw, enhanced_realism=True):
         y_dto = abs(cube_xyz[1] - ss_xyz[1])
         z_dto = abs(cube_xyz[2] - ss_xyz[2])
 
+    pool.instrumentation.count('shortest_curve_steps', steps)
     return curve_len
+
+
+def parallelepiped_dimensions(water):
+    """ Функция сканирует весь водоем и определяет размеры параллелепипеда допущений - наименьшие длины отрезков
+    ландшафта вдоль осей X и Y.
+
+    Args:
+        water (numpy.ndarray): маска воды водоема с индексацией [z, y, x]
+
+    Returns:
+        tuple: (parallelepiped_length, parallelepiped_width) - размеры параллелепипеда по осям X и Y
+
+    """
+
+    if kernels.ENABLED:
+        return tuple(int(size) for size in kernels.parallelepiped_kernel(np.asarray(water, dtype=bool)))
+
+    height, width, length = water.shape
+    parallelepiped_length = length  # x
+    parallelepiped_width = width  # y
+
+    for z_position in range(height):
+        layer = water[z_position]
+        # вдоль иксов
+        for row in layer.tolist():
+            x_count = 0
+            for is_water in row:
+                if is_water is False:
+                    x_count += 1
+                elif x_count < parallelepiped_length and x_count != 0:
+                    parallelepiped_length = x_count
+                    x_count = 0
+            if x_count < parallelepiped_length and x_count != 0:
+                parallelepiped_length = x_count
+
+        # вдоль игреков
+        for column in layer.T.tolist():
+            y_count = 0
+            for is_water in column:
+                if is_water is False:
+                    y_count += 1
+                elif y_count < parallelepiped_width and y_count != 0:
+                    parallelepiped_width = y_count
+                    y_count = 0
+            if y_count < parallelepiped_width and y_count != 0:
+                parallelepiped_width = y_count
+
+    return parallelepiped_length, parallelepiped_width
@@ -0,0 +1,155 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+import os
+from hashlib import sha256
+import numpy as np
+
+# версия формата кэша; меняется, если меняется способ вычисления полей, чтобы не загружать устаревшие поля
+CACHE_FORMAT = 1
+
+# хэши содержимого карт высот по ключу (путь, время изменения, размер), чтобы не перечитывать неизменные файлы
+_content_hashes = {}
+
+
+def file_hash(path):
+    """ Возвращает SHA-256 содержимого файла; результат запоминается, пока файл не изменился. """
+
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if memo_key not in _content_hashes:
+        digest = sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        _content_hashes[memo_key] = digest.hexdigest()
+    return _content_hashes[memo_key]
+
+
+class FieldCache:
+    """ Дисковый кэш вычисленных полей интенсивности звука.
+
+    Поля хранятся в файлах .npy и при загрузке отображаются в память (numpy.memmap, режим копирования при записи),
+    поэтому повторный запуск не перечитывает и не копирует поле. Размер каталога ограничен: после каждой записи
+    удаляются давно не использованные поля (LRU по времени последнего обращения к файлу).
+
+    Attributes:
+        directory (str): каталог кэша
+        max_bytes (int): наибольший суммарный размер полей в каталоге
+
+    Methods:
+        key: возвращает ключ поля по параметрам водоема и источника звука
+        load: загружает поле по ключу
+        store: сохраняет поле по ключу
+        evict: удаляет давно не использованные поля, пока размер каталога превышает max_bytes
+
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        """ Инициализация кэша
+
+        Args:
+            directory (str): каталог кэша; создается, если не существует
+            max_bytes (int): наибольший суммарный размер полей в каталоге
+
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(heightmap, height, ss_xyz, sound_intensity, mode, enhanced_realism=True):
+        """ Возвращает ключ поля интенсивности
+
+        Args:
+            heightmap (str): расположение карты высот; в ключ входит хэш ее содержимого, а не путь
+            height (int): высота водоема
+            ss_xyz (tuple|list): координаты источника звука
+            sound_intensity (float|int): интенсивность источника звука
+            mode (str): способ распространения звука
+            enhanced_realism (bool): режим построения кривых (учитывается только для mode='curves')
+
+        Returns:
+            str: шестнадцатеричный ключ
+
+        """
+
+        parameters = (CACHE_FORMAT, file_hash(heightmap), int(height), tuple(int(c) for c in ss_xyz),
+                      float(sound_intensity), mode, bool(enhanced_realism) if mode == 'curves' else None)
+        return sha256(repr(parameters).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def load(self, key):
+        """ Загружает поле по ключу без копирования
+
+        Args:
+            key (str): ключ поля
+
+        Returns:
+            numpy.memmap|None: поле интенсивности или None, если поля нет в кэше
+
+        """
+
+        path = self._path(key)
+        try:
+            field = np.load(path, mmap_mode='c')
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            os.utime(path)  # отмечаю обращение для вытеснения давно не использованных полей
+        except OSError:
+            pass  # каталог только для чтения или общий: порядок вытеснения не обновляется, поле все равно загружено
+        return field
+
+    def store(self, key, field):
+        """ Сохраняет поле по ключу и вытесняет старые поля, если каталог превысил допустимый размер
+
+        Args:
+            key (str): ключ поля
+            field (numpy.ndarray): поле интенсивности
+
+        """
+
+        path = self._path(key)
+        # пишу во временный файл и переименовываю, чтобы параллельные процессы не прочитали недописанное поле
+        temporary_path = path + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            np.save(file, np.asarray(field, dtype=np.float32))
+        os.replace(temporary_path, path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """ Удаляет давно не использованные поля, пока суммарный размер каталога превышает max_bytes
+
+        Args:
+            keep (str|None): путь поля, которое не вытесняется (только что сохраненное)
+
+        """
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npy'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # поле уже удалено другим процессом
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,196 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+#  Подготовка поля интенсивности звука к отображению: цвета кубов, срезы и изоповерхности в виде массивов NumPy.
+#  Модуль не зависит от ursina; сцену из этих массивов строит functions_for_visualisation.FieldOverlay.
+
+import numpy as np
+
+# опорные цвета шкалы от самого тихого к самому громкому кубу: синий, голубой, зеленый, желтый, красный
+PALETTE = ((0, 0, 255), (0, 255, 255), (0, 255, 0), (255, 255, 0), (255, 0, 0))
+LEVELS = 256  # количество цветов шкалы; уровень LEVELS - интенсивность не определена (прозрачный цвет)
+
+# смещения углов грани куба по двум осям, перпендикулярным нормали грани, в порядке обхода
+_QUAD_CORNERS = np.array([(0, 0), (1, 0), (1, 1), (0, 1)])
+# два треугольника грани из ее четырех углов
+_QUAD_TRIANGLES = np.array([0, 1, 2, 0, 2, 3])
+
+
+def colour_table(alpha=0.6, palette=PALETTE):
+    """ Возвращает таблицу цветов RGBA (uint8) из LEVELS цветов шкалы и прозрачного цвета для неопределенной
+    интенсивности
+
+    Args:
+        alpha (float): непрозрачность цветов шкалы от 0 до 1
+        palette (tuple): опорные цвета (R, G, B) шкалы, равномерно распределенные по ней
+
+    """
+
+    stops = np.linspace(0, LEVELS - 1, len(palette))
+    table = np.zeros((LEVELS + 1, 4), dtype=np.uint8)
+    for channel in range(3):
+        table[:LEVELS, channel] = np.round(np.interp(np.arange(LEVELS), stops, [rgb[channel] for rgb in palette]))
+    table[:LEVELS, 3] = round(alpha * 255)
+    return table
+
+
+def intensity_levels(field):
+    """ Переводит интенсивности звука в уровни цветовой шкалы. Интенсивность убывает с квадратом длины пути, поэтому
+    шкала логарифмическая: от самого тихого до самого громкого куба поля.
+
+    Args:
+        field (numpy.ndarray): интенсивности звука с индексацией [z, y, x], NaN - не определена
+
+    Returns:
+        numpy.ndarray: уровни uint16 от 0 до LEVELS - 1 с той же индексацией; LEVELS - интенсивность не определена
+
+    """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logarithms = np.log10(np.asarray(field, dtype=np.float32))
+    defined = np.isfinite(logarithms)
+    levels = np.full(logarithms.shape, LEVELS, dtype=np.uint16)
+    if defined.any():
+        low = logarithms[defined].min()
+        span = max(float(logarithms[defined].max() - low), 1e-12)
+        levels[defined] = np.minimum((logarithms[defined] - low) * (LEVELS / span), LEVELS - 1)
+    return levels
+
+
+class FieldColours:
+    """ Цвета кубов поля интенсивности звука для отображения срезами и изоповерхностями.
+
+    Цвета всего поля вычисляются одной табличной подстановкой при каждом обновлении поля (refresh), поэтому
+    перемещение плоскости среза сводится к выборке из готового массива, а не к пересчету цветов.
+
+    Attributes:
+        table (numpy.ndarray): таблица цветов RGBA (см. colour_table)
+        levels (numpy.ndarray|None): уровни цветовой шкалы кубов (см. intensity_levels)
+        colours (numpy.ndarray|None): цвета RGBA (uint8) кубов с индексацией [z, y, x, канал]
+        version (int): номер обновления поля; меняется при каждом refresh()
+
+    """
+
+    def __init__(self, alpha=0.6, palette=PALETTE):
+        self.table = colour_table(alpha, palette)
+        self.levels = None
+        self.colours = None
+        self.version = 0
+
+    def refresh(self, field):
+        """ Пересчитывает цвета кубов по интенсивностям звука field с индексацией [z, y, x] """
+
+        self.levels = intensity_levels(field)
+        self.colours = self.table[self.levels]
+        self.version += 1
+
+    def slice(self, axis, index):
+        """ Возвращает изображение среза поля - массив RGBA (uint8) [строка, столбец, канал], строки сверху вниз.
+
+        Args:
+            axis (str): ось, перпендикулярная срезу: 'z' - горизонтальный слой (строки по Y, столбцы по X),
+                'y' - вертикальный срез (строки по Z сверху вниз, столбцы по X), 'x' - вертикальный срез (строки по Z
+                сверху вниз, столбцы по Y)
+            index (int): координата среза по оси axis
+
+        """
+
+        if axis == 'z':
+            pixels = self.colours[index]
+        elif axis == 'y':
+            pixels = self.colours[::-1, index, :]
+        elif axis == 'x':
+            pixels = self.colours[::-1, :, index]
+        else:
+            raise ValueError('Parameter "axis" must be "x", "y" or "z"')
+        return np.ascontiguousarray(pixels)
+
+    def isosurface(self, level):
+        """ Возвращает изоповерхность поля - грани кубов, отделяющие кубы с уровнем шкалы не ниже level от остальных
+        кубов, ландшафта и границ водоема. Грань окрашена в цвет громкого куба.
+
+        Args:
+            level (int): уровень цветовой шкалы от 0 до LEVELS - 1
+
+        Returns:
+            tuple: углы граней (x, y, z) float32 в координатах углов кубов - по 4 на грань, индексы вершин треугольников
+                (по 6 на грань) и цвета RGBA (uint8) вершин
+
+        """
+
+        inside = np.pad(self.levels < LEVELS, 1) & np.pad(self.levels >= level, 1)
+        corners = []
+        colours = []
+        for axis in range(3):
+            others = [other for other in range(3) if other != axis]
+            crop = tuple(slice(None) if other == axis else slice(1, -1) for other in range(3))
+            lower = np.take(inside, np.arange(inside.shape[axis] - 1), axis=axis)[crop]
+            upper = np.take(inside, np.arange(1, inside.shape[axis]), axis=axis)[crop]
+            faces = np.argwhere(lower != upper)  # [z, y, x]: по оси axis - номер границы между кубами
+
+            cubes = faces.copy()
+            cubes[:, axis] -= lower[tuple(faces.T)]  # громкий куб грани: до границы или после нее
+            colours.append(self.colours[tuple(cubes.T)])
+
+            offsets = np.zeros((4, 3), dtype=np.int64)
+            offsets[:, others] = _QUAD_CORNERS
+            corners.append((faces[:, None, :] + offsets).reshape(-1, 3)[:, ::-1])
+
+        corners = np.concatenate(corners).astype(np.float32)
+        colours = np.repeat(np.concatenate(colours), 4, axis=0)
+        triangles = (np.arange(len(corners) // 4)[:, None] * 4 + _QUAD_TRIANGLES).ravel()
+        return corners, triangles, colours
+
+
+def display_vertices(corners, length, width, z_scale=1):
+    """ Переводит координаты углов кубов (x, y, z) в координаты сцены visualisation.py, где центр куба (x, y, z)
+    отображается в точке (x - length / 2, (z + 0.5) * z_scale, width - 1 - y - width / 2) """
+
+    vertices = np.empty(corners.shape, dtype=np.float32)
+    vertices[:, 0] = corners[:, 0] - length / 2 - 0.5
+    vertices[:, 1] = corners[:, 2] * z_scale
+    vertices[:, 2] = width / 2 - 0.5 - corners[:, 1]
+    return vertices
+
+
+def slice_placement(axis, index, length, width, height, z_scale=1):
+    """ Возвращает положение, масштаб и поворот плоскости (quad) среза FieldColours.slice(axis, index) на сцене
+    visualisation.py """
+
+    if axis == 'z':
+        return (-0.5, (index + 0.5) * z_scale, -0.5), (length, width), (90, 0, 0)
+    if axis == 'y':
+        return (-0.5, height * z_scale / 2, width / 2 - 1 - index), (length, height * z_scale), (0, 0, 0)
+    return (index - length / 2, height * z_scale / 2, -0.5), (width, height * z_scale), (0, 90, 0)
+
+
+if __name__ == '__main__':
+    # время подготовки наложения для карты высот: цвета поля, все срезы и изоповерхность
+    #       python field_overlay.py [путь к карте высот]
+    import sys
+    import time
+    from classes import Pool
+    from instrumentation import Instrumentation
+    from terrain import load_heights
+
+    heightmap = sys.argv[1] if len(sys.argv) > 1 else 'Heightmaps/heightmap_robocik.jpg'
+    heights = load_heights(heightmap)
+    pool = Pool(int(heights.max()) + 1, heightmap, 'arrays', Instrumentation(quiet=True))
+    pool.add_sound_source(mode='wavefront')
+
+    field_colours = FieldColours()
+    started = time.perf_counter()
+    field_colours.refresh(pool.intensity_field())
+    refreshed = time.perf_counter()
+    for axis, size in (('z', pool.height), ('y', pool.width), ('x', pool.length)):
+        for index in range(size):
+            field_colours.slice(axis, index)
+    sliced = time.perf_counter()
+    corners, triangles, colours = field_colours.isosurface(LEVELS // 2)
+    surfaced = time.perf_counter()
+
+    print('Colours:', round((refreshed - started) * 1000, 2), 'ms, all',
+          pool.height + pool.width + pool.length, 'slices:', round((sliced - refreshed) * 1000, 2), 'ms, isosurface of',
+          len(corners) // 4, 'faces:', round((surfaced - sliced) * 1000, 2), 'ms')
@@ -3,14 +3,19 @@ Created by Ivan Danylenko
 Date 18.11.21
 """
 
-from PIL import Image
 from time import time
 from functools import wraps
-from ursina import Entity, camera, held_keys
+import numpy as np
+from PIL import Image
+from ursina import Entity, Mesh, Texture, camera, held_keys
+from terrain import load_heights
+from navigation import move_submarines
+from field_overlay import FieldColours, LEVELS, display_vertices, slice_placement
 
 # первоопределяю время последнего использования функций с огрниченной частотой использования
 lastNewSubmarinePosUse = [time()]
 lastAddNewSubmarineUse = [time()]
+lastChangeFieldOverlayUse = [time()]
 
 
 def execution_frequency(cooldown, last_use):
@@ -31,10 +36,7 @@ def execution_frequency(cooldown, last_use):
 def get_max_height(heightmap):
     """ Возвращает значение высоты самой высокой точки ландшафта. """
 
-    pixel_alpha = []
-    for pixel in list(Image.open(heightmap, 'r').getdata()):
-        pixel_alpha.append(round(pixel[0]))
-    return max(pixel_alpha)
+    return int(load_heights(heightmap).max())
 
 
 @execution_frequency(cooldown=0.15, last_use=lastNewSubmarinePosUse)
@@ -57,11 +59,45 @@ def new_submarine_pos(submarine: Entity, positions, pool, z_scale):
             positions.pop(0)
 
 
+def submarine_path(pool, start=None):
+    """ Возвращает список координат всех кубов, которые пройдет субмарина водоема до источника звука, и перемещает
+    ее в конец пути.
+
+    В отличие от Submarine.move, путь строится функцией navigation.move_submarines: субмарина останавливается в
+    локальном максимуме, а не перемещается между соседями бесконечно, и не падает, если поле звука еще не готово
+    (см. progressive.ProgressiveField).
+
+    Args:
+        pool (Pool): водоем с субмариной
+        start (tuple|None): стартовые координаты (x, y, z); если не заданы - текущее положение субмарины
+
+    """
+
+    submarine = pool.submarine
+    if start is None:
+        start = (submarine.x_position, submarine.y_position, submarine.z_position)
+    result = move_submarines(pool, [start], True, paths=True)
+    submarine.x_position, submarine.y_position, submarine.z_position = result['endpoints'][0].tolist()
+    return [tuple(xyz) for xyz in result['paths'].tolist()]
+
+
+def refresh_positions(pool, positions):
+    """ Перестраивает оставшийся путь субмарины после того, как в водоеме появилось более точное поле звука.
+    Путь продолжается от следующей отображаемой позиции, либо от текущего положения субмарины, если путь пройден. """
+
+    new_positions = submarine_path(pool, positions[0] if positions else None)
+    while positions:
+        positions.pop()
+    for pos in new_positions:
+        positions.append(pos)
+    return positions
+
+
 @execution_frequency(cooldown=0.5, last_use=lastAddNewSubmarineUse)
 def add_new_submarine(pool, positions):
     if held_keys['n'] != 0:
         pool.add_submarine()
-        new_positions = pool.submarine.move(True)
+        new_positions = submarine_path(pool)
         while positions:
             positions.pop()
         for pos in new_positions:
@@ -80,3 +116,119 @@ def change_camera_pos():
         camera.position = camera.position[0] - 1, camera.position[1], camera.position[2]
     if held_keys['d'] != 0:
         camera.position = camera.position[0] + 1, camera.position[1], camera.position[2]
+
+
+class FieldOverlay:
+    """ Наложение поля интенсивности звука на сцену: срез водоема плоскостью или изоповерхность поля.
+
+    Срез отображается одной плоскостью (quad) с текстурой, в которой каждый пиксель - куб водоема, изоповерхность -
+    одной сеткой (Mesh) из граней кубов. Цвета кубов вычисляются в field_overlay.FieldColours только при обновлении поля
+    в водоеме (например, более точным полем progressive.ProgressiveField); при перемещении плоскости среза заменяются
+    только пиксели текстуры этой оси, а сцена не перестраивается, пока состояние наложения не изменилось.
+
+    Attributes:
+        pool (Pool): отображаемый водоем
+        z_scale (float|int): коэффициент масштабирования вертикальной оси
+        mode (str|None): режим наложения - один из MODES; None - наложение скрыто
+        indices (dict): координаты плоскостей срезов по осям 'z', 'y', 'x'
+        level (int): уровень цветовой шкалы изоповерхности от 0 до LEVELS - 1
+
+    """
+
+    MODES = (None, 'z', 'y', 'x', 'isosurface')
+
+    def __init__(self, pool, z_scale=1, alpha=0.6):
+        self.pool = pool
+        self.z_scale = z_scale
+        self.mode = None
+        self.indices = {'z': pool.height // 2, 'y': pool.width // 2, 'x': pool.length // 2}
+        self.level = LEVELS // 2
+        self.field_colours = FieldColours(alpha)
+        self.field = None
+        self.shown = None  # состояние, в котором наложение отображено сейчас
+        self.textures = {}  # текстура среза по каждой оси
+        self.plane = Entity(model='quad', double_sided=True, enabled=False)
+        self.surface = Entity(double_sided=True, enabled=False)
+
+    def refresh(self):
+        """ Пересчитывает цвета поля; нужен после изменения интенсивностей водоема на месте (Pool.edit_terrain) """
+
+        self.field = self.pool.intensity_field()
+        self.field_colours.refresh(self.field)
+
+    def update(self):
+        """ Отображает наложение в текущем состоянии; вызывается каждый кадр и ничего не делает, если ни поле
+        водоема, ни режим, ни положение среза не изменились """
+
+        if self.mode is not None and self.pool.intensity_field() is not self.field:
+            self.refresh()
+        state = (self.mode, self.level if self.mode == 'isosurface' else self.indices.get(self.mode),
+                 self.field_colours.version)
+        if state == self.shown:
+            return
+        self.shown = state
+
+        self.plane.enabled = self.mode in self.indices
+        self.surface.enabled = self.mode == 'isosurface'
+        if self.mode in self.indices:
+            self._show_slice(self.mode, self.indices[self.mode])
+        elif self.mode == 'isosurface':
+            self._show_isosurface()
+
+    def _show_slice(self, axis, index):
+        """ Перемещает плоскость среза и заменяет пиксели текстуры оси axis """
+
+        pixels = self.field_colours.slice(axis, index)
+        texture = self.textures.get(axis)
+        if texture is None:
+            texture = Texture(Image.fromarray(pixels))
+            texture.filtering = None  # каждый куб - четкий квадрат без сглаживания соседних
+            self.textures[axis] = texture
+        else:
+            # panda3d хранит строки текстуры снизу вверх
+            texture._texture.setRamImageAs(np.ascontiguousarray(pixels[::-1]).tobytes(), 'RGBA')
+
+        position, scale, rotation = slice_placement(axis, index, self.pool.length, self.pool.width, self.pool.height,
+                                                    self.z_scale)
+        self.plane.texture = texture
+        self.plane.position = position
+        self.plane.scale = scale
+        self.plane.rotation = rotation
+
+    def _show_isosurface(self):
+        """ Заменяет сетку изоповерхности для текущего уровня шкалы """
+
+        corners, triangles, colours = self.field_colours.isosurface(self.level)
+        if not len(corners):
+            self.surface.enabled = False
+            return
+        vertices = display_vertices(corners, self.pool.length, self.pool.width, self.z_scale)
+        self.surface.model = Mesh(vertices=vertices.tolist(), triangles=triangles.tolist(),
+                                  colors=(colours / 255).tolist(), mode='triangle')
+
+    def switch_mode(self):
+        """ Переключает режим наложения на следующий из MODES """
+
+        self.mode = self.MODES[(self.MODES.index(self.mode) + 1) % len(self.MODES)]
+
+    def shift(self, step):
+        """ Сдвигает плоскость среза на step кубов или уровень изоповерхности на step шагов шкалы """
+
+        if self.mode == 'isosurface':
+            self.level = min(max(self.level + step * LEVELS // 16, 0), LEVELS - 1)
+        elif self.mode is not None:
+            size = {'z': self.pool.height, 'y': self.pool.width, 'x': self.pool.length}[self.mode]
+            self.indices[self.mode] = min(max(self.indices[self.mode] + step, 0), size - 1)
+
+
+@execution_frequency(cooldown=0.15, last_use=lastChangeFieldOverlayUse)
+def change_field_overlay(overlay):
+    """ В зависимости от нажатой клавиши F|UP|DOWN, переключает режим наложения поля звука или сдвигает плоскость
+    среза (уровень изоповерхности). """
+
+    if held_keys['f'] != 0:
+        overlay.switch_mode()
+    if held_keys['up arrow'] != 0:
+        overlay.shift(1)
+    if held_keys['down arrow'] != 0:
+        overlay.shift(-1)
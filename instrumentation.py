@@ -0,0 +1,117 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+import time
+from contextlib import contextmanager
+
+
+class Instrumentation:
+    """ Сбор сведений о ходе вычислений водоема: сообщения, прогресс, время фаз и счетчики.
+
+    Экземпляр этого класса передается в Pool() и используется всеми его методами вместо вывода в консоль. По умолчанию
+    сообщения и прогресс выводятся в консоль, как раньше; в тихом режиме ничего не выводится, а время фаз и счетчики
+    собираются в любом случае.
+
+    Attributes:
+        quiet (bool): если True, сообщения и прогресс не выводятся в консоль
+        progress_callback (callable|None): функция progress_callback(phase, completed, total), вызываемая вместо вывода
+            прогресса в консоль
+        message_callback (callable|None): функция message_callback(text), вызываемая вместо вывода сообщений в консоль
+        phases (dict): накопленное время фаз {название: {'wall': секунды, 'cpu': секунды, 'calls': количество}}
+        counters (dict): счетчики {название: значение}
+
+    """
+
+    def __init__(self, progress=None, messages=None, quiet=False):
+        """ Инициализация
+
+        Args:
+            progress (callable|None): функция progress(phase, completed, total), получающая прогресс фаз
+            messages (callable|None): функция messages(text), получающая сообщения о начале этапов
+            quiet (bool): если True, сообщения и прогресс без заданных функций не выводятся в консоль
+
+        """
+
+        self.quiet = quiet
+        self.progress_callback = progress
+        self.message_callback = messages
+        self.phases = {}
+        self.counters = {}
+
+    def message(self, *text):
+        """ Сообщает о начале этапа вычислений """
+
+        text = ' '.join(str(part) for part in text)
+        if self.message_callback is not None:
+            self.message_callback(text)
+        elif not self.quiet:
+            print(text)
+
+    def progress(self, phase, completed, total):
+        """ Сообщает, что в фазе phase выполнено completed единиц работы из total """
+
+        if self.progress_callback is not None:
+            self.progress_callback(phase, completed, total)
+        elif not self.quiet:
+            print('\t' + phase + ':', completed, 'of', total, 'completed.')
+
+    @contextmanager
+    def phase(self, name):
+        """ Контекстный менеджер, добавляющий к фазе name затраченное внутри него астрономическое и процессорное время
+
+        Example:
+            with pool.instrumentation.phase('neighbour_linking'):
+                ...
+
+        """
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            totals = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            totals['wall'] += time.perf_counter() - wall
+            totals['cpu'] += time.process_time() - cpu
+            totals['calls'] += 1
+
+    def count(self, name, value=1):
+        """ Увеличивает счетчик name на value """
+
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, counters):
+        """ Добавляет счетчики, собранные в другом месте (например, в рабочем процессе) """
+
+        for name, value in counters.items():
+            self.count(name, value)
+
+    def reset(self):
+        """ Обнуляет время фаз и счетчики """
+
+        self.phases = {}
+        self.counters = {}
+
+    def dominant_phase(self):
+        """ Возвращает название фазы с наибольшим астрономическим временем или None, если фазы не замерялись """
+
+        if not self.phases:
+            return None
+        return max(self.phases, key=lambda name: self.phases[name]['wall'])
+
+    def report(self):
+        """ Возвращает собранные сведения в виде словаря, пригодного для сериализации в JSON.
+
+        Returns:
+            dict: {'phases': время фаз, 'counters': счетчики, 'throughput': счетчики, деленные на суммарное
+            астрономическое время всех фаз, 'dominant_phase': самая долгая фаза}
+
+        """
+
+        wall = sum(totals['wall'] for totals in self.phases.values())
+        return {'phases': {name: dict(totals) for name, totals in self.phases.items()},
+                'counters': dict(self.counters),
+                'throughput': {name: value / wall for name, value in self.counters.items()} if wall > 0 else {},
+                'dominant_phase': self.dominant_phase()}
@@ -0,0 +1,339 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+#  Вычислительные ядра для водоемов с хранением в массивах. Если установлен Numba, ядра компилируются и classes.py
+#  использует их вместо циклов на чистом Python; без Numba ядра остаются обычными функциями Python, а classes.py
+#  выполняет исходные циклы. Проверка совпадения результатов ядер с исходным кодом на водоеме storage='objects'
+#  (check_parity, код возврата 1 при несовпадении):
+#       python kernels.py [путь к карте высот ...]
+
+import sys
+import random
+from math import sqrt, isnan
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """ Заменяет numba.njit, если Numba не установлен: функция остается обычной функцией Python """
+
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda function: function
+
+# если False, classes.py не использует ядра даже при установленном Numba
+ENABLED = NUMBA_AVAILABLE
+
+
+def neighbour_table(height, width, length, offsets):
+    """ Возвращает плоские индексы 26 соседей каждого куба водоема средствами NumPy
+
+    Args:
+        height (int): высота водоема
+        width (int): ширина водоема
+        length (int): длина водоема
+        offsets (list): смещения (dx, dy, dz) к соседям (NEIGHBOUR_OFFSETS)
+
+    Returns:
+        numpy.ndarray: массив (height * width * length, 26) плоских индексов z * width * length + y * length + x
+        соседей в порядке offsets; -1 на месте соседей, выходящих за пределы водоема
+
+    """
+
+    z, y, x = (axis.ravel() for axis in np.indices((height, width, length)))
+    offsets = np.asarray(offsets)
+    neighbour_x = x[:, None] + offsets[None, :, 0]
+    neighbour_y = y[:, None] + offsets[None, :, 1]
+    neighbour_z = z[:, None] + offsets[None, :, 2]
+    inside = (neighbour_x >= 0) & (neighbour_x < length) & (neighbour_y >= 0) & (neighbour_y < width) & \
+        (neighbour_z >= 0) & (neighbour_z < height)
+    return np.where(inside, (neighbour_z * width + neighbour_y) * length + neighbour_x, -1)
+
+
+@njit(cache=True)
+def parallelepiped_kernel(water):
+    """ Ядро classes.parallelepiped_dimensions(): те же правила сканирования отрезков ландшафта по маске воды """
+
+    height, width, length = water.shape
+    parallelepiped_length = length
+    parallelepiped_width = width
+    for z_position in range(height):
+        for y_position in range(width):
+            x_count = 0
+            for x_position in range(length):
+                if not water[z_position, y_position, x_position]:
+                    x_count += 1
+                elif x_count < parallelepiped_length and x_count != 0:
+                    parallelepiped_length = x_count
+                    x_count = 0
+            if x_count < parallelepiped_length and x_count != 0:
+                parallelepiped_length = x_count
+        for x_position in range(length):
+            y_count = 0
+            for y_position in range(width):
+                if not water[z_position, y_position, x_position]:
+                    y_count += 1
+                elif y_count < parallelepiped_width and y_count != 0:
+                    parallelepiped_width = y_count
+                    y_count = 0
+            if y_count < parallelepiped_width and y_count != 0:
+                parallelepiped_width = y_count
+    return parallelepiped_length, parallelepiped_width
+
+
+@njit(cache=True)
+def _first_water_z(water, x_position, y_position, z_target):
+    """ Возвращает первую высоту столбца (x, y), состоящую из воды, в порядке удаления от z_target (при равном
+    удалении - сначала нижняя), как список z_poss в shortest_curve(); -1, если воды в столбце нет """
+
+    height = water.shape[0]
+    for distance in range(height):
+        z_position = z_target - distance
+        if 0 <= z_position < height and water[z_position, y_position, x_position]:
+            return z_position
+        z_position = z_target + distance
+        if distance != 0 and 0 <= z_position < height and water[z_position, y_position, x_position]:
+            return z_position
+    return -1
+
+
+@njit(cache=True)
+def curve_kernel(water, ss_x, ss_y, ss_z, cube_x, cube_y, cube_z, prl_length, prl_width, enhanced_realism):
+    """ Ядро shortest_curve(): та же цепочка опорных точек без сортировки списков кандидатов.
+
+    Вместо сортировки выбирается кандидат с наименьшей суммой остатков, а при равенстве - первый в порядке перебора,
+    что совпадает с первым подходящим элементом устойчиво отсортированного списка.
+
+    Returns:
+        tuple: (длина кривой, количество опорных точек)
+
+    """
+
+    height, width, length = water.shape
+    x_dto = abs(cube_x - ss_x)
+    y_dto = abs(cube_y - ss_y)
+    z_dto = abs(cube_z - ss_z)
+    curve_len = 0.0
+    steps = 0
+
+    while x_dto + y_dto + z_dto != 0:
+        np_x, np_y, np_z = ss_x, ss_y, ss_z
+        found = False
+        steps += 1
+
+        if enhanced_realism:
+            best = x_dto + y_dto + z_dto  # подходят только кандидаты, приближающие к кубу-цели
+            planar = x_dto + y_dto
+            for z_position in range(height):
+                for y_position in range(max(0, ss_y - prl_width), min(width, ss_y + prl_width + 1)):
+                    for x_position in range(max(0, ss_x - prl_length), min(length, ss_x + prl_length + 1)):
+                        key = abs(cube_x - x_position) + abs(cube_y - y_position) + abs(cube_z - z_position)
+                        if key < best and abs(cube_x - x_position) + abs(cube_y - y_position) <= planar and \
+                                water[z_position, y_position, x_position]:
+                            best = key
+                            np_x, np_y, np_z = x_position, y_position, z_position
+                            found = True
+
+        if not found:
+            best = width + length + 1
+            for y_position in range(max(0, ss_y - prl_width), min(width, ss_y + prl_width + 1)):
+                for x_position in range(max(0, ss_x - prl_length), min(length, ss_x + prl_length + 1)):
+                    key = abs(cube_x - x_position) + abs(cube_y - y_position)
+                    if key < best:
+                        z_position = _first_water_z(water, x_position, y_position, cube_z)
+                        # куб, совпадающий с текущей опорной точкой, не выбирается (как np_xyz == ss_xyz в исходнике)
+                        if z_position >= 0 and not (x_position == ss_x and y_position == ss_y and z_position == ss_z):
+                            best = key
+                            np_x, np_y, np_z = x_position, y_position, z_position
+
+        curve_len += sqrt((np_x - ss_x) ** 2 + (np_y - ss_y) ** 2 + (np_z - ss_z) ** 2)
+        ss_x, ss_y, ss_z = np_x, np_y, np_z
+        x_dto = abs(cube_x - ss_x)
+        y_dto = abs(cube_y - ss_y)
+        z_dto = abs(cube_z - ss_z)
+
+    return curve_len, steps
+
+
+@njit(cache=True)
+def curve_layer_kernel(water, z_position, ss_x, ss_y, ss_z, prl_length, prl_width, enhanced_realism):
+    """ Строит кривые curve_kernel() для всех кубов воды слоя z_position
+
+    Returns:
+        tuple: (длины кривых (width, length), inf для кубов, не являющихся водой; суммарное количество опорных точек)
+
+    """
+
+    width, length = water.shape[1], water.shape[2]
+    lengths = np.full((width, length), np.inf)
+    steps = 0
+    for y_position in range(width):
+        for x_position in range(length):
+            if water[z_position, y_position, x_position]:
+                curve_length, curve_steps = curve_kernel(water, ss_x, ss_y, ss_z, x_position, y_position, z_position,
+                                                         prl_length, prl_width, enhanced_realism)
+                lengths[y_position, x_position] = curve_length
+                steps += curve_steps
+    return lengths, steps
+
+
+@njit(cache=True)
+def climb_kernel(field, x_position, y_position, z_position, metres, offsets):
+    """ Ядро Submarine.move по плотному полю интенсивности с индексацией [z, y, x] (NaN - не определена).
+
+    Args:
+        metres (int): метры для преодоления; -1 - плыть до источника звука (metres=True)
+        offsets (numpy.ndarray): смещения к соседям (26, 3) в порядке NEIGHBOUR_OFFSETS
+
+    Returns:
+        tuple: (посещенные кубы (n, 3), конечные координаты x, y, z, False если у соседей текущего куба нет
+        определенной силы звука)
+
+    """
+
+    height, width, length = field.shape
+    positions = np.empty((16, 3), dtype=np.int64)
+    count = 0
+    while metres != 0:
+        if count == len(positions):
+            grown = np.empty((2 * len(positions), 3), dtype=np.int64)
+            grown[:count] = positions
+            positions = grown
+        positions[count, 0] = x_position
+        positions[count, 1] = y_position
+        positions[count, 2] = z_position
+        count += 1
+
+        # сосед с самой большой силой звука; при равенстве - последний в порядке offsets, как после устойчивой
+        # сортировки по возрастанию в Submarine.move
+        found = False
+        best = 0.0
+        best_x, best_y, best_z = x_position, y_position, z_position
+        for k in range(len(offsets)):
+            x = x_position + offsets[k, 0]
+            y = y_position + offsets[k, 1]
+            z = z_position + offsets[k, 2]
+            if 0 <= x < length and 0 <= y < width and 0 <= z < height:
+                value = field[z, y, x]
+                if not isnan(value) and (not found or value >= best):
+                    best = value
+                    best_x, best_y, best_z = x, y, z
+                    found = True
+        if not found:
+            return positions[:count], x_position, y_position, z_position, False
+        if best == field[z_position, y_position, x_position]:
+            return positions[:count], x_position, y_position, z_position, True
+        if metres > 0:
+            metres -= 1
+        x_position, y_position, z_position = best_x, best_y, best_z
+
+    return positions[:count], x_position, y_position, z_position, True
+
+
+def check_parity(heightmap='Heightmaps/heightmap15.jpg', samples=100):
+    """ Сравнивает каждое ядро с эталоном - исходным кодом classes.py на водоеме с хранением кубов в объектах
+    (storage='objects') при выключенных ядрах. Ядра проверяются такими, какими их использует classes.py: без Numba -
+    как обычные функции Python (NUMBA_AVAILABLE=False), то есть скомпилированный код в этом случае не проверяется.
+
+    Args:
+        heightmap (str): расположение карты высот
+        samples (int): количество случайных кубов для кривых и субмарин для перемещений
+
+    Returns:
+        list: описания несовпадений; пустой список, если все ядра совпали с эталоном
+
+    """
+
+    import classes
+    from classes import Pool, Submarine, NEIGHBOUR_OFFSETS, parallelepiped_dimensions, shortest_curve
+    from instrumentation import Instrumentation
+    from terrain import load_heights
+
+    height = int(load_heights(heightmap).max()) + 1
+    enabled = classes.kernels.ENABLED
+    classes.kernels.ENABLED = False  # эталон - исходные циклы
+    failures = []
+    try:
+        random.seed(0)
+        reference = Pool(height, heightmap, 'objects', Instrumentation(quiet=True))
+        reference.add_sound_source(enhanced_realism=False, mode='wavefront')
+        source = reference.sound_source
+        ss_xyz = (source.x_position, source.y_position, source.z_position)
+        water = reference.water_mask()
+
+        prl_lw = parallelepiped_dimensions(water)
+        if prl_lw != tuple(parallelepiped_kernel(water)):
+            failures.append('parallelepiped_kernel: ' + str(tuple(parallelepiped_kernel(water))) + ' != ' + str(prl_lw))
+
+        # кривые строятся в водоеме без вычисленного поля: shortest_curve возвращает уже определенную интенсивность куба
+        probe = Pool(height, heightmap, 'objects', Instrumentation(quiet=True))
+        probe.place_sound_source(source.sound_intensity, *ss_xyz)
+        mismatches = 0
+        cells = np.argwhere(water)
+        for z_position, y_position, x_position in cells[np.random.default_rng(0).choice(len(cells), samples)].tolist():
+            for enhanced_realism in (True, False):
+                expected = shortest_curve(probe, ss_xyz, (x_position, y_position, z_position), prl_lw,
+                                          enhanced_realism)
+                curve_length, steps = curve_kernel(water, *ss_xyz, x_position, y_position, z_position, *prl_lw,
+                                                   enhanced_realism)
+                mismatches += expected != curve_length
+        if mismatches:
+            failures.append('curve_kernel: ' + str(mismatches) + ' of ' + str(2 * samples) + ' curves differ')
+
+        # ядро перемещения получает интенсивности эталона без округления до float32
+        field = np.array([[[np.nan if cube.sound_intensity is None else cube.sound_intensity for cube in row]
+                           for row in layer] for layer in reference.filling], dtype=np.float64)
+        offsets = np.array(NEIGHBOUR_OFFSETS, dtype=np.int64)
+        mismatches = 0
+        for i in range(samples):
+            submarine = Submarine(reference)
+            start = (submarine.x_position, submarine.y_position, submarine.z_position)
+            expected = submarine.move(200)
+            positions, x_position, y_position, z_position, found = climb_kernel(field, *start, 200, offsets)
+            mismatches += expected != [tuple(xyz) for xyz in positions.tolist()] or \
+                (submarine.x_position, submarine.y_position, submarine.z_position) != (x_position, y_position,
+                                                                                       z_position)
+        if mismatches:
+            failures.append('climb_kernel: ' + str(mismatches) + ' of ' + str(samples) + ' paths differ')
+
+        table = neighbour_table(height, reference.width, reference.length, NEIGHBOUR_OFFSETS)
+        expected = [[-1 if cube is None else (cube.z_position * reference.width + cube.y_position) * reference.length +
+                     cube.x_position for cube in cube_in_pool.neighbours]
+                    for layer in reference.filling for row in layer for cube_in_pool in row]
+        if table.tolist() != expected:
+            failures.append('neighbour_table: differs from the neighbours linked in objects storage')
+
+        # поле режима 'curves' целиком: исходные циклы на объектах и curve_layer_kernel на массивах
+        reference = Pool(height, heightmap, 'objects', Instrumentation(quiet=True))
+        reference.add_sound_source(*(1000,) + ss_xyz, enhanced_realism=False)
+        classes.kernels.ENABLED = True
+        pool = Pool(height, heightmap, 'arrays', Instrumentation(quiet=True))
+        pool.add_sound_source(*(1000,) + ss_xyz, enhanced_realism=False)
+        if not np.array_equal(reference.intensity_field(), pool.intensity, equal_nan=True):
+            failures.append('curve_layer_kernel: curves field differs')
+    finally:
+        classes.kernels.ENABLED = enabled
+    return failures
+
+
+if __name__ == '__main__':
+    # проверка совпадения ядер с эталоном classes.py; код возврата 1, если хотя бы одно ядро не совпало
+    #       python kernels.py [путь к карте высот ...]
+    heightmaps = sys.argv[1:] or ['Heightmaps/heightmap15.jpg']
+    if NUMBA_AVAILABLE:
+        print('Numba available: compiled kernels are checked.')
+    else:
+        print('Numba is not installed: kernels were NOT compiled and are checked only as plain Python functions.')
+    failures = []
+    for heightmap in heightmaps:
+        failures += [heightmap + ': ' + failure for failure in check_parity(heightmap)]
+    for failure in failures:
+        print('FAILED', failure)
+    print('All kernels match the reference code.' if not failures else str(len(failures)) + ' kernel checks failed.')
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,125 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+from collections import OrderedDict
+import numpy as np
+from classes import shortest_curve
+
+
+class LazyIntensity:
+    """ Поле интенсивности режима 'curves', вычисляемое по требованию.
+
+    Подставляется вместо массива pool.intensity (Pool.add_sound_source с параметром lazy_capacity). Интенсивность куба
+    воды определяется функцией shortest_curve() при первом обращении к нему и запоминается в ограниченном кэше;
+    при переполнении вытесняются давно не использованные кубы (LRU). Значения совпадают с вычисленными заранее
+    Pool.add_sound_source(mode='curves'), поэтому маршрут Submarine.move не меняется, а стоимость одного маршрута
+    составляет порядка 26 вычислений на шаг вместо вычисления всего водоема.
+
+    Индексация [z, y, x] целыми числами читает и записывает отдельные кубы. Любая другая индексация, а также
+    numpy.asarray(), вычисляют поле целиком.
+
+    Attributes:
+        pool (Pool): водоем
+        capacity (int): наибольшее количество запоминаемых кубов
+        shape (tuple): форма поля (height, width, length)
+        dtype (numpy.dtype): тип значений поля (float32)
+
+    """
+
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, pool, enhanced_realism=True, capacity=1 << 20):
+        """ Инициализация
+
+        Args:
+            pool (Pool): водоем с размещенным источником звука (Pool.place_sound_source)
+            enhanced_realism (bool): режим построения кривых shortest_curve()
+            capacity (int): наибольшее количество запоминаемых кубов
+
+        Raises:
+            ValueError: если capacity меньше 1
+
+        """
+
+        assert capacity >= 1, ValueError('Parameter "capacity" must be a positive integer')
+
+        self.pool = pool
+        self.enhanced_realism = enhanced_realism
+        self.capacity = capacity
+        self.shape = (pool.height, pool.width, pool.length)
+        self.ss_xyz = (pool.sound_source.x_position, pool.sound_source.y_position, pool.sound_source.z_position)
+        self.sound_intensity = pool.sound_source.sound_intensity
+        with pool.instrumentation.phase('parallelepiped_scan'):
+            self.prl_lw = pool.terrain.parallelepiped_dimensions()
+        self._cache = OrderedDict()
+        self._assigned = {}  # явно заданные значения (например, источник звука) не вытесняются
+        self._computing = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _key(self, index):
+        """ Возвращает кортеж (z, y, x), если index указывает на один куб, и None в ином случае """
+
+        if isinstance(index, tuple) and len(index) == 3 and all(isinstance(i, (int, np.integer)) for i in index):
+            return tuple(int(i) % size for i, size in zip(index, self.shape))
+        return None
+
+    def __getitem__(self, index):
+        key = self._key(index)
+        if key is None:
+            return np.asarray(self)[index]
+        if key in self._assigned:
+            return self._assigned[key]
+
+        value = self._cache.get(key)
+        if value is not None:
+            self._cache.move_to_end(key)
+            self.pool.instrumentation.count('lazy_hits')
+            return value
+        # shortest_curve() сначала читает интенсивность целевого куба - во время вычисления она не определена
+        if key == self._computing or not self.pool.is_water(key[2], key[1], key[0]):
+            return np.float32(np.nan)
+
+        self._computing = key
+        try:
+            curve_length = shortest_curve(self.pool, self.ss_xyz, (key[2], key[1], key[0]), self.prl_lw,
+                                          self.enhanced_realism)
+        finally:
+            self._computing = None
+        value = np.float32(self.sound_intensity / (curve_length ** 2))
+        self.pool.instrumentation.count('lazy_evaluations')
+
+        self._cache[key] = value
+        if len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+        return value
+
+    def __setitem__(self, index, value):
+        key = self._key(index)
+        assert key is not None, ValueError('LazyIntensity supports assignment to single cubes only')
+        self._cache.pop(key, None)
+        self._assigned[key] = np.float32(value)
+
+    def __array__(self, dtype=None, copy=None):
+        field = np.full(self.shape, np.nan, dtype=np.float32)
+        for z_position, y_position, x_position in np.argwhere(self.pool.water_mask()).tolist():
+            field[z_position, y_position, x_position] = self[z_position, y_position, x_position]
+        for key, value in self._assigned.items():
+            field[key] = value
+        return field if dtype is None else field.astype(dtype)
+
+    def invalidate(self):
+        """ Забывает запомненные интенсивности и заново определяет размеры параллелепипеда допущений после изменения
+        ландшафта водоема (Pool.edit_terrain) """
+
+        with self.pool.instrumentation.phase('parallelepiped_scan'):
+            self.prl_lw = self.pool.terrain.parallelepiped_dimensions()
+        self._cache.clear()
+
+    def cached(self):
+        """ Возвращает количество запомненных кубов """
+
+        return len(self._cache)
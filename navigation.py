@@ -0,0 +1,275 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+import numpy as np
+from classes import NEIGHBOUR_OFFSETS
+
+# состояния субмарин после пакетного перемещения
+MOVING = 0  # метры для преодоления закончились раньше, чем субмарина остановилась
+ARRIVED = 1  # в соседе с самой большой силой звука сила звука такая же, как в текущем кубометре (как в Submarine.move)
+CYCLED = 2  # субмарина зациклилась между локальными максимумами и никогда не остановилась бы
+NO_NEIGHBOURS = 3  # ни у одного соседа нет определенной силы звука
+
+
+def _pool_intensities(pool):
+    """ Возвращает интенсивности звука водоема с индексацией [z, y, x] с той точностью, с которой их хранит водоем:
+    для storage='objects' - float64 (Pool.intensity_field() округлил бы их до float32 и изменил бы выбор среди почти
+    равных соседей), для остальных способов хранения - сам массив водоема. """
+
+    if pool.storage != 'objects':
+        return pool.intensity_field()
+    return np.array([[[np.nan if cube.sound_intensity is None else cube.sound_intensity for cube in row]
+                      for row in layer] for layer in pool.filling], dtype=np.float64)
+
+
+class PaddedField:
+    """ Поле интенсивности водоема, обложенное слоем кубов без интенсивности, в виде плоского массива.
+
+    Позволяет за одну операцию NumPy прочитать силу звука в 26 соседях любого количества кубов, не проверяя выход за
+    пределы водоема.
+
+    Attributes:
+        values (numpy.ndarray): плоский массив интенсивностей с точностью исходного поля (float32 или float64),
+            NaN - не определена
+        shape (tuple): форма расширенного поля (height + 2, width + 2, length + 2)
+        deltas (numpy.ndarray): смещения плоского индекса к 26 соседям в порядке NEIGHBOUR_OFFSETS
+
+    """
+
+    def __init__(self, field):
+        """ Инициализация расширенного поля
+
+        Args:
+            field (numpy.ndarray): интенсивности звука с индексацией [z, y, x], NaN - не определена
+
+        """
+
+        height, width, length = field.shape
+        # точность поля сохраняется: при округлении равенство и порядок соседей могли бы отличаться от исходных
+        padded = np.full((height + 2, width + 2, length + 2), np.nan, dtype=np.result_type(field.dtype, np.float32))
+        padded[1:-1, 1:-1, 1:-1] = field
+        self.values = padded.ravel()
+        self.shape = padded.shape
+        self.deltas = np.array([(dz * self.shape[1] + dy) * self.shape[2] + dx for dx, dy, dz in NEIGHBOUR_OFFSETS])
+
+    def flat_index(self, xyz):
+        """ Переводит массив координат (N, 3) в порядке (x, y, z) в плоские индексы расширенного поля. """
+
+        xyz = np.asarray(xyz, dtype=np.int64)
+        return ((xyz[:, 2] + 1) * self.shape[1] + xyz[:, 1] + 1) * self.shape[2] + xyz[:, 0] + 1
+
+    def coordinates(self, index):
+        """ Переводит плоские индексы расширенного поля в массив координат (N, 3) в порядке (x, y, z). """
+
+        z, y, x = np.unravel_index(index, self.shape)
+        return np.stack([x - 1, y - 1, z - 1], axis=1)
+
+    def best_neighbours(self, index):
+        """ Для каждого куба возвращает номер соседа с самой большой силой звука и эту силу звука.
+
+        Среди равных соседей выбирается последний в порядке NEIGHBOUR_OFFSETS - так же, как после устойчивой
+        сортировки в Submarine.move. Если ни у одного соседа нет силы звука, возвращается сила -inf.
+
+        """
+
+        neighbours = self.values[index[:, None] + self.deltas]
+        neighbours = np.where(np.isnan(neighbours), -np.inf, neighbours)
+        best = len(self.deltas) - 1 - np.argmax(neighbours[:, ::-1], axis=1)
+        return best, neighbours[np.arange(len(index)), best]
+
+
+def move_submarines(pool, positions, metres=True, paths=False):
+    """ Функция перемещает сразу много субмарин в сторону источника звука по тем же правилам, что и Submarine.move,
+    но для всех субмарин одновременно средствами NumPy и без создания объектов Submarine().
+
+    Субмарина, которая зациклилась между локальными максимумами (Submarine.move в этом случае никогда не завершается),
+    останавливается с состоянием CYCLED; зацикливание определяется алгоритмом Брента.
+
+    Args:
+        pool (Pool): водоем с определенными интенсивностями звука
+        positions (numpy.ndarray): стартовые координаты субмарин, массив (N, 3) в порядке (x, y, z)
+        metres (int|bool): метры для преодоления каждой субмариной. Если True, то плывем до источника звука
+        paths (bool): если True, дополнительно возвращаются все посещенные кубометры
+
+    Returns:
+        dict: 'endpoints' - конечные координаты (N, 3); 'steps' - количество сделанных перемещений (N,);
+        'status' - состояние каждой субмарины (MOVING, ARRIVED, CYCLED или NO_NEIGHBOURS). Если paths=True, также
+        'paths' - координаты посещенных кубометров всех субмарин подряд (M, 3) и 'path_offsets' (N + 1,): путь
+        субмарины i - это paths[path_offsets[i]:path_offsets[i + 1]], как список, возвращаемый Submarine.move
+
+    Raises:
+        ValueError: если неверно задан параметр metres или стартовые координаты вне водоема
+
+    """
+
+    assert (metres >= 1) or (metres is True), ValueError('Parameter "metres" must be greater integer than 0 or boolean True.')
+    positions = np.asarray(positions, dtype=np.int64).reshape(-1, 3)
+    assert ((positions >= 0) & (positions < (pool.length, pool.width, pool.height))).all(), \
+        ValueError('All submarine positions must lie inside the pool')
+
+    field = PaddedField(_pool_intensities(pool))
+    count = len(positions)
+    current = field.flat_index(positions)
+    steps = np.zeros(count, dtype=np.int64)
+    status = np.full(count, MOVING, dtype=np.int8)
+    # состояние алгоритма Брента: опорный куб и длина текущего окна поиска цикла
+    anchor = current.copy()
+    window = np.ones(count, dtype=np.int64)
+    since_anchor = np.zeros(count, dtype=np.int64)
+
+    visited_agents = []
+    visited_cells = []
+    active = np.arange(count)
+    while len(active):
+        cells = current[active]
+        if paths:
+            visited_agents.append(active)
+            visited_cells.append(cells)
+
+        best, best_intensity = field.best_neighbours(cells)
+        arrived = best_intensity == field.values[cells]
+        empty = best_intensity == -np.inf
+        status[active[arrived]] = ARRIVED
+        status[active[empty]] = NO_NEIGHBOURS
+
+        moving = ~(arrived | empty)
+        active = active[moving]
+        current[active] = cells[moving] + field.deltas[best[moving]]
+        steps[active] += 1
+
+        # проверяю зацикливание: вернулась ли субмарина в опорный куб
+        since_anchor[active] += 1
+        cycled = current[active] == anchor[active]
+        status[active[cycled]] = CYCLED
+        active = active[~cycled]
+        renew = since_anchor[active] == window[active]
+        anchor[active[renew]] = current[active[renew]]
+        window[active[renew]] *= 2
+        since_anchor[active[renew]] = 0
+
+        if metres is not True:
+            active = active[steps[active] < metres]
+
+    result = {'endpoints': field.coordinates(current), 'steps': steps, 'status': status}
+    if paths:
+        agents = np.concatenate(visited_agents) if visited_agents else np.zeros(0, dtype=np.int64)
+        cells = np.concatenate(visited_cells) if visited_cells else np.zeros(0, dtype=np.int64)
+        order = np.argsort(agents, kind='stable')
+        result['paths'] = field.coordinates(cells[order])
+        result['path_offsets'] = np.concatenate([[0], np.cumsum(np.bincount(agents, minlength=count))])
+    return result
+
+
+class NavigationField:
+    """ Предвычисленное поле переходов субмарины: для каждого куба с определенной силой звука хранится номер соседа,
+    в которого переместится субмарина (тот же выбор, что и в Submarine.move), и производные от него данные.
+
+    Куб, в котором субмарина останавливается, называется конечным. Это куб, у которого нет соседа громче него: либо
+    самый громкий сосед звучит так же (остановка Submarine.move, например рядом с источником звука), либо все соседи
+    тише (локальный максимум, на котором Submarine.move зацикливается). Каждый куб стекает ровно в один конечный куб;
+    множество кубов, стекающих в один конечный куб, называется бассейном.
+
+    Attributes:
+        next_hop (numpy.ndarray): int8 [z, y, x] - номер соседа в порядке NEIGHBOUR_OFFSETS; -1 для конечных кубов и
+            кубов без силы звука
+        steps (numpy.ndarray): int32 [z, y, x] - количество перемещений до конечного куба
+        distance (numpy.ndarray): float32 [z, y, x] - длина пути до конечного куба в метрах
+        basin (numpy.ndarray): int32 [z, y, x] - плоский индекс конечного куба (z * width + y) * length + x;
+            -1 для кубов без силы звука
+        reaches_source (numpy.ndarray): bool [z, y, x] - True, если конечный куб является источником звука (любым из
+            источников sources.SoundSources) или его соседом, то есть субмарина из этого куба доходит до источника;
+            False - застревает в локальном максимуме
+
+    Methods:
+        walk: возвращает путь субмарины из заданного куба переходами по полю
+
+    """
+
+    def __init__(self, pool, chunk=1 << 18):
+        """ Вычисление поля переходов
+
+        Args:
+            pool (Pool): водоем с определенными интенсивностями звука и источником звука (Pool.add_sound_source) или
+                несколькими источниками (sources.SoundSources)
+            chunk (int): количество кубов, соседи которых сравниваются за одну операцию (ограничивает память)
+
+        """
+
+        intensity = _pool_intensities(pool)
+        field = PaddedField(intensity)
+        shape = intensity.shape
+        self.shape = shape
+
+        # номер самого громкого соседа там, где он громче текущего куба
+        next_hop = np.full(intensity.size, -1, dtype=np.int8)
+        cells = np.flatnonzero(~np.isnan(intensity.ravel()))
+        for start in range(0, len(cells), chunk):
+            block = cells[start:start + chunk]
+            z, y, x = np.unravel_index(block, shape)
+            padded = field.flat_index(np.stack([x, y, z], axis=1))
+            best, best_intensity = field.best_neighbours(padded)
+            moving = best_intensity > field.values[padded]
+            next_hop[block[moving]] = best[moving]
+
+        # переходы только усиливают звук, поэтому циклов нет: удвоением указателей за O(N log L) нахожу конечный куб,
+        # количество перемещений и длину пути для каждого куба
+        deltas = np.array([(dz * shape[1] + dy) * shape[2] + dx for dx, dy, dz in NEIGHBOUR_OFFSETS])
+        step_lengths = np.sqrt(np.sum(np.array(NEIGHBOUR_OFFSETS) ** 2, axis=1))
+        moving = next_hop >= 0
+        successor = np.arange(intensity.size)
+        successor[moving] += deltas[next_hop[moving]]
+        steps = moving.astype(np.int32)
+        distance = np.where(moving, step_lengths[np.maximum(next_hop, 0)], 0.0)
+        while True:
+            jump = successor[successor]
+            if np.array_equal(jump, successor):
+                break
+            steps = steps + steps[successor]
+            distance = distance + distance[successor]
+            successor = jump
+
+        defined = ~np.isnan(intensity.ravel())
+        basin = np.where(defined, successor, -1).astype(np.int32)
+        z, y, x = np.unravel_index(successor, shape)
+        # при нескольких источниках (sources.SoundSources) - рядом с любым из них
+        near_source = np.zeros(intensity.size, dtype=bool)
+        for x_source, y_source, z_source in pool.sound_source_positions():
+            near_source |= (np.abs(z - z_source) <= 1) & (np.abs(y - y_source) <= 1) & (np.abs(x - x_source) <= 1)
+
+        self.next_hop = next_hop.reshape(shape)
+        self.steps = steps.reshape(shape)
+        self.distance = distance.astype(np.float32).reshape(shape)
+        self.basin = basin.reshape(shape)
+        self.reaches_source = (defined & near_source).reshape(shape)
+
+    def walk(self, x_position, y_position, z_position, metres=True):
+        """ Возвращает путь субмарины из заданного куба переходами по полю.
+
+        Совпадает с Submarine.move, кроме локальных максимумов: на них субмарина останавливается, а не зацикливается.
+
+        Args:
+            x_position (int): координата стартового куба по оси X
+            y_position (int): координата стартового куба по оси Y
+            z_position (int): координата стартового куба по оси Z
+            metres (int|bool): метры для преодоления. Если True, то плывем до конечного куба
+
+        Returns:
+            tuple: (positions, end) - список координат всех кубов, в которых побывала субмарина, и координаты куба,
+            в котором она оказалась
+
+        """
+
+        positions = []
+        xyz = (x_position, y_position, z_position)
+        while metres:
+            positions.append(xyz)
+            hop = self.next_hop[xyz[2], xyz[1], xyz[0]]
+            if hop < 0:
+                return positions, xyz
+            if metres is not True:
+                metres -= 1
+            dx, dy, dz = NEIGHBOUR_OFFSETS[hop]
+            xyz = (xyz[0] + dx, xyz[1] + dy, xyz[2] + dz)
+        return positions, xyz
@@ -0,0 +1,128 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+import queue
+import traceback
+import multiprocessing
+import numpy as np
+from classes import Pool, PROPAGATION_MODES
+from pyramid import coarse_path_lengths
+
+
+def _progressive_worker(results, water, ss_xyz, sound_intensity, factors, mode, enhanced_realism):
+    """ Фоновый процесс: вычисляет поля интенсивности от грубого к точному и отправляет каждое в очередь results в
+    виде (factor, field). При ошибке отправляет (None, текст исключения). """
+
+    try:
+        for factor in factors:
+            lengths = coarse_path_lengths(water, ss_xyz, factor)
+            reached = np.isfinite(lengths) & (lengths > 0)
+            field = np.full(water.shape, np.nan, dtype=np.float32)
+            field[reached] = sound_intensity / lengths[reached] ** 2
+            field[ss_xyz[2], ss_xyz[1], ss_xyz[0]] = sound_intensity
+            results.put((factor, field))
+
+        pool = Pool.from_arrays(water.copy())
+        pool.add_sound_source(sound_intensity, *ss_xyz, enhanced_realism=enhanced_realism, mode=mode)
+        results.put((1, np.asarray(pool.intensity_field())))
+    except Exception:
+        results.put((None, traceback.format_exc()))
+
+
+class ProgressiveField:
+    """ Фоновое вычисление поля звука для водоема, в котором источник звука уже размещен (Pool.place_sound_source).
+
+    Отдельный процесс сначала вычисляет грубые поля по огрубленной маске воды (pyramid.coarse_path_lengths), затем
+    точное поле выбранным способом распространения звука. Метод poll() не блокирует вызывающий код и подставляет в
+    водоем самое точное из готовых полей, поэтому его можно вызывать в каждом кадре визуализации.
+
+    Attributes:
+        pool (Pool): водоем с хранением в массивах (storage='arrays' или 'columns')
+        factor (int|None): огрубление поля, подставленного в водоем; 1 - точное поле, None - поле еще не готово
+        done (bool): True, если точное поле подставлено в водоем
+
+    """
+
+    def __init__(self, pool, factors=(4, 2), mode='curves', enhanced_realism=True):
+        """ Инициализация и запуск фонового процесса
+
+        Args:
+            pool (Pool): водоем с размещенным источником звука
+            factors (tuple|list): огрубления грубых полей в порядке вычисления
+            mode (str): способ распространения звука для точного поля (см. Pool.add_sound_source)
+            enhanced_realism (bool): режим построения кривых для mode='curves'
+
+        Raises:
+            ValueError: если водоем хранит кубы как объекты или задан неизвестный режим распространения звука
+
+        """
+
+        assert pool.storage in ('arrays', 'columns'), ValueError('ProgressiveField requires storage "arrays" or "columns"')
+        assert mode in PROPAGATION_MODES, ValueError('Parameter "mode" must be one of ' + str(PROPAGATION_MODES))
+
+        self.pool = pool
+        self.factor = None
+        self.done = False
+
+        ss_xyz = (pool.sound_source.x_position, pool.sound_source.y_position, pool.sound_source.z_position)
+        water = np.array(pool.water_mask())
+        water[ss_xyz[2], ss_xyz[1], ss_xyz[0]] = True  # фоновый процесс размещает источник звука заново
+
+        self.results = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_progressive_worker, daemon=True,
+                                               args=(self.results, water, ss_xyz, pool.sound_source.sound_intensity,
+                                                     tuple(factors), mode, enhanced_realism))
+        self.process.start()
+
+    def poll(self):
+        """ Подставляет в водоем самое точное из готовых полей, не дожидаясь фонового процесса
+
+        Returns:
+            bool: True, если поле в водоеме обновилось
+
+        Raises:
+            RuntimeError: если в фоновом процессе произошла ошибка
+
+        """
+
+        latest = None
+        while not self.done:
+            try:
+                latest = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if latest[0] is None:
+                raise RuntimeError('Background field computation failed:\n' + latest[1])
+            if latest[0] == 1:
+                self.done = True
+        if latest is None:
+            return False
+
+        self.factor, field = latest
+        self.pool.set_intensity_field(field)
+        self.pool.navigation = None
+        if self.done:
+            self.process.join()
+        return True
+
+    def wait(self):
+        """ Блокирует до готовности точного поля и подставляет его в водоем """
+
+        while not self.done:
+            factor, field = self.results.get()
+            if factor is None:
+                raise RuntimeError('Background field computation failed:\n' + field)
+            self.factor = factor
+            self.done = factor == 1
+            self.pool.set_intensity_field(field)
+            self.pool.navigation = None
+        self.process.join()
+
+    def close(self):
+        """ Останавливает фоновый процесс, если он еще работает """
+
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
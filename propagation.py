@@ -0,0 +1,588 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+import sys
+from heapq import heapify, heappush, heappop
+from math import sqrt, inf
+from multiprocessing import Pool as ProcessPool
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from classes import NEIGHBOUR_OFFSETS, Pool, parallelepiped_dimensions, shortest_curve
+from terrain import load_heights
+
+
+def _padded_grid(water):
+    """ Обкладывает маску воды слоем ландшафта толщиной в один куб, чтобы при обходе соседей не проверять выход за
+    пределы водоема.
+
+    Args:
+        water (numpy.ndarray): маска воды с индексацией [z, y, x]
+
+    Returns:
+        tuple: (open_cells, steps, padded_shape) - плоский список проходимости кубов, список пар (смещение плоского
+        индекса, длина шага) для 26 соседей и форма расширенной маски
+
+    """
+
+    height, width, length = water.shape
+    padded = np.zeros((height + 2, width + 2, length + 2), dtype=bool)
+    padded[1:-1, 1:-1, 1:-1] = water
+
+    z_stride = (width + 2) * (length + 2)
+    y_stride = length + 2
+    steps = [(dz * z_stride + dy * y_stride + dx, sqrt(dx ** 2 + dy ** 2 + dz ** 2)) for dx, dy, dz in NEIGHBOUR_OFFSETS]
+    return padded.ravel().tolist(), steps, padded.shape
+
+
+def _flat_index(xyz, padded_shape):
+    """ Переводит координаты (x, y, z) водоема в плоский индекс расширенной маски. """
+
+    return ((xyz[2] + 1) * padded_shape[1] + xyz[1] + 1) * padded_shape[2] + xyz[0] + 1
+
+
+def wavefront_path_lengths(water, ss_xyz=None, initial=None):
+    """ Функция за один проход волнового фронта определяет длины кратчайших путей звука от источника до всех кубов
+    воды (алгоритм Дейкстры по 26 соседям с евклидовыми длинами шагов 1, sqrt(2) и sqrt(3)).
+
+    Звук огибает ландшафт, распространяясь только через кубы воды. Источник звука может не быть водой.
+
+    Args:
+        water (numpy.ndarray): маска воды с индексацией [z, y, x]
+        ss_xyz (tuple|list|None): координаты источника звука (sound source XYZ)
+        initial (numpy.ndarray|None): уже известные длины путей с индексацией [z, y, x] (inf - неизвестна); все
+            кубы с известной длиной становятся дополнительными источниками фронта
+
+    Returns:
+        numpy.ndarray: длины путей с индексацией [z, y, x]; inf для кубов, до которых звук не доходит
+
+    """
+
+    open_cells, steps, padded_shape = _padded_grid(water)
+    if initial is None:
+        distances = [inf] * len(open_cells)
+        front = []
+    else:
+        padded = np.full(padded_shape, inf)
+        padded[1:-1, 1:-1, 1:-1] = initial
+        distances = padded.ravel().tolist()
+        seeds = np.flatnonzero(np.isfinite(padded.ravel()))
+        front = list(zip(padded.ravel()[seeds].tolist(), seeds.tolist()))
+        heapify(front)
+
+    if ss_xyz is not None:
+        start = _flat_index(ss_xyz, padded_shape)
+        distances[start] = 0.0
+        heappush(front, (0.0, start))
+    while front:
+        distance, i = heappop(front)
+        if distance > distances[i]:
+            continue
+        for step, step_length in steps:
+            j = i + step
+            if open_cells[j]:
+                new_distance = distance + step_length
+                if new_distance < distances[j]:
+                    distances[j] = new_distance
+                    heappush(front, (new_distance, j))
+
+    return np.array(distances).reshape(padded_shape)[1:-1, 1:-1, 1:-1]
+
+
+def _path_length_between(open_cells, steps, start, stop):
+    """ Длина кратчайшего пути между двумя кубами расширенной маски (Дейкстра с остановкой при достижении stop). Куб
+    start может не быть водой. Возвращает inf, если stop недостижим. """
+
+    distances = {start: 0.0}
+    front = [(0.0, start)]
+    while front:
+        distance, i = heappop(front)
+        if i == stop:
+            return distance
+        if distance > distances[i]:
+            continue
+        for step, step_length in steps:
+            j = i + step
+            if open_cells[j]:
+                new_distance = distance + step_length
+                if new_distance < distances.get(j, inf):
+                    distances[j] = new_distance
+                    heappush(front, (new_distance, j))
+    return inf
+
+
+def moved_source_path_lengths(water, lengths, old_xyz, new_xyz, tolerance=1e-9):
+    """ Функция пересчитывает длины путей волнового фронта (wavefront_path_lengths) после перемещения источника звука,
+    раскрывая только кубы, длина пути до которых действительно изменилась.
+
+    Путь из нового положения источника через старое дает верхнюю оценку D + lengths, где D - длина пути между
+    положениями. Фронт запускается из нового положения поверх этой оценки и распространяется только по кубам, где он
+    ее улучшает; для остальных кубов кратчайший путь проходит через старое положение, и оценка точна. Поэтому при
+    небольшом смещении не раскрывается все "теневое" пространство за старым положением. Результат совпадает с
+    wavefront_path_lengths(water, new_xyz) с точностью до погрешности округления tolerance.
+
+    Args:
+        water (numpy.ndarray): маска воды с индексацией [z, y, x]
+        lengths (numpy.ndarray): длины путей от старого положения источника звука по той же маске воды
+        old_xyz (tuple|list): старые координаты источника звука
+        new_xyz (tuple|list): новые координаты источника звука
+        tolerance (float): улучшения оценки меньше tolerance не распространяются
+
+    Returns:
+        tuple: (длины путей от нового положения с индексацией [z, y, x], количество пересчитанных кубов)
+
+    """
+
+    open_cells, steps, padded_shape = _padded_grid(water)
+    old_start = _flat_index(old_xyz, padded_shape)
+    start = _flat_index(new_xyz, padded_shape)
+    # если старое положение не является водой, путей через него нет (inf), и фронт пересчитывает все кубы
+    shift = _path_length_between(open_cells, steps, start, old_start)
+
+    padded = np.full(padded_shape, inf)
+    padded[1:-1, 1:-1, 1:-1] = lengths
+    distances = (padded + shift).ravel().tolist()
+
+    distances[start] = 0.0
+    front = [(0.0, start)]
+    recomputed = 0
+    while front:
+        distance, i = heappop(front)
+        if distance > distances[i]:
+            continue
+        recomputed += 1
+        for step, step_length in steps:
+            j = i + step
+            if open_cells[j]:
+                new_distance = distance + step_length
+                if new_distance < distances[j] - tolerance:
+                    distances[j] = new_distance
+                    heappush(front, (new_distance, j))
+
+    return np.array(distances).reshape(padded_shape)[1:-1, 1:-1, 1:-1], recomputed
+
+
+def repair_path_lengths(water, lengths, ss_xyz, blocked=(), opened=(), tolerance=1e-9):
+    """ Функция восстанавливает длины путей волнового фронта (wavefront_path_lengths) после изменения ландшафта,
+    пересчитывая только кубы, длина пути до которых изменилась.
+
+    Сначала обрабатываются кубы, ставшие ландшафтом: в порядке возрастания длины пути отбрасываются кубы, у которых не
+    осталось ни одного соседа, через которого проходит кратчайший путь прежней длины. Затем фронт запускается из
+    границы отброшенной области и из кубов, ставших водой, и распространяется только там, где улучшает длины путей.
+    Результат совпадает с wavefront_path_lengths(water, ss_xyz) с точностью до погрешности округления tolerance.
+
+    Args:
+        water (numpy.ndarray): маска воды после изменения с индексацией [z, y, x]
+        lengths (numpy.ndarray): длины путей до изменения ландшафта
+        ss_xyz (tuple|list): координаты источника звука (sound source XYZ); источник может не быть водой
+        blocked (list|tuple): координаты (x, y, z) кубов, ставших ландшафтом
+        opened (list|tuple): координаты (x, y, z) кубов, ставших водой
+        tolerance (float): допустимая погрешность округления длин путей
+
+    Returns:
+        tuple: (длины путей с индексацией [z, y, x], количество пересчитанных кубов)
+
+    """
+
+    open_cells, steps, padded_shape = _padded_grid(water)
+    start = _flat_index(ss_xyz, padded_shape)
+    padded = np.full(padded_shape, inf)
+    padded[1:-1, 1:-1, 1:-1] = lengths
+    distances = padded.ravel().tolist()
+
+    # кубы, ставшие ландшафтом, и все кубы, кратчайшие пути до которых проходили только через них
+    invalid = set()
+    candidates = []
+    for xyz in blocked:
+        i = _flat_index(xyz, padded_shape)
+        if i == start:
+            continue  # источник звука может не быть водой и остается началом путей
+        invalid.add(i)
+        for step, step_length in steps:
+            if open_cells[i + step] and distances[i + step] > distances[i]:
+                heappush(candidates, (distances[i + step], i + step))
+        distances[i] = inf
+    while candidates:
+        distance, i = heappop(candidates)
+        if i in invalid or i == start:
+            continue
+        supported = False
+        for step, step_length in steps:
+            j = i + step
+            if (open_cells[j] or j == start) and j not in invalid and distances[j] + step_length <= distance + tolerance:
+                supported = True
+                break
+        if supported:
+            continue
+        invalid.add(i)
+        distances[i] = inf
+        for step, step_length in steps:
+            j = i + step
+            if open_cells[j] and j not in invalid and distances[j] > distance:
+                heappush(candidates, (distances[j], j))
+
+    # фронт из соседей отброшенной области и из кубов, ставших водой
+    front = []
+    for i in list(invalid) + [_flat_index(xyz, padded_shape) for xyz in opened]:
+        if not open_cells[i]:
+            continue
+        for step, step_length in steps:
+            j = i + step
+            if (open_cells[j] or j == start) and distances[j] + step_length < distances[i] - tolerance:
+                distances[i] = distances[j] + step_length
+        if distances[i] < inf:
+            heappush(front, (distances[i], i))
+
+    recomputed = len(invalid)
+    while front:
+        distance, i = heappop(front)
+        if distance > distances[i]:
+            continue
+        recomputed += 1
+        for step, step_length in steps:
+            j = i + step
+            if open_cells[j]:
+                new_distance = distance + step_length
+                if new_distance < distances[j] - tolerance:
+                    distances[j] = new_distance
+                    heappush(front, (new_distance, j))
+
+    return np.array(distances).reshape(padded_shape)[1:-1, 1:-1, 1:-1], recomputed
+
+
+def _eikonal_update(a, b, c):
+    """ Решает дискретное уравнение эйконала |grad T| = 1 с шагом сетки 1 для куба, у которого минимальные известные
+    значения соседей по трем осям равны a <= b <= c (inf - известного соседа по оси нет). """
+
+    distance = a + 1
+    if distance <= b:
+        return distance
+    distance = (a + b + sqrt(2 - (a - b) ** 2)) / 2
+    if distance <= c:
+        return distance
+    s = a + b + c
+    return (s + sqrt(s ** 2 - 3 * (a ** 2 + b ** 2 + c ** 2 - 1))) / 3
+
+
+def eikonal_path_lengths(water, ss_xyz):
+    """ Функция определяет гладкое геодезическое расстояние от источника звука до всех кубов воды вокруг препятствий,
+    решая уравнение эйконала методом быстрого продвижения (fast marching) первого порядка за O(N log N).
+
+    26 соседей источника получают точные евклидовы расстояния (1, sqrt(2), sqrt(3)), чтобы уменьшить ошибку
+    первого порядка возле точечного источника; далее фронт продвигается по 6 соседям вдоль осей.
+
+    Args:
+        water (numpy.ndarray): маска воды с индексацией [z, y, x]
+        ss_xyz (tuple|list): координаты источника звука (sound source XYZ)
+
+    Returns:
+        numpy.ndarray: длины путей с индексацией [z, y, x]; inf для кубов, до которых звук не доходит
+
+    """
+
+    open_cells, steps, padded_shape = _padded_grid(water)
+    axes = [abs(step) for step, step_length in steps[:6:2]]  # плоские смещения вдоль осей X, Z и Y
+    distances = [inf] * len(open_cells)
+    frozen = [False] * len(open_cells)
+
+    start = _flat_index(ss_xyz, padded_shape)
+    distances[start] = 0.0
+    frozen[start] = True
+    front = []
+    for step, step_length in steps:
+        j = start + step
+        if open_cells[j]:
+            distances[j] = step_length
+            frozen[j] = True
+    for step, step_length in steps:
+        if frozen[start + step]:
+            heappush(front, (distances[start + step], start + step))
+
+    while front:
+        distance, i = heappop(front)
+        if distance > distances[i]:
+            continue
+        frozen[i] = True
+        for axis in axes:
+            for j in (i - axis, i + axis):
+                if not open_cells[j] or frozen[j]:
+                    continue
+                # минимальные значения замороженных соседей вдоль каждой оси
+                known = []
+                for step in axes:
+                    value = inf
+                    if frozen[j - step]:
+                        value = distances[j - step]
+                    if frozen[j + step] and distances[j + step] < value:
+                        value = distances[j + step]
+                    known.append(value)
+                known.sort()
+                new_distance = _eikonal_update(*known)
+                if new_distance < distances[j]:
+                    distances[j] = new_distance
+                    heappush(front, (new_distance, j))
+
+    return np.array(distances).reshape(padded_shape)[1:-1, 1:-1, 1:-1]
+
+
+def _line_of_sight(open_cells, start, stop, strides, coordinates):
+    """ Проверяет прямую видимость между центрами двух кубов расширенной маски (3D-обход вокселей Amanatides-Woo).
+
+    Отрезок проходит через воксели в порядке пересечения их границ; если он пересекает ребро или вершину, шаг делается
+    сразу по нескольким осям, как шаг к диагональному соседу. Моменты пересечения границ сравниваются в целых числах,
+    поэтому результат не зависит от ошибок округления.
+
+    Args:
+        open_cells (list): плоский список проходимости кубов расширенной маски
+        start (int): плоский индекс начального куба (сам куб не проверяется)
+        stop (int): плоский индекс конечного куба
+        strides (tuple): смещения плоского индекса на один куб по осям X, Y, Z
+        coordinates (tuple): списки координат X, Y, Z по плоскому индексу
+
+    Returns:
+        bool: True, если все кубы на отрезке, кроме начального, проходимы
+
+    """
+
+    axes = []
+    for axis, stride in enumerate(strides):
+        delta = coordinates[axis][stop] - coordinates[axis][start]
+        if delta:
+            axes.append((abs(delta), stride if delta > 0 else -stride))
+    if not axes:
+        return True
+
+    # время t в долях отрезка хранится умноженным на 2 * product, чтобы моменты пересечения границ были целыми
+    product = 1
+    for delta, step in axes:
+        product *= delta
+    limit = 2 * product
+    crossings = [product // delta for delta, step in axes]
+    increments = [limit // delta for delta, step in axes]
+
+    i = start
+    while True:
+        t = min(crossings)
+        if t >= limit:
+            return True
+        for k in range(len(axes)):
+            if crossings[k] == t:
+                i += axes[k][1]
+                crossings[k] += increments[k]
+        if not open_cells[i]:
+            return False
+
+
+def visibility_path_lengths(water, ss_xyz):
+    """ Функция определяет длины кратчайших путей звука, огибающих ландшафт по прямым отрезкам (any-angle), от
+    источника до всех кубов воды.
+
+    Используется однократный проход Lazy Theta*: как и в волновом фронте, кубы раскрываются в порядке длины пути,
+    но путь до куба продолжает прямую от "родителя" - последней точки излома пути - если между ними есть прямая
+    видимость (_line_of_sight). Поэтому в открытой воде длина пути равна расстоянию по прямой, а у препятствий путь
+    изгибается в их вершинах, что гораздо ближе к истинной геодезической, чем пути по 26 соседям. Результат
+    детерминирован.
+
+    Args:
+        water (numpy.ndarray): маска воды с индексацией [z, y, x]
+        ss_xyz (tuple|list): координаты источника звука (sound source XYZ)
+
+    Returns:
+        numpy.ndarray: длины путей с индексацией [z, y, x]; inf для кубов, до которых звук не доходит
+
+    """
+
+    open_cells, steps, padded_shape = _padded_grid(water)
+    z_coordinates, y_coordinates, x_coordinates = (axis.ravel().tolist() for axis in np.indices(padded_shape))
+    coordinates = (x_coordinates, y_coordinates, z_coordinates)
+    strides = (1, padded_shape[2], padded_shape[1] * padded_shape[2])
+
+    start = _flat_index(ss_xyz, padded_shape)
+    open_cells[start] = True  # источник звука может не быть водой, но отрезки из него проходят
+    distances = [inf] * len(open_cells)
+    parents = [-1] * len(open_cells)
+    closed = [False] * len(open_cells)
+    distances[start] = 0.0
+    parents[start] = start
+    front = [(0.0, start)]
+
+    while front:
+        distance, i = heappop(front)
+        if closed[i] or distance > distances[i]:
+            continue
+        closed[i] = True
+        parent = parents[i]
+        if not _line_of_sight(open_cells, parent, i, strides, coordinates):
+            # путь через родителя оказался заслонен - выбираю лучшего раскрытого соседа, как в волновом фронте
+            distance = inf
+            for step, step_length in steps:
+                j = i + step
+                if closed[j] and j != i and distances[j] + step_length < distance:
+                    distance = distances[j] + step_length
+                    parent = j
+            distances[i] = distance
+            parents[i] = parent
+
+        parent_distance = distances[parent]
+        parent_x, parent_y, parent_z = x_coordinates[parent], y_coordinates[parent], z_coordinates[parent]
+        for step, step_length in steps:
+            j = i + step
+            if open_cells[j] and not closed[j]:
+                new_distance = parent_distance + sqrt((x_coordinates[j] - parent_x) ** 2 +
+                                                      (y_coordinates[j] - parent_y) ** 2 +
+                                                      (z_coordinates[j] - parent_z) ** 2)
+                if new_distance < distances[j]:
+                    distances[j] = new_distance
+                    parents[j] = parent
+                    heappush(front, (new_distance, j))
+
+    return np.array(distances).reshape(padded_shape)[1:-1, 1:-1, 1:-1]
+
+
+def compare_with_curves(pool, samples=200, enhanced_realism=True, seed=0):
+    """ Функция сравнивает длины путей, найденные для водоема одним из режимов, вычисляющих поле длин целиком
+    ('wavefront', 'eikonal', 'visibility'), с длинами жадных кривых функции shortest_curve() на случайной выборке
+    кубов воды.
+
+    Args:
+        pool (Pool): водоем с источником звука, добавленным в режиме 'wavefront', 'eikonal' или 'visibility'
+        samples (int): количество сравниваемых кубов воды
+        enhanced_realism (bool): режим построения жадных кривых shortest_curve()
+        seed (int|None): зерно генератора случайной выборки
+
+    Returns:
+        dict: количество сравненных кубов, среднее и максимальное абсолютное и относительное отклонение длин поля от
+        длин жадных кривых, а также средняя доля кубов, для которых поле дает более короткий путь
+
+    """
+
+    water = pool.water_mask()
+    ss_xyz = (pool.sound_source.x_position, pool.sound_source.y_position, pool.sound_source.z_position)
+    cells = np.argwhere(water & np.isfinite(pool.path_lengths))
+    rng = np.random.default_rng(seed)
+    cells = cells[rng.choice(len(cells), size=min(samples, len(cells)), replace=False)]
+
+    # жадные кривые строятся на отдельном водоеме без интенсивностей, использующем ту же маску воды
+    probe = Pool.from_arrays(water.copy())
+    prl_lw = parallelepiped_dimensions(water)
+    field_lengths = []
+    curve_lengths = []
+    for z_position, y_position, x_position in cells.tolist():
+        field_lengths.append(pool.path_lengths[z_position, y_position, x_position])
+        curve_lengths.append(shortest_curve(probe, ss_xyz, (x_position, y_position, z_position), prl_lw, enhanced_realism))
+
+    field_lengths = np.array(field_lengths)
+    curve_lengths = np.array(curve_lengths)
+    deviation = np.abs(field_lengths - curve_lengths)
+    return {'cells': len(cells),
+            'mean_abs': float(deviation.mean()),
+            'max_abs': float(deviation.max()),
+            'mean_rel': float((deviation / curve_lengths).mean()),
+            'max_rel': float((deviation / curve_lengths).max()),
+            'shorter': float((field_lengths < curve_lengths - 1e-9).mean())}
+
+
+# состояние рабочего процесса параллельного построения кривых: разделяемая память и водоем-проба на ее основе
+_worker_state = {}
+
+
+def _init_curves_worker(water_name, lengths_name, shape, ss_xyz, prl_lw, enhanced_realism):
+    """ Инициализация рабочего процесса: подключение к разделяемым маске воды и массиву длин кривых. """
+
+    water_memory = SharedMemory(name=water_name)
+    lengths_memory = SharedMemory(name=lengths_name)
+    water = np.ndarray(shape, dtype=bool, buffer=water_memory.buf)
+    _worker_state.update(water_memory=water_memory, lengths_memory=lengths_memory,
+                         lengths=np.ndarray(shape, dtype=np.float64, buffer=lengths_memory.buf),
+                         probe=Pool.from_arrays(water), ss_xyz=ss_xyz, prl_lw=prl_lw, enhanced_realism=enhanced_realism)
+
+
+def _curves_tile(tile):
+    """ Строит кривые shortest_curve() для всех кубов воды тайла (z, y_start, y_stop) и записывает их длины в
+    разделяемый массив. Возвращает тайл и счетчики shortest_curve() для отчета о прогрессе. """
+
+    z_position, y_start, y_stop = tile
+    probe = _worker_state['probe']
+    probe.instrumentation.reset()
+    lengths = _worker_state['lengths']
+    for y_position in range(y_start, y_stop):
+        for x_position in range(probe.length):
+            if probe.is_water(x_position, y_position, z_position) is True:
+                lengths[z_position, y_position, x_position] = shortest_curve(probe, _worker_state['ss_xyz'],
+                                                                             (x_position, y_position, z_position),
+                                                                             _worker_state['prl_lw'],
+                                                                             _worker_state['enhanced_realism'])
+    return tile, probe.instrumentation.counters
+
+
+def parallel_curve_path_lengths(water, ss_xyz, prl_lw, enhanced_realism=True, workers=2, instrumentation=None):
+    """ Функция строит кривые shortest_curve() для всех кубов воды параллельно в нескольких процессах.
+
+    Водоем делится на тайлы - полосы строк по оси Y внутри каждого слоя Z. Рабочие процессы читают общую копию маски
+    воды и записывают длины кривых в общий массив, размещенные в разделяемой памяти, поэтому данные водоема не
+    копируются в каждый процесс.
+
+    Args:
+        water (numpy.ndarray): маска воды с индексацией [z, y, x] (источник звука уже не является водой)
+        ss_xyz (tuple|list): координаты источника звука (sound source XYZ)
+        prl_lw (tuple|list): размеры параллелепипеда допущений (parallelepiped length, width)
+        enhanced_realism (bool): режим построения кривых shortest_curve()
+        workers (int): количество рабочих процессов
+        instrumentation (Instrumentation|None): получает прогресс по тайлам и счетчики shortest_curve() рабочих
+            процессов
+
+    Returns:
+        numpy.ndarray: длины кривых с индексацией [z, y, x]; inf для кубов, не являющихся водой
+
+    """
+
+    height, width, length = water.shape
+    # не меньше четырех тайлов на процесс, чтобы выровнять нагрузку между процессами
+    tiles_per_layer = -(-workers * 4 // height)
+    rows_per_tile = -(-width // tiles_per_layer)
+    tiles = [(z_position, y_start, min(y_start + rows_per_tile, width))
+             for z_position in range(height) for y_start in range(0, width, rows_per_tile)]
+
+    water_memory = SharedMemory(create=True, size=max(1, water.nbytes))
+    lengths_memory = SharedMemory(create=True, size=max(1, water.size * 8))
+    try:
+        np.ndarray(water.shape, dtype=bool, buffer=water_memory.buf)[:] = water
+        lengths = np.ndarray(water.shape, dtype=np.float64, buffer=lengths_memory.buf)
+        lengths[:] = inf
+
+        with ProcessPool(workers, initializer=_init_curves_worker,
+                         initargs=(water_memory.name, lengths_memory.name, water.shape, tuple(ss_xyz), tuple(prl_lw),
+                                   enhanced_realism)) as processes:
+            for completed, (tile, counters) in enumerate(processes.imap_unordered(_curves_tile, tiles), 1):
+                if instrumentation is not None:
+                    instrumentation.merge(counters)
+                    instrumentation.progress('intensity_computation', completed, len(tiles))
+
+        return lengths.copy()
+    finally:
+        water_memory.close()
+        water_memory.unlink()
+        lengths_memory.close()
+        lengths_memory.unlink()
+
+
+if __name__ == '__main__':
+    # сравнение режимов 'wavefront', 'eikonal' и 'visibility' с жадными кривыми:
+    #       python propagation.py [путь к карте высот] [количество кубов в выборке]
+    heightmap = sys.argv[1] if len(sys.argv) > 1 else 'Heightmaps/heightmap15.jpg'
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    height = int(load_heights(heightmap).max()) + 1
+
+    ss_xyz = None
+    for mode in ('wavefront', 'eikonal', 'visibility'):
+        pool = Pool(height, heightmap, storage='arrays')
+        if ss_xyz is None:
+            pool.add_sound_source(mode=mode)
+            ss_xyz = (pool.sound_source.x_position, pool.sound_source.y_position, pool.sound_source.z_position)
+        else:
+            pool.add_sound_source(x_position=ss_xyz[0], y_position=ss_xyz[1], z_position=ss_xyz[2], mode=mode)
+        for enhanced_realism in (True, False):
+            print(mode, 'vs curves (enhanced_realism=' + str(enhanced_realism) + '):',
+                  compare_with_curves(pool, samples, enhanced_realism))
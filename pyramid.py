@@ -0,0 +1,222 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+from itertools import product
+import numpy as np
+from classes import shortest_curve
+from propagation import wavefront_path_lengths
+
+
+def coarse_water(water, factor):
+    """ Огрубляет маску воды: блок factor x factor x factor кубов проходим, если в нем есть хотя бы один куб воды.
+
+    Args:
+        water (numpy.ndarray): маска воды с индексацией [z, y, x]
+        factor (int): во сколько раз огрубляется маска по каждой оси
+
+    Returns:
+        numpy.ndarray: огрубленная маска воды с индексацией [z, y, x]
+
+    """
+
+    height, width, length = water.shape
+    padded = np.zeros((-(-height // factor) * factor, -(-width // factor) * factor, -(-length // factor) * factor),
+                      dtype=bool)
+    padded[:height, :width, :length] = water
+    return padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor,
+                          padded.shape[2] // factor, factor).any(axis=(1, 3, 5))
+
+
+def interpolate_lengths(coarse, factor, shape):
+    """ Трилинейно интерполирует длины путей, определенные в центрах блоков, в центры кубов исходного водоема.
+
+    Недостижимые блоки (inf) не участвуют в интерполяции; если недостижимы все восемь ближайших блоков, длина пути
+    до куба тоже inf.
+
+    Args:
+        coarse (numpy.ndarray): длины путей по огрубленной маске с индексацией [z, y, x]
+        factor (int): огрубление
+        shape (tuple): форма исходного водоема (height, width, length)
+
+    Returns:
+        numpy.ndarray: длины путей float64 с индексацией [z, y, x] в единицах огрубленной маски
+
+    """
+
+    corners = []
+    for size, coarse_size in zip(shape, coarse.shape):
+        centre = (np.arange(size) + 0.5) / factor - 0.5  # положение центра куба в координатах блоков
+        low = np.floor(centre)
+        fraction = centre - low
+        low = low.astype(int)
+        corners.append(((np.clip(low, 0, coarse_size - 1), 1 - fraction),
+                        (np.clip(low + 1, 0, coarse_size - 1), fraction)))
+
+    total = np.zeros(shape)
+    weights = np.zeros(shape)
+    for (z, z_weight), (y, y_weight), (x, x_weight) in product(*corners):
+        values = coarse[np.ix_(z, y, x)]
+        weight = z_weight[:, None, None] * y_weight[None, :, None] * x_weight[None, None, :]
+        finite = np.isfinite(values)
+        total += np.where(finite, values * weight, 0)
+        weights += np.where(finite, weight, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(weights > 0, total / weights, np.inf)
+
+
+def coarse_path_lengths(water, ss_xyz, factor):
+    """ Приближенно определяет длины путей звука от источника до всех кубов воды по огрубленной маске воды.
+
+    По огрубленной маске (coarse_water) запускается волновой фронт (wavefront_path_lengths), длины путей до блоков
+    интерполируются в кубы (interpolate_lengths) и умножаются на factor, но берутся не меньше расстояния по прямой до
+    источника звука.
+
+    Args:
+        water (numpy.ndarray): маска воды с индексацией [z, y, x] (источник звука уже не является водой)
+        ss_xyz (tuple|list): координаты источника звука (sound source XYZ)
+        factor (int): во сколько раз огрубляется маска по каждой оси
+
+    Returns:
+        numpy.ndarray: длины путей float64 с индексацией [z, y, x]; inf для кубов, не являющихся водой или
+        недостижимых
+
+    """
+
+    coarse = coarse_water(water, factor)
+    coarse_source = tuple(c // factor for c in ss_xyz)
+    coarse[coarse_source[2], coarse_source[1], coarse_source[0]] = False
+    lengths = interpolate_lengths(wavefront_path_lengths(coarse, coarse_source), factor, water.shape) * factor
+
+    height, width, length = water.shape
+    z, y, x = np.ogrid[:height, :width, :length]
+    straight = np.sqrt((x - ss_xyz[0]) ** 2 + (y - ss_xyz[1]) ** 2 + (z - ss_xyz[2]) ** 2)
+    return np.where(water, np.maximum(lengths, straight), np.inf)
+
+
+class FieldPyramid:
+    """ Поле звука от грубого к точному для больших водоемов.
+
+    Сначала все кубы воды получают приближенные интенсивности по огрубленной маске воды (coarse_path_lengths). Затем
+    блоки factor x factor x factor кубов уточняются до точных значений режима 'curves' (shortest_curve() для каждого
+    куба воды блока) только там, где это нужно: вокруг источника звука, у препятствий и вдоль пути субмарин
+    (метод move). Значения уточненных кубов совпадают с полем Pool.add_sound_source(mode='curves'), поэтому маршрут
+    субмарины, для которого уточнены окрестности всех посещенных кубов, совпадает с маршрутом Submarine.move по
+    полностью вычисленному полю.
+
+    Attributes:
+        pool (Pool): водоем с размещенным источником звука (Pool.place_sound_source), storage='arrays' или 'columns'
+        factor (int): размер стороны блока в кубах
+        enhanced_realism (bool): режим построения кривых shortest_curve()
+        refined (numpy.ndarray): уточненные блоки, bool с индексацией [z, y, x]
+
+    """
+
+    def __init__(self, pool, factor=4, enhanced_realism=True, source_radius=1, refine_obstacles=False):
+        """ Инициализация: приближенное поле и уточнение вокруг источника звука
+
+        Args:
+            pool (Pool): водоем с размещенным источником звука
+            factor (int): размер стороны блока в кубах
+            enhanced_realism (bool): режим построения кривых shortest_curve()
+            source_radius (int): радиус в кубах вокруг источника звука, в котором блоки уточняются сразу
+            refine_obstacles (bool): если True, сразу уточняются все блоки, в которых есть и вода, и ландшафт
+
+        Raises:
+            ValueError: если водоем хранит кубы как объекты
+
+        """
+
+        assert pool.storage in ('arrays', 'columns'), ValueError('FieldPyramid requires storage "arrays" or "columns"')
+
+        self.pool = pool
+        self.factor = factor
+        self.enhanced_realism = enhanced_realism
+        self.ss_xyz = (pool.sound_source.x_position, pool.sound_source.y_position, pool.sound_source.z_position)
+        self.refined = np.zeros((-(-pool.height // factor), -(-pool.width // factor), -(-pool.length // factor)),
+                                dtype=bool)
+        self._prl_lw = None
+        pool.navigation = None
+
+        water = pool.water_mask()
+        with pool.instrumentation.phase('coarse_field'):
+            lengths = coarse_path_lengths(water, self.ss_xyz, factor)
+            reached = np.isfinite(lengths) & (lengths > 0)
+            pool.intensity[reached] = pool.sound_source.sound_intensity / lengths[reached] ** 2
+
+        self.refine_around(*self.ss_xyz, radius=source_radius)
+        if refine_obstacles:
+            mixed = coarse_water(water, factor) & coarse_water(~water, factor)
+            for z_block, y_block, x_block in np.argwhere(mixed).tolist():
+                self.refine_block(x_block, y_block, z_block)
+
+    def refine_block(self, x_block, y_block, z_block):
+        """ Уточняет интенсивности всех кубов воды блока до точных значений, если блок еще не уточнен """
+
+        if self.refined[z_block, y_block, x_block]:
+            return
+        self.refined[z_block, y_block, x_block] = True
+
+        pool = self.pool
+        if self._prl_lw is None:
+            with pool.instrumentation.phase('parallelepiped_scan'):
+                self._prl_lw = pool.terrain.parallelepiped_dimensions()
+
+        with pool.instrumentation.phase('refinement'):
+            for z_position in range(z_block * self.factor, min((z_block + 1) * self.factor, pool.height)):
+                for y_position in range(y_block * self.factor, min((y_block + 1) * self.factor, pool.width)):
+                    for x_position in range(x_block * self.factor, min((x_block + 1) * self.factor, pool.length)):
+                        if pool.is_water(x_position, y_position, z_position) is True:
+                            # shortest_curve() возвращает уже определенную интенсивность, поэтому приближенная стирается
+                            pool.intensity[z_position, y_position, x_position] = np.nan
+                            curve_length = shortest_curve(pool, self.ss_xyz, (x_position, y_position, z_position),
+                                                          self._prl_lw, self.enhanced_realism)
+                            pool.intensity[z_position, y_position, x_position] = \
+                                pool.sound_source.sound_intensity / (curve_length ** 2)
+        pool.instrumentation.count('refined_blocks')
+
+    def refine_around(self, x_position, y_position, z_position, radius=1):
+        """ Уточняет все блоки, в которые попадают кубы на расстоянии не больше radius от заданного по каждой оси """
+
+        for z_block in range(max(0, z_position - radius) // self.factor,
+                             min(self.pool.height - 1, z_position + radius) // self.factor + 1):
+            for y_block in range(max(0, y_position - radius) // self.factor,
+                                 min(self.pool.width - 1, y_position + radius) // self.factor + 1):
+                for x_block in range(max(0, x_position - radius) // self.factor,
+                                     min(self.pool.length - 1, x_position + radius) // self.factor + 1):
+                    self.refine_block(x_block, y_block, z_block)
+
+    def refined_fraction(self):
+        """ Возвращает долю уточненных блоков """
+
+        return float(self.refined.mean())
+
+    def move(self, submarine, metres=True):
+        """ Перемещает субмарину по правилам Submarine.move, перед каждым шагом уточняя блоки вокруг текущего куба,
+        так что субмарина сравнивает только точные интенсивности соседей
+
+        Args:
+            submarine (Submarine): субмарина в водоеме pool
+            metres (int|bool): метры для преодоления. Если True, то плывем до источника звука
+
+        Returns:
+            list: список координат всех кубов, в которых побывала субмарина, как у Submarine.move
+
+        """
+
+        assert (metres >= 1) or (metres is True), ValueError('Parameter "metres" must be greater integer than 0 or boolean True.')
+
+        positions = []
+        while True:
+            xyz = (submarine.x_position, submarine.y_position, submarine.z_position)
+            self.refine_around(*xyz)
+            positions.append(xyz)
+            submarine.move(1)
+            # субмарина осталась на месте - дошли до источника звука
+            if (submarine.x_position, submarine.y_position, submarine.z_position) == xyz:
+                return positions
+            if metres is not True:
+                metres -= 1
+                if not metres:
+                    return positions
@@ -0,0 +1,376 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+#  Локальный сервис симуляции: держит недавно использованные водоемы с вычисленными полями звука в памяти и отвечает
+#  на запросы путей субмарин и интенсивностей без повторного построения водоема.
+#       python service.py --socket /tmp/submarine.sock --max-mb 2048 --workers 2
+#       python service.py --port 8765
+#  Протокол: по одному JSON-объекту в строке в обе стороны; ответы на запросы одного соединения могут приходить не по
+#  порядку и сопоставляются по полю "id". Примеры запросов:
+#       {"id": 1, "op": "path", "heightmap": "Heightmaps/heightmap15.jpg", "source": [7, 7], "start": [1, 1, 60]}
+#       {"id": 2, "op": "intensity", "heightmap": "Heightmaps/heightmap15.jpg", "source": [7, 7], "points": [[1, 2, 60.5]]}
+#       {"id": 3, "op": "stats"}
+#  Необязательные поля водоема: "height", "mode" (по умолчанию "wavefront"), "sound_intensity", "enhanced_realism";
+#  пути: "metres", "strategy" (см. strategies.py; по умолчанию жадный подъем, как Submarine.move).
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from classes import Pool, PROPAGATION_MODES
+from instrumentation import Instrumentation
+from navigation import move_submarines
+from strategies import STATUS_NAMES, make_strategy
+from terrain import ColumnTerrain, load_heights
+
+
+def _build_field(heightmap, height, source, sound_intensity, mode, enhanced_realism, cache_directory=None):
+    """ Строит водоем и вычисляет поле звука в рабочем процессе
+
+    Returns:
+        tuple: (маска воды, интенсивности звука) с индексацией [z, y, x]
+
+    """
+
+    cache = None
+    if cache_directory is not None:
+        from field_cache import FieldCache
+
+        cache = FieldCache(cache_directory)
+    pool = Pool(height, heightmap, 'arrays', Instrumentation(quiet=True))
+    pool.add_sound_source(sound_intensity, *source, enhanced_realism=enhanced_realism, mode=mode, cache=cache)
+    return pool.water, np.asarray(pool.intensity_field())
+
+
+class SimulationService:
+    """ Сервис симуляции с "теплыми" водоемами.
+
+    Водоемы с вычисленными полями звука хранятся в памяти по ключу (карта высот, высота водоема, источник звука, режим)
+    и вытесняются давно не использованные (LRU), когда суммарный размер их массивов превышает max_bytes. Холодные
+    водоемы строятся в пуле процессов, поэтому не задерживают запросы к теплым; одновременные запросы к одному
+    строящемуся водоему ждут одного построения. Запросы путей жадным подъемом и интенсивностей, пришедшие к одному
+    водоему за один проход цикла событий, выполняются одним пакетом (navigation.move_submarines,
+    Pool.sample_intensity). Чтение карт высот для ключей запросов и поиск остальными стратегиями выполняются в потоках,
+    а не в цикле событий.
+
+    Attributes:
+        max_bytes (int): наибольший суммарный размер массивов теплых водоемов
+        statistics (dict): количество запросов, попаданий в теплые водоемы, построений и вытеснений
+
+    """
+
+    def __init__(self, max_bytes=1 << 30, workers=None, cache_directory=None, batch_delay=0.0):
+        """ Инициализация
+
+        Args:
+            max_bytes (int): наибольший суммарный размер массивов теплых водоемов
+            workers (int|None): количество процессов для построения водоемов и потоков для поиска стратегиями, кроме
+                жадного подъема; None - по количеству процессоров
+            cache_directory (str|None): каталог дискового кэша полей интенсивности (field_cache.FieldCache)
+            batch_delay (float): сколько секунд собирать пакет запросов к одному водоему; 0 - один проход цикла событий
+
+        """
+
+        self.max_bytes = max_bytes
+        self.cache_directory = cache_directory
+        self.batch_delay = batch_delay
+        self.executor = ProcessPoolExecutor(workers)
+        # один поток для ключей: кэш terrain.load_heights не рассчитан на одновременное изменение из нескольких потоков
+        self._key_thread = ThreadPoolExecutor(1)
+        self._search_threads = ThreadPoolExecutor(workers)
+        self.statistics = {'requests': 0, 'warm_hits': 0, 'builds': 0, 'evictions': 0, 'batches': 0}
+        self._pools = OrderedDict()  # теплые водоемы по ключу
+        self._building = {}  # строящиеся водоемы: ключ -> asyncio.Future
+        self._pending = {}  # пакеты запросов: (ключ, вид, параметр) -> список (аргументы, asyncio.Future)
+        self._server = None
+        self._connections = set()
+
+    def key(self, request):
+        """ Возвращает ключ водоема запроса: (карта высот, версия файла, высота, источник (x, y, z), интенсивность
+        источника, режим, enhanced_realism). Незаданная высота источника - дно, как в Pool.add_sound_source().
+
+        Raises:
+            ValueError: если в запросе не задана карта высот или источник звука, источник лежит вне водоема или задан
+                неизвестный режим
+
+        """
+
+        assert 'heightmap' in request and 'source' in request, \
+            ValueError('Requests must contain "heightmap" and "source" fields')
+        mode = request.get('mode', 'wavefront')
+        assert mode in PROPAGATION_MODES, ValueError('Parameter "mode" must be one of ' + str(PROPAGATION_MODES))
+
+        heightmap = os.path.abspath(request['heightmap'])
+        stat = os.stat(heightmap)
+        heights = load_heights(heightmap)
+        height = int(request.get('height') or heights.max() + 1)
+        assert len(request['source']) in (2, 3), ValueError('The source must be [x, y] or [x, y, z]')
+        x_position, y_position = (int(c) for c in request['source'][:2])
+        z_position = request['source'][2] if len(request['source']) > 2 else None
+        width, length = heights.shape
+        assert 0 <= x_position < length and 0 <= y_position < width and \
+            (z_position is None or 0 <= int(z_position) < height), ValueError('The source must lie inside the pool')
+        if z_position is None:
+            z_position = ColumnTerrain(heights, height).seabed(x_position, y_position)
+        return (heightmap, stat.st_mtime_ns, height, (x_position, y_position, int(z_position)),
+                float(request.get('sound_intensity', 1000)), mode, bool(request.get('enhanced_realism', True)))
+
+    async def pool(self, key):
+        """ Возвращает теплый водоем по ключу, при необходимости построив его в пуле процессов """
+
+        pool = self._pools.get(key)
+        if pool is not None:
+            self._pools.move_to_end(key)
+            self.statistics['warm_hits'] += 1
+            return pool
+
+        building = self._building.get(key)
+        if building is None:
+            building = asyncio.get_running_loop().create_future()
+            self._building[key] = building
+            asyncio.ensure_future(self._build(key, building))
+        return await asyncio.shield(building)
+
+    async def _build(self, key, building):
+        """ Строит водоем в пуле процессов и делает его теплым """
+
+        heightmap, version, height, source, sound_intensity, mode, enhanced_realism = key
+        try:
+            water, intensity = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _build_field, heightmap, height, source, sound_intensity, mode, enhanced_realism,
+                self.cache_directory)
+            pool = Pool.from_arrays(water, intensity)
+            pool.heightmap = heightmap
+            pool.sound_source = pool.filling[source[2]][source[1]][source[0]]
+            self.statistics['builds'] += 1
+            self._pools[key] = pool
+            self._evict()
+            building.set_result(pool)
+        except Exception as error:
+            building.set_exception(error)
+        finally:
+            del self._building[key]
+
+    def warm_bytes(self):
+        """ Возвращает суммарный размер массивов теплых водоемов """
+
+        return sum(pool.water.nbytes + pool.intensity.nbytes for pool in self._pools.values())
+
+    def _evict(self):
+        """ Вытесняет давно не использованные водоемы, пока размер превышает max_bytes (последний остается) """
+
+        while len(self._pools) > 1 and self.warm_bytes() > self.max_bytes:
+            self._pools.popitem(last=False)
+            self.statistics['evictions'] += 1
+
+    def _enqueue(self, key, kind, parameter, pool, arguments):
+        """ Добавляет запрос в пакет запросов к водоему и возвращает asyncio.Future его результата """
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch_key = (key, kind, parameter)
+        if batch_key not in self._pending:
+            self._pending[batch_key] = []
+            if self.batch_delay > 0:
+                loop.call_later(self.batch_delay, self._flush, batch_key, pool)
+            else:
+                loop.call_soon(self._flush, batch_key, pool)
+        self._pending[batch_key].append((arguments, future))
+        return future
+
+    def _flush(self, batch_key, pool):
+        """ Выполняет пакет запросов к одному водоему одной операцией NumPy """
+
+        batch = self._pending.pop(batch_key)
+        key, kind, parameter = batch_key
+        self.statistics['batches'] += 1
+        try:
+            if kind == 'path':
+                result = move_submarines(pool, [arguments for arguments, future in batch], parameter, paths=True)
+                for i, (arguments, future) in enumerate(batch):
+                    positions = result['paths'][result['path_offsets'][i]:result['path_offsets'][i + 1]].tolist()
+                    future.set_result({'positions': positions, 'end': result['endpoints'][i].tolist(),
+                                       'status': STATUS_NAMES[int(result['status'][i])],
+                                       'steps': int(result['steps'][i])})
+            else:
+                counts = [len(arguments) for arguments, future in batch]
+                values = pool.sample_intensity(np.concatenate([arguments for arguments, future in batch]))
+                for (arguments, future), part in zip(batch, np.split(values, np.cumsum(counts)[:-1])):
+                    future.set_result({'values': [None if value != value else value for value in part.tolist()]})
+        except Exception as error:
+            for arguments, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+
+    async def handle(self, request):
+        """ Отвечает на один запрос ('path', 'intensity' или 'stats')
+
+        Returns:
+            dict: {'id': ..., 'ok': True, 'result': ...} или {'id': ..., 'ok': False, 'error': текст ошибки}
+
+        """
+
+        self.statistics['requests'] += 1
+        try:
+            op = request.get('op')
+            if op == 'stats':
+                result = dict(self.statistics, warm_pools=len(self._pools), warm_bytes=self.warm_bytes(),
+                              building=len(self._building))
+            elif op in ('path', 'intensity'):
+                loop = asyncio.get_running_loop()
+                key = await loop.run_in_executor(self._key_thread, self.key, request)
+                pool = await self.pool(key)
+                if op == 'intensity':
+                    points = np.asarray(request['points'], dtype=np.float64).reshape(-1, 3)
+                    result = await self._enqueue(key, 'intensity', None, pool, points)
+                else:
+                    start = tuple(int(c) for c in request['start'])
+                    assert all(0 <= c < size for c, size in zip(start, (pool.length, pool.width, pool.height))), \
+                        ValueError('The start position must lie inside the pool')
+                    metres = request.get('metres') or True
+                    strategy = request.get('strategy', 'greedy')
+                    if strategy == 'greedy':
+                        result = await self._enqueue(key, 'path', metres, pool, start)
+                    else:
+                        search = await loop.run_in_executor(self._search_threads, make_strategy(strategy).search,
+                                                            pool, start, metres)
+                        result = {'positions': [list(xyz) for xyz in search['positions']], 'end': list(search['end']),
+                                  'status': STATUS_NAMES[search['status']], 'steps': search['steps'],
+                                  'queries': search['queries']}
+            else:
+                raise ValueError('Unknown operation ' + repr(op) + '; expected "path", "intensity" or "stats"')
+            return {'id': request.get('id'), 'ok': True, 'result': result}
+        except Exception as error:
+            # ValueError в проверках передается как аргумент AssertionError
+            message = error.args[0] if isinstance(error, AssertionError) and error.args else error
+            return {'id': request.get('id'), 'ok': False, 'error': str(message)}
+
+    async def _respond(self, line, writer, lock):
+        """ Отвечает на строку запроса, не задерживая остальные запросы соединения """
+
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            response = {'id': None, 'ok': False, 'error': 'Invalid JSON: ' + str(error)}
+        else:
+            response = await self.handle(request)
+        async with lock:
+            writer.write((json.dumps(response) + '\n').encode())
+            await writer.drain()
+
+    async def _connection(self, reader, writer):
+        """ Обслуживает одно соединение: каждая строка - отдельный запрос, выполняемый параллельно с остальными """
+
+        lock = asyncio.Lock()
+        tasks = set()
+        connection = asyncio.current_task()
+        self._connections.add(connection)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(self._respond(line, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            pass  # сервер остановлен (close), соединение закрывается без ответа на оставшиеся запросы
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+
+    async def start(self, socket_path=None, host='127.0.0.1', port=None):
+        """ Запускает сервер на сокете Unix socket_path или на TCP-порту port """
+
+        assert (socket_path is None) != (port is None), ValueError('Exactly one of "socket_path" and "port" must be set')
+        if socket_path is not None:
+            self._server = await asyncio.start_unix_server(self._connection, socket_path)
+        else:
+            self._server = await asyncio.start_server(self._connection, host, port)
+        return self._server
+
+    async def close(self):
+        """ Останавливает сервер, пул процессов и потоки """
+
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for connection in list(self._connections):
+            connection.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        self.executor.shutdown()
+        self._key_thread.shutdown()
+        self._search_threads.shutdown()
+
+
+async def query(requests, socket_path=None, host='127.0.0.1', port=None):
+    """ Клиент: отправляет запросы по одному соединению и возвращает ответы в порядке запросов
+
+    Args:
+        requests (list): запросы - словари; поле 'id' задается автоматически
+        socket_path (str|None): сокет Unix сервиса
+        host (str): адрес сервиса для TCP
+        port (int|None): TCP-порт сервиса
+
+    Returns:
+        list: ответы сервиса
+
+    """
+
+    if socket_path is not None:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for i, request in enumerate(requests):
+            writer.write((json.dumps(dict(request, id=i)) + '\n').encode())
+        await writer.drain()
+        responses = {}
+        while len(responses) < len(requests):
+            response = json.loads(await reader.readline())
+            responses[response['id']] = response
+        return [responses[i] for i in range(len(requests))]
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve submarine path and intensity queries from warm pools.')
+    parser.add_argument('--socket', help='Unix socket path')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help='TCP port (instead of --socket)')
+    parser.add_argument('--max-mb', type=float, default=1024, help='memory budget for warm pools, MiB')
+    parser.add_argument('--workers', type=int, help='processes for cold pool builds (default: CPU count)')
+    parser.add_argument('--cache', help='intensity field cache directory')
+    parser.add_argument('--batch-delay', type=float, default=0.0, help='seconds to collect a batch of queries')
+    args = parser.parse_args(argv)
+    if (args.socket is None) == (args.port is None):
+        parser.error('exactly one of --socket and --port is required')
+
+    async def serve():
+        service = SimulationService(int(args.max_mb * (1 << 20)), args.workers, args.cache, args.batch_delay)
+        server = await service.start(args.socket, args.host, args.port)
+        print('Serving on', args.socket or (args.host + ':' + str(args.port)), flush=True)
+        try:
+            await server.serve_forever()
+        finally:
+            await service.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+#  Симуляция без графического интерфейса: водоем, источник звука и субмарины, результат - JSON и массивы NumPy.
+#       python simulate.py Heightmaps/heightmap15.jpg --submarines 10 --output result.json
+#       python simulate.py Heightmaps/heightmap15.jpg --mode curves --no-paths --arrays result.npz
+#  Модуль не импортирует ursina и matplotlib и может использоваться как библиотека (функция simulate).
+
+import sys
+import json
+import random
+import argparse
+import numpy as np
+from classes import Pool, PROPAGATION_MODES
+from instrumentation import Instrumentation
+from terrain import load_heights
+
+
+def simulate(heightmap, height=None, storage='arrays', mode='wavefront', sound_intensity=1000, source=(None, None, None),
+             enhanced_realism=True, submarines=1, starts=None, metres=True, navigation=True, workers=None,
+             cache=None, seed=None, instrumentation=None):
+    """ Строит водоем, добавляет источник звука и проводит субмарины к источнику
+
+    Args:
+        heightmap (str): расположение карты высот
+        height (int|None): высота водоема; если не задана - на 1 больше самой высокой точки ландшафта
+        storage (str): способ хранения кубов водоема (см. Pool)
+        mode (str): способ распространения звука (см. Pool.add_sound_source)
+        sound_intensity (float|int): интенсивность источника звука
+        source (tuple|list): координаты источника звука (x, y, z); None - случайная координата (z - дно)
+        enhanced_realism (bool): режим построения кривых для mode='curves'
+        submarines (int): количество субмарин на случайных координатах; не используется, если заданы starts
+        starts (list|None): стартовые координаты субмарин [(x, y, z), ...]; z может быть None
+        metres (int|bool): метры для преодоления каждой субмариной (см. Submarine.move)
+        navigation (bool): если True, субмарины перемещаются по предвычисленному полю переходов
+            (Pool.precompute_navigation) и гарантированно останавливаются в локальных максимумах
+        workers (int|None): количество процессов для mode='curves'
+        cache (FieldCache|None): дисковый кэш полей интенсивности
+        seed (int|None): зерно генератора случайных координат
+        instrumentation (Instrumentation|None): сбор сведений о вычислениях; по умолчанию тихий
+
+    Returns:
+        tuple: (pool, result) - водоем и словарь результатов, пригодный для сериализации в JSON
+
+    """
+
+    if seed is not None:
+        random.seed(seed)
+    if height is None:
+        height = int(load_heights(heightmap).max()) + 1
+    if instrumentation is None:
+        instrumentation = Instrumentation(quiet=True)
+
+    pool = Pool(height, heightmap, storage, instrumentation)
+    pool.add_sound_source(sound_intensity, *source, enhanced_realism=enhanced_realism, mode=mode, workers=workers,
+                          cache=cache)
+    if navigation:
+        pool.precompute_navigation()
+
+    if starts is None:
+        starts = [(None, None, None)] * submarines
+    ss_xyz = (pool.sound_source.x_position, pool.sound_source.y_position, pool.sound_source.z_position)
+    paths = []
+    for start in starts:
+        pool.add_submarine(*start)
+        submarine = pool.submarine
+        path = submarine.move(metres)
+        end = (submarine.x_position, submarine.y_position, submarine.z_position)
+        # путь содержит куб остановки, только если субмарина остановилась; если закончились метры, последний
+        # достигнутый куб в путь не входит
+        steps = len(path) - 1 if tuple(path[-1]) == end else len(path)
+        paths.append({'start': list(path[0]), 'end': list(end), 'steps': steps,
+                      'reached_source': max(abs(a - b) for a, b in zip(end, ss_xyz)) <= 1,
+                      'path': [list(xyz) for xyz in path]})
+
+    field = np.asarray(pool.intensity_field())
+    defined = np.isfinite(field)
+    result = {'pool': {'heightmap': heightmap, 'height': pool.height, 'width': pool.width, 'length': pool.length,
+                       'storage': storage, 'water_cells': int(pool.water_mask().sum())},
+              'source': {'position': list(ss_xyz), 'sound_intensity': sound_intensity, 'mode': mode,
+                         'enhanced_realism': enhanced_realism},
+              'field': {'defined_cells': int(defined.sum()),
+                        'min': float(field[defined].min()) if defined.any() else None,
+                        'max': float(field[defined].max()) if defined.any() else None,
+                        'mean': float(field[defined].mean()) if defined.any() else None},
+              'submarines': paths,
+              'statistics': {'submarines': len(paths),
+                             'reached_source': sum(path['reached_source'] for path in paths),
+                             'mean_steps': sum(path['steps'] for path in paths) / len(paths) if paths else None},
+              'instrumentation': instrumentation.report()}
+    return pool, result
+
+
+def save_arrays(path, pool, result):
+    """ Сохраняет поле интенсивности и пути субмарин в файл .npz
+
+    Пути хранятся сплошным массивом координат paths формы (n, 3) и смещениями path_offsets: путь субмарины i -
+    paths[path_offsets[i]:path_offsets[i + 1]].
+
+    """
+
+    lengths = [len(submarine['path']) for submarine in result['submarines']]
+    coordinates = [xyz for submarine in result['submarines'] for xyz in submarine['path']]
+    np.savez(path, intensity=np.asarray(pool.intensity_field()),
+             paths=np.array(coordinates, dtype=np.int32).reshape(-1, 3),
+             path_offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+             sound_source=np.array(result['source']['position'], dtype=np.int32))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a headless sound source search simulation.')
+    parser.add_argument('heightmap', help='heightmap image')
+    parser.add_argument('--height', type=int, help='pool height (default: highest terrain point + 1)')
+    parser.add_argument('--storage', default='arrays', choices=['objects', 'arrays', 'columns'])
+    parser.add_argument('--mode', default='wavefront', choices=PROPAGATION_MODES)
+    parser.add_argument('--intensity', type=float, default=1000, help='sound source intensity')
+    parser.add_argument('--source', type=int, nargs=3, metavar=('X', 'Y', 'Z'), help='sound source position')
+    parser.add_argument('--simple-curves', action='store_true', help='enhanced_realism=False for mode "curves"')
+    parser.add_argument('--submarines', type=int, default=1, help='submarines at random positions')
+    parser.add_argument('--start', type=int, nargs=3, action='append', metavar=('X', 'Y', 'Z'),
+                        help='submarine start position (repeatable; replaces --submarines)')
+    parser.add_argument('--metres', type=int, help='metres for each submarine (default: until it stops)')
+    parser.add_argument('--no-navigation', action='store_true',
+                        help='move with Submarine.move neighbour comparison instead of the precomputed navigation '
+                             'field (may never stop at local maxima)')
+    parser.add_argument('--workers', type=int, help='worker processes for mode "curves"')
+    parser.add_argument('--cache', help='intensity field cache directory')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--no-paths', action='store_true', help='omit full paths from the JSON output')
+    parser.add_argument('--output', help='JSON output file (default: stdout)')
+    parser.add_argument('--arrays', help='also save the intensity field and paths to this .npz file')
+    parser.add_argument('--progress', action='store_true', help='print progress to stderr')
+    args = parser.parse_args(argv)
+
+    cache = None
+    if args.cache:
+        from field_cache import FieldCache
+
+        cache = FieldCache(args.cache)
+
+    if args.progress:
+        instrumentation = Instrumentation(progress=lambda phase, completed, total: print(phase, completed, total,
+                                                                                          file=sys.stderr),
+                                          messages=lambda text: print(text, file=sys.stderr))
+    else:
+        instrumentation = Instrumentation(quiet=True)
+
+    pool, result = simulate(args.heightmap, args.height, args.storage, args.mode, args.intensity,
+                            tuple(args.source) if args.source else (None, None, None), not args.simple_curves,
+                            args.submarines, [tuple(start) for start in args.start] if args.start else None,
+                            True if args.metres is None else args.metres, not args.no_navigation, args.workers, cache,
+                            args.seed, instrumentation)
+
+    if args.arrays:
+        save_arrays(args.arrays, pool, result)
+    if args.no_paths:
+        for submarine in result['submarines']:
+            del submarine['path']
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent=1)
+    else:
+        json.dump(result, sys.stdout, indent=1)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+from collections import OrderedDict
+import numpy as np
+from propagation import (wavefront_path_lengths, eikonal_path_lengths, visibility_path_lengths,
+                         moved_source_path_lengths, repair_path_lengths)
+
+# способы распространения звука, для которых поле длин путей вычисляется целиком (см. Pool.add_sound_source)
+FIELD_MODES = {'wavefront': wavefront_path_lengths, 'eikonal': eikonal_path_lengths,
+               'visibility': visibility_path_lengths}
+
+
+class SoundSources:
+    """ Несколько одновременно звучащих источников звука в водоеме.
+
+    Интенсивности источников складываются (суперпозиция): в кубе воды интенсивность равна сумме
+    sound_intensity / length ** 2 по всем источникам, до которых есть путь, а в кубе самого источника его вклад равен
+    sound_intensity. В отличие от Pool.add_sound_source(), источники не заменяют кубы воды и не мешают друг другу, поэтому
+    поле длин путей каждого источника зависит только от его положения и вычисляется отдельно.
+
+    Поля длин путей запоминаются по положению источника в ограниченном кэше (LRU), так что источник, вернувшийся в
+    прежнее положение, и источники в одном кубе не вычисляются заново. При перемещении источника (move) пересчитывается
+    только его поле, а сумма интенсивностей обновляется вычитанием старого вклада и прибавлением нового. В режиме
+    'wavefront' поле перемещенного источника пересчитывается из прежнего (propagation.moved_source_path_lengths):
+    волновой фронт раскрывает только кубы, кратчайший путь до которых не проходит через старое положение.
+
+    Изменения ландшафта водоема (Pool.edit_terrain, set_box, set_heights) передаются в repair().
+
+    Attributes:
+        pool (Pool): водоем с хранением в массивах (storage='arrays' или 'columns'); его интенсивности звука заменяются
+            суммарным полем после каждого изменения источников
+        mode (str): способ распространения звука - один из FIELD_MODES
+        capacity (int): наибольшее количество запоминаемых полей длин путей
+        positions (dict): координаты (x, y, z) источников по их номерам
+        intensities (dict): интенсивности источников по их номерам
+
+    """
+
+    def __init__(self, pool, mode='wavefront', capacity=16):
+        """ Инициализация: водоем без источников, интенсивность во всех кубах не определена
+
+        Args:
+            pool (Pool): водоем с хранением в массивах
+            mode (str): способ распространения звука - 'wavefront', 'eikonal' или 'visibility'
+            capacity (int): наибольшее количество запоминаемых полей длин путей
+
+        Raises:
+            ValueError: если водоем хранит кубы как объекты, уже содержит источник звука Pool.add_sound_source(),
+                задан неизвестный режим или capacity меньше 1
+
+        """
+
+        assert pool.storage in ('arrays', 'columns'), ValueError('SoundSources requires storage "arrays" or "columns"')
+        assert mode in FIELD_MODES, ValueError('Parameter "mode" must be one of ' + str(tuple(FIELD_MODES)))
+        assert pool.propagation is None, ValueError('The pool already has a sound source (Pool.add_sound_source)')
+        assert capacity >= 1, ValueError('Parameter "capacity" must be a positive integer')
+
+        self.pool = pool
+        self.mode = mode
+        self.capacity = capacity
+        self.positions = {}
+        self.intensities = {}
+        self._lengths = {}
+        self._fields = OrderedDict()
+        self._next = 0
+        self._water = pool.water_mask()
+
+        shape = (pool.height, pool.width, pool.length)
+        self._total = np.zeros(shape)  # сумма вкладов источников
+        self._reached = np.zeros(shape, dtype=np.int32)  # количество источников, до которых есть путь
+        pool.sound_sources = self
+        self._publish()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _field(self, xyz, previous=None):
+        """ Возвращает поле длин путей источника в кубе xyz из кэша или вычисляет его; previous - (координаты,
+        длины путей) того же источника до перемещения, из которых поле пересчитывается в режиме 'wavefront' """
+
+        instrumentation = self.pool.instrumentation
+        lengths = self._fields.get(xyz)
+        if lengths is not None:
+            self._fields.move_to_end(xyz)
+            instrumentation.count('source_field_hits')
+            return lengths
+
+        with instrumentation.phase('intensity_computation'):
+            if self.mode == 'wavefront' and previous is not None:
+                lengths, recomputed = moved_source_path_lengths(self._water, previous[1], previous[0], xyz)
+            else:
+                lengths = FIELD_MODES[self.mode](self._water, xyz)
+                recomputed = int(self._water.sum())
+        instrumentation.count('source_field_misses')
+        instrumentation.count('recomputed_cubes', recomputed)
+
+        self._fields[xyz] = lengths
+        if len(self._fields) > self.capacity:
+            self._fields.popitem(last=False)
+        return lengths
+
+    def _superpose(self, lengths, sound_intensity, sign):
+        """ Прибавляет (sign=1) или вычитает (sign=-1) вклад источника в суммарное поле """
+
+        reached = self._water & np.isfinite(lengths)
+        with np.errstate(divide='ignore'):
+            contribution = np.where(lengths > 0, sound_intensity / lengths ** 2, sound_intensity)
+        self._total[reached] += sign * contribution[reached]
+        self._reached[reached] += sign
+
+    def _publish(self):
+        """ Заменяет интенсивности водоема суммарным полем """
+
+        with self.pool.instrumentation.phase('superposition'):
+            field = np.where(self._reached > 0, self._total, np.nan).astype(np.float32)
+        self.pool.set_intensity_field(field)
+        self.pool.navigation = None  # поле переходов построено по прежним интенсивностям
+
+    def add(self, sound_intensity=1000, x_position=None, y_position=None, z_position=None):
+        """ Добавляет источник звука. Координаты определяются по правилам Pool.add_sound_source(): незаданные X и Y
+        выбираются случайно, по умолчанию источник лежит на дне.
+
+        Args:
+            sound_intensity (float|int): сила (интенсивность) звука источника
+            x_position (int|None): координата источника звука по оси X
+            y_position (int|None): координата источника звука по оси Y
+            z_position (int|None): координата источника звука по оси Z
+
+        Returns:
+            int: номер источника для move() и remove()
+
+        """
+
+        xyz = self.pool.source_position(x_position, y_position, z_position)
+        index = self._next
+        self._next += 1
+
+        self.positions[index] = xyz
+        self.intensities[index] = sound_intensity
+        self._lengths[index] = self._field(xyz)
+        self._superpose(self._lengths[index], sound_intensity, 1)
+        self._publish()
+        return index
+
+    def move(self, index, x_position=None, y_position=None, z_position=None):
+        """ Перемещает источник звука и обновляет суммарное поле. Координаты определяются как в add().
+
+        Returns:
+            tuple: новые координаты (x, y, z) источника
+
+        Raises:
+            KeyError: если источника с таким номером нет
+
+        """
+
+        old_xyz = self.positions[index]
+        xyz = self.pool.source_position(x_position, y_position, z_position)
+        if xyz == old_xyz:
+            return xyz
+
+        lengths = self._field(xyz, (old_xyz, self._lengths[index]))
+        self._superpose(self._lengths[index], self.intensities[index], -1)
+        self._superpose(lengths, self.intensities[index], 1)
+        self.positions[index] = xyz
+        self._lengths[index] = lengths
+        self._publish()
+        return xyz
+
+    def remove(self, index):
+        """ Удаляет источник звука и его вклад из суммарного поля
+
+        Raises:
+            KeyError: если источника с таким номером нет
+
+        """
+
+        self._superpose(self._lengths.pop(index), self.intensities.pop(index), -1)
+        del self.positions[index]
+        if not self.positions:
+            # без источников сумма точно равна нулю, накопленные погрешности вычитаний отбрасываются
+            self._total[:] = 0
+        self._publish()
+
+    def repair(self, blocked, opened):
+        """ Восстанавливает поля всех источников и суммарное поле после изменения ландшафта водоема. В режиме
+        'wavefront' поля восстанавливаются только там, где изменились (propagation.repair_path_lengths), в остальных
+        режимах вычисляются заново. Запомненные поля прежних положений источников забываются.
+
+        Args:
+            blocked (list): координаты (x, y, z) кубов, ставших ландшафтом
+            opened (list): координаты (x, y, z) кубов, ставших водой
+
+        """
+
+        instrumentation = self.pool.instrumentation
+        self._water = self.pool.water_mask()
+        self._fields.clear()
+        self._total[:] = 0
+        self._reached[:] = 0
+
+        repaired = {}
+        for index, xyz in self.positions.items():
+            if xyz not in repaired:
+                if self.mode == 'wavefront':
+                    with instrumentation.phase('field_repair'):
+                        repaired[xyz], recomputed = repair_path_lengths(self._water, self._lengths[index], xyz, blocked,
+                                                                        opened)
+                    instrumentation.count('recomputed_cubes', recomputed)
+                else:
+                    with instrumentation.phase('intensity_computation'):
+                        repaired[xyz] = FIELD_MODES[self.mode](self._water, xyz)
+                self._fields[xyz] = repaired[xyz]
+            self._lengths[index] = repaired[xyz]
+            self._superpose(repaired[xyz], self.intensities[index], 1)
+        self._publish()
+
+    def path_lengths(self, index):
+        """ Возвращает поле длин путей источника с индексацией [z, y, x]; inf - куб недостижим """
+
+        return self._lengths[index]
+
+
+if __name__ == '__main__':
+    # дрейфующий маяк: пересчет поля при перемещениях в сравнении с полным вычислением
+    #       python sources.py [путь к карте высот] [количество шагов]
+    import sys
+    import time
+    from classes import Pool
+    from instrumentation import Instrumentation
+    from terrain import load_heights
+
+    heightmap = sys.argv[1] if len(sys.argv) > 1 else 'Heightmaps/heightmap15.jpg'
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    heights = load_heights(heightmap)
+    pool = Pool(int(heights.max()) + 1, heightmap, 'arrays', Instrumentation(quiet=True))
+    sources = SoundSources(pool)
+    sources.add(1000, 0, 0)
+    beacon = sources.add(500, pool.length // 2, pool.width // 2)
+
+    started = time.perf_counter()
+    for step in range(steps):
+        x_position, y_position, z_position = sources.positions[beacon]
+        sources.move(beacon, min(x_position + 1, pool.length - 1), y_position)
+    elapsed = time.perf_counter() - started
+
+    expected = np.zeros(pool.intensity.shape)
+    for index, xyz in sources.positions.items():
+        lengths = wavefront_path_lengths(pool.water_mask(), xyz)
+        with np.errstate(divide='ignore'):
+            expected += np.where(lengths > 0, sources.intensities[index] / lengths ** 2, sources.intensities[index])
+    expected = np.where(pool.water_mask(), expected, np.nan)
+
+    print('Steps:', steps, 'time:', round(elapsed, 3), 's, counters:', pool.instrumentation.counters)
+    print('Max relative deviation from full recompute:',
+          float(np.nanmax(np.abs(pool.intensity - expected) / expected)))
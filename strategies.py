@@ -0,0 +1,428 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+#  Сравнение стратегий поиска источника звука на случайных стартах:
+#       python strategies.py [путь к карте высот] [количество стартов] [режим распространения звука]
+
+import time
+from abc import ABC, abstractmethod
+from math import sqrt, inf
+from heapq import heappush, heappop
+from collections import deque
+import numpy as np
+from classes import NEIGHBOUR_OFFSETS
+from navigation import MOVING, ARRIVED, CYCLED, NO_NEIGHBOURS
+
+GAVE_UP = 4  # стратегия исчерпала собственный бюджет (терпение или количество раскрытых кубов), не остановившись
+STATUS_NAMES = {MOVING: 'moving', ARRIVED: 'arrived', CYCLED: 'cycled', NO_NEIGHBOURS: 'no_neighbours',
+                GAVE_UP: 'gave_up'}
+
+# единичные направления к 26 соседям в порядке NEIGHBOUR_OFFSETS
+_DIRECTIONS = np.array(NEIGHBOUR_OFFSETS, dtype=float) / np.linalg.norm(NEIGHBOUR_OFFSETS, axis=1)[:, None]
+
+
+class _Probe:
+    """ Чтение интенсивностей звука водоема по одному кубу с подсчетом обращений. Работает для всех способов
+    хранения, в том числе для ленивого поля (lazy_field.LazyIntensity), которое вычисляет только прочитанные кубы. """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.queries = 0
+
+    def intensity(self, xyz):
+        """ Возвращает интенсивность в кубе (x, y, z) или NaN, если она не определена или куб вне водоема """
+
+        x_position, y_position, z_position = xyz
+        pool = self.pool
+        if not (0 <= x_position < pool.length and 0 <= y_position < pool.width and 0 <= z_position < pool.height):
+            return np.nan
+        self.queries += 1
+        if pool.storage == 'objects':
+            value = pool.filling[z_position][y_position][x_position].sound_intensity
+            return np.nan if value is None else float(value)
+        return float(pool.intensity[z_position, y_position, x_position])
+
+    def neighbours(self, xyz):
+        """ Возвращает список (интенсивность, координаты) всех 26 соседей в порядке NEIGHBOUR_OFFSETS """
+
+        return [(self.intensity(neighbour), neighbour)
+                for neighbour in ((xyz[0] + dx, xyz[1] + dy, xyz[2] + dz) for dx, dy, dz in NEIGHBOUR_OFFSETS)]
+
+
+class Strategy(ABC):
+    """ Стратегия поиска источника звука субмариной.
+
+    Наследники реализуют метод _walk, который по интенсивностям звука (_Probe) строит путь от старта. Метод search
+    измеряет количество шагов, обращений к интенсивностям и время поиска и учитывает их в водоеме
+    (pool.instrumentation: счетчики submarine_steps и intensity_queries). Куб источника звука не является водой, поэтому
+    субмарина любой стратегии останавливается в соседнем с ним кубе, а не заходит в него; так длины путей разных
+    стратегий сравнимы.
+
+    Attributes:
+        name (str): название стратегии
+
+    """
+
+    name = 'strategy'
+
+    def search(self, pool, start, metres=True):
+        """ Ищет источник звука из куба start
+
+        Args:
+            pool (Pool): водоем с определенными интенсивностями звука
+            start (tuple|list): стартовые координаты (x, y, z)
+            metres (int|bool): наибольшее количество перемещений. Если True, то плывем до остановки
+
+        Returns:
+            dict: 'strategy' - название стратегии; 'positions' - все посещенные кубы от старта до конечного куба
+            включительно; 'end' - конечный куб; 'status' - состояние (MOVING, ARRIVED, CYCLED, NO_NEIGHBOURS или
+            GAVE_UP); 'steps' - количество перемещений; 'queries' - количество прочитанных интенсивностей; 'seconds' -
+            время поиска; 'distance' - расстояние от конечного куба до ближайшего источника звука
+            (Pool.sound_source_positions; None, если источника нет)
+
+        Raises:
+            ValueError: если неверно задан параметр metres
+
+        """
+
+        assert (metres >= 1) or (metres is True), ValueError('Parameter "metres" must be greater integer than 0 or boolean True.')
+
+        probe = _Probe(pool)
+        started = time.perf_counter()
+        positions, status = self._walk(probe, tuple(int(c) for c in start), inf if metres is True else metres)
+        seconds = time.perf_counter() - started
+
+        sources = pool.sound_source_positions()
+        if len(positions) > 1 and positions[-1] in sources:
+            # последний переход вел в куб источника звука: субмарина остановилась в соседнем с ним кубе
+            positions = positions[:-1]
+            status = ARRIVED
+        distance = None
+        if sources:
+            distance = min(sqrt(sum((a - b) ** 2 for a, b in zip(positions[-1], ss_xyz))) for ss_xyz in sources)
+        pool.instrumentation.count('submarine_steps', len(positions) - 1)
+        pool.instrumentation.count('intensity_queries', probe.queries)
+        return {'strategy': self.name, 'positions': positions, 'end': positions[-1], 'status': status,
+                'steps': len(positions) - 1, 'queries': probe.queries, 'seconds': seconds, 'distance': distance}
+
+    @abstractmethod
+    def _walk(self, probe, start, metres):
+        """ Возвращает (список посещенных кубов от start до конечного куба включительно, состояние) """
+
+
+class GreedyStrategy(Strategy):
+    """ Жадный подъем, как в Submarine.move: переход в соседа с самой большой силой звука (среди равных - последний в
+    порядке NEIGHBOUR_OFFSETS) и остановка, когда она равна силе звука в текущем кубе. Путь совпадает с путем
+    Submarine.move, кроме последнего перехода в куб источника звука, который не выполняется (см. Strategy). В отличие от
+    Submarine.move, зацикливание между соседями завершает поиск с состоянием CYCLED. """
+
+    name = 'greedy'
+
+    def _walk(self, probe, start, metres):
+        positions = [start]
+        visited = {start}
+        current = start
+        while len(positions) - 1 < metres:
+            defined = [(value, xyz) for value, xyz in probe.neighbours(current) if value == value]
+            if not defined:
+                return positions, NO_NEIGHBOURS
+            # последний из соседей с наибольшей силой звука, как после устойчивой сортировки в Submarine.move
+            best_value, best = max(reversed(defined), key=lambda item: item[0])
+            if best_value == probe.intensity(current):
+                return positions, ARRIVED
+            current = best
+            positions.append(current)
+            if current in visited:
+                return positions, CYCLED
+            visited.add(current)
+        return positions, MOVING
+
+
+class MomentumStrategy(Strategy):
+    """ Следование градиенту с инерцией.
+
+    Градиент силы звука оценивается центральными разностями по шести соседям вдоль осей, а направление движения
+    накапливается с инерцией: direction = momentum * direction + (1 - momentum) * gradient / |gradient|. Субмарина
+    переходит в соседа, направление на которого ближе всего к накопленному, поэтому проходит плато (нулевой градиент)
+    по инерции. Поле не меняется во время поиска, поэтому каждая интенсивность читается один раз, а соседи вдоль осей
+    текущего куба в большинстве уже прочитаны на предыдущем шаге: на heightmap40 в режиме 'wavefront' субмарина читает
+    около 6 интенсивностей на шаг против 27 у жадного подъема. Если вдоль осей сила звука нигде не растет, проверяются
+    все 26 соседей: при более громком соседе субмарина переходит в него, иначе останавливается (ARRIVED).
+
+    Attributes:
+        momentum (float): доля прежнего направления в новом, от 0 до 1
+
+    """
+
+    name = 'momentum'
+
+    def __init__(self, momentum=0.6):
+        assert 0 <= momentum < 1, ValueError('Parameter "momentum" must lie in [0; 1)')
+        self.momentum = momentum
+
+    def _gradient(self, intensity, current, value):
+        """ Оценка градиента силы звука по соседям вдоль осей; неопределенные соседи заменяются текущим кубом """
+
+        gradient = np.zeros(3)
+        for axis in range(3):
+            offset = [0, 0, 0]
+            offset[axis] = 1
+            forward = intensity(tuple(c + o for c, o in zip(current, offset)))
+            backward = intensity(tuple(c - o for c, o in zip(current, offset)))
+            gradient[axis] = ((forward if forward == forward else value) - (backward if backward == backward else value)) / 2
+        return gradient
+
+    def _walk(self, probe, start, metres):
+        known = {}  # прочитанные интенсивности: каждый куб читается из водоема один раз за поиск
+
+        def intensity(xyz):
+            value = known.get(xyz)
+            if value is None:
+                value = known[xyz] = probe.intensity(xyz)
+            return value
+
+        positions = [start]
+        visited = {start}
+        current = start
+        direction = np.zeros(3)
+        while len(positions) - 1 < metres:
+            value = intensity(current)
+            gradient = self._gradient(intensity, current, value if value == value else 0.0)
+            norm = np.linalg.norm(gradient)
+            if norm > 0:
+                direction = self.momentum * direction + (1 - self.momentum) * gradient / norm
+
+            # сосед с определенной силой звука, направление на которого ближе всего к накопленному
+            best = None
+            best_value = np.nan
+            if direction.any():
+                for i in np.argsort(-(_DIRECTIONS @ direction), kind='stable').tolist():
+                    dx, dy, dz = NEIGHBOUR_OFFSETS[i]
+                    neighbour = (current[0] + dx, current[1] + dy, current[2] + dz)
+                    neighbour_value = intensity(neighbour)
+                    if neighbour_value == neighbour_value:
+                        best, best_value = neighbour, neighbour_value
+                        break
+
+            # нет направления или оно ведет к более тихому кубу: выбор самого громкого из 26 соседей
+            if best is None or best_value < value:
+                defined = [(neighbour_value, neighbour) for neighbour_value, neighbour in
+                           ((intensity(neighbour), neighbour) for neighbour in
+                            ((current[0] + dx, current[1] + dy, current[2] + dz) for dx, dy, dz in NEIGHBOUR_OFFSETS))
+                           if neighbour_value == neighbour_value]
+                if not defined:
+                    return positions, NO_NEIGHBOURS
+                best_value, best = max(reversed(defined), key=lambda item: item[0])
+                if best_value <= value:
+                    return positions, ARRIVED
+                direction = (np.array(best, dtype=float) - current) / np.linalg.norm(np.subtract(best, current))
+
+            current = best
+            positions.append(current)
+            if current in visited:
+                return positions, CYCLED
+            visited.add(current)
+        return positions, MOVING
+
+
+class TabuStrategy(Strategy):
+    """ Табу-поиск с ограниченной памятью, проходящий плато.
+
+    Как жадный подъем, субмарина переходит в самого громкого соседа, но только среди кубов, не посещенных за последние
+    memory шагов. Поэтому на плато (соседи такой же силы звука) она не останавливается, а обходит его, пока не найдет
+    более громкий куб. Остановка (ARRIVED) - когда все соседи, кроме запрещенных, тише текущего куба, то есть плато
+    обойдено; если по плато пройдено patience шагов подряд без роста силы звука, поиск прекращается с состоянием
+    GAVE_UP.
+
+    Attributes:
+        memory (int): количество последних посещенных кубов, в которые запрещено возвращаться
+        patience (int): наибольшее количество шагов подряд по плато
+
+    """
+
+    name = 'tabu'
+
+    def __init__(self, memory=64, patience=256):
+        assert memory >= 1 and patience >= 1, ValueError('Parameters "memory" and "patience" must be positive integers')
+        self.memory = memory
+        self.patience = patience
+
+    def _walk(self, probe, start, metres):
+        positions = [start]
+        tabu = deque([start], maxlen=self.memory)
+        current = start
+        plateau_steps = 0
+        while len(positions) - 1 < metres:
+            value = probe.intensity(current)
+            defined = [(neighbour_value, xyz) for neighbour_value, xyz in probe.neighbours(current)
+                       if neighbour_value == neighbour_value]
+            if not defined:
+                return positions, NO_NEIGHBOURS
+            allowed = [item for item in defined if item[1] not in tabu]
+            if not allowed:
+                return positions, ARRIVED
+            best_value, best = max(reversed(allowed), key=lambda item: item[0])
+            if best_value < value:
+                return positions, ARRIVED
+            if best_value == value:
+                plateau_steps += 1
+                if plateau_steps > self.patience:
+                    return positions, GAVE_UP
+            else:
+                plateau_steps = 0
+
+            current = best
+            positions.append(current)
+            tabu.append(current)
+        return positions, MOVING
+
+
+class AStarStrategy(Strategy):
+    """ Планировщик A*, использующий поле интенсивности как эвристику.
+
+    При интенсивности I = I_src / L ** 2 оценка расстояния до источника - sqrt(I_src / I), где I_src - сила звука
+    pool.sound_source. Для полей режимов 'wavefront', 'eikonal' и 'visibility' она совпадает с длиной пути звука,
+    поэтому A* раскрывает почти только кубы самого пути. Переходы возможны только в кубы с определенной силой звука,
+    шаг стоит 1, sqrt(2) или sqrt(3). Цель - любой соседний с источником звука куб: как и остальные стратегии, субмарина
+    не заходит в куб самого источника. Если за max_expansions раскрытий цель не найдена,
+    субмарина идет в раскрытый куб с наименьшей оценкой расстояния (GAVE_UP). Субмарина затем проходит найденный путь.
+
+    Эвристика верна только для поля одного источника, поэтому водоемы с несколькими источниками (sources.SoundSources)
+    не поддерживаются.
+
+    Attributes:
+        max_expansions (int): наибольшее количество раскрываемых кубов
+
+    """
+
+    name = 'astar'
+
+    def __init__(self, max_expansions=100000):
+        assert max_expansions >= 1, ValueError('Parameter "max_expansions" must be a positive integer')
+        self.max_expansions = max_expansions
+
+    def _walk(self, probe, start, metres):
+        assert probe.pool.sound_sources is None, \
+            ValueError('AStarStrategy requires a single sound source (Pool.add_sound_source), not SoundSources')
+        source = probe.pool.sound_source
+        goal = (source.x_position, source.y_position, source.z_position)
+        source_intensity = float(source.sound_intensity)
+
+        def estimate(value):
+            return sqrt(source_intensity / value) if value > 0 else inf
+
+        steps = [((dx, dy, dz), sqrt(dx * dx + dy * dy + dz * dz)) for dx, dy, dz in NEIGHBOUR_OFFSETS]
+        costs = {start: 0.0}
+        parents = {start: None}
+        def is_goal(xyz):
+            return xyz != goal and max(abs(a - b) for a, b in zip(xyz, goal)) <= 1
+
+        closest = (estimate(probe.intensity(start)), start)
+        front = [(closest[0], 0.0, start)]
+        expansions = 0
+        status = NO_NEIGHBOURS
+        reached = start if is_goal(start) or start == goal else None
+        while front and reached is None:
+            priority, cost, current = heappop(front)
+            if cost > costs[current]:
+                continue
+            expansions += 1
+            if expansions > self.max_expansions:
+                status = GAVE_UP
+                break
+            for (dx, dy, dz), step_length in steps:
+                neighbour = (current[0] + dx, current[1] + dy, current[2] + dz)
+                new_cost = cost + step_length
+                if neighbour == goal or new_cost >= costs.get(neighbour, inf):
+                    continue
+                value = probe.intensity(neighbour)
+                if value != value:
+                    continue
+                costs[neighbour] = new_cost
+                parents[neighbour] = current
+                if is_goal(neighbour):
+                    reached = neighbour
+                    break
+                remaining = estimate(value)
+                closest = min(closest, (remaining, neighbour))
+                heappush(front, (new_cost + remaining, new_cost, neighbour))
+        if reached is not None:
+            status = ARRIVED
+
+        # путь до цели или до ближайшего к источнику раскрытого куба
+        path = []
+        cell = reached if reached is not None else closest[1]
+        while cell is not None:
+            path.append(cell)
+            cell = parents[cell]
+        path.reverse()
+        if len(path) - 1 > metres:
+            return path[:int(metres) + 1], MOVING
+        if status == NO_NEIGHBOURS and len(path) > 1:
+            status = GAVE_UP
+        return path, status
+
+
+STRATEGIES = {strategy.name: strategy for strategy in (GreedyStrategy, MomentumStrategy, TabuStrategy, AStarStrategy)}
+
+
+def make_strategy(strategy):
+    """ Возвращает экземпляр стратегии по названию ('greedy', 'momentum', 'tabu', 'astar') или саму стратегию """
+
+    if isinstance(strategy, Strategy):
+        return strategy
+    assert strategy in STRATEGIES, ValueError('Strategy must be one of ' + str(tuple(STRATEGIES)))
+    return STRATEGIES[strategy]()
+
+
+def compare_strategies(pool, starts, strategies=tuple(STRATEGIES), metres=True):
+    """ Проводит каждую стратегию из всех стартов и сводит метрики, чтобы выбрать самую дешевую надежную стратегию
+
+    Поиск считается успешным, если субмарина остановилась в кубе источника звука или в соседнем с ним кубе.
+
+    Args:
+        pool (Pool): водоем с источником звука или несколькими источниками (Pool.sound_source_positions); стратегия
+            'astar' требует одного источника
+        starts (list): стартовые координаты (x, y, z)
+        strategies (tuple|list): названия или экземпляры стратегий
+        metres (int|bool): наибольшее количество перемещений каждой субмарины
+
+    Returns:
+        dict: для каждой стратегии - доля успешных поисков и средние количество шагов, обращений к интенсивностям и
+        время поиска
+
+    """
+
+    summary = {}
+    for strategy in strategies:
+        strategy = make_strategy(strategy)
+        results = [strategy.search(pool, start, metres) for start in starts]
+        # поиск без расстояния до источника (distance=None) считается неуспешным
+        summary[strategy.name] = {'success': float(np.mean([result['distance'] is not None and result['distance'] < 2
+                                                            for result in results])),
+                                  'mean_steps': float(np.mean([result['steps'] for result in results])),
+                                  'mean_queries': float(np.mean([result['queries'] for result in results])),
+                                  'mean_seconds': float(np.mean([result['seconds'] for result in results]))}
+    return summary
+
+
+if __name__ == '__main__':
+    import sys
+    from random import Random
+    from classes import Pool
+    from instrumentation import Instrumentation
+    from terrain import load_heights
+
+    heightmap = sys.argv[1] if len(sys.argv) > 1 else 'Heightmaps/heightmap15.jpg'
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    mode = sys.argv[3] if len(sys.argv) > 3 else 'wavefront'
+
+    pool = Pool(int(load_heights(heightmap).max()) + 1, heightmap, 'arrays', Instrumentation(quiet=True))
+    pool.add_sound_source(mode=mode, enhanced_realism=False)
+    rng = Random(0)
+    cells = np.argwhere(np.isfinite(pool.intensity) & pool.water).tolist()
+    starts = [tuple(cell[::-1]) for cell in rng.sample(cells, min(samples, len(cells)))]
+    for name, metrics in compare_strategies(pool, starts).items():
+        print(name.ljust(10), ' '.join(key + '=' + str(round(value, 6)) for key, value in metrics.items()))
@@ -0,0 +1,280 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+#  Серии испытаний поиска источника звука: много пар (источник звука, старт субмарины) на нескольких картах высот.
+#       python sweep.py --maps Heightmaps/heightmap15.jpg Heightmaps/heightmap40.jpg --sources 5 --starts 100
+#       python sweep.py --grid 10 4 --mode curves --workers 4 --output sweep.parquet
+#  Поле звука вычисляется один раз для каждого источника и используется для всех стартов с этим источником.
+#  Задания создаются по мере выполнения, а результаты испытаний записываются в файл по мере готовности (CSV, либо
+#  Parquet при установленном pyarrow), поэтому в памяти находятся только выполняемые задания.
+
+import os
+import sys
+import csv
+import random
+import argparse
+from collections import deque
+from math import sqrt
+from multiprocessing import Pool as ProcessPool
+import numpy as np
+from classes import Pool, PROPAGATION_MODES
+from instrumentation import Instrumentation
+from navigation import move_submarines, ARRIVED, CYCLED, NO_NEIGHBOURS
+from terrain import ColumnTerrain, load_heights
+
+# поля результата одного испытания в порядке столбцов файла
+FIELDS = ['heightmap', 'mode', 'source_x', 'source_y', 'source_z', 'start_x', 'start_y', 'start_z', 'end_x', 'end_y',
+          'end_z', 'status', 'success', 'steps', 'path_length', 'final_distance']
+STATUS_NAMES = {ARRIVED: 'arrived', CYCLED: 'cycled', NO_NEIGHBOURS: 'no_neighbours'}
+
+
+def _random_cell(terrain, rng, height, on_seabed):
+    """ Возвращает случайный куб воды (x, y, z) по правилам Pool.add_sound_source (на дне) или Submarine (в толще) """
+
+    x_position = rng.randrange(terrain.length)
+    y_position = rng.randrange(terrain.width)
+    z_min = terrain.seabed(x_position, y_position)
+    return x_position, y_position, z_min if on_seabed else rng.randint(z_min, height - 1)
+
+
+def random_jobs(heightmaps, sources, starts, mode='wavefront', enhanced_realism=True, sound_intensity=1000, seed=0,
+                metres=True):
+    """ Создает (генератор) задания со случайными источниками звука и стартами субмарин, воспроизводимые по зерну
+    seed. Задания создаются по одному по мере запроса.
+
+    Args:
+        heightmaps (list): расположения карт высот
+        sources (int): количество источников звука на каждую карту
+        starts (int): количество стартов субмарин на каждый источник
+        mode (str): способ распространения звука (см. Pool.add_sound_source)
+        enhanced_realism (bool): режим построения кривых для mode='curves'
+        sound_intensity (float|int): интенсивность источников звука
+        seed (int): зерно генератора случайных координат
+        metres (int|bool): метры для преодоления каждой субмариной (см. Submarine.move)
+
+    Yields:
+        dict: задание; каждое задание соответствует одному полю звука (см. run_job)
+
+    """
+
+    rng = random.Random(seed)
+    for heightmap in heightmaps:
+        heights = load_heights(heightmap)
+        height = int(heights.max()) + 1
+        terrain = ColumnTerrain(heights, height)
+        for i in range(sources):
+            source = _random_cell(terrain, rng, height, True)
+            cells = [_random_cell(terrain, rng, height, False) for j in range(starts)]
+            yield {'heightmap': heightmap, 'height': height, 'source': source, 'mode': mode,
+                   'enhanced_realism': enhanced_realism, 'sound_intensity': sound_intensity, 'metres': metres,
+                   'starts': [cell for cell in cells if cell != source]}
+
+
+def grid_jobs(heightmaps, source_step, start_step, mode='wavefront', enhanced_realism=True, sound_intensity=1000,
+              metres=True):
+    """ Создает (генератор) задания с источниками звука на дне в узлах сетки с шагом source_step по X и Y и стартами
+    субмарин во всех кубах воды в узлах сетки с шагом start_step по X, Y и Z. Параметры описаны в random_jobs(). """
+
+    for heightmap in heightmaps:
+        heights = load_heights(heightmap)
+        height = int(heights.max()) + 1
+        terrain = ColumnTerrain(heights, height)
+        cells = [(x_position, y_position, z_position)
+                 for x_position in range(0, terrain.length, start_step)
+                 for y_position in range(0, terrain.width, start_step)
+                 for z_position in range(terrain.seabed(x_position, y_position), height, start_step)]
+        for x_position in range(0, terrain.length, source_step):
+            for y_position in range(0, terrain.width, source_step):
+                source = (x_position, y_position, terrain.seabed(x_position, y_position))
+                yield {'heightmap': heightmap, 'height': height, 'source': source, 'mode': mode,
+                       'enhanced_realism': enhanced_realism, 'sound_intensity': sound_intensity, 'metres': metres,
+                       'starts': [cell for cell in cells if cell != source]}
+
+
+def run_job(job, cache_directory=None):
+    """ Вычисляет поле звука задания и проводит субмарины из всех его стартов
+
+    Субмарины перемещаются функцией navigation.move_submarines по правилам Submarine.move; зациклившиеся субмарины
+    останавливаются с состоянием 'cycled'. Испытание успешно, если субмарина остановилась в соседнем с источником
+    звука кубе.
+
+    Args:
+        job (dict): задание (см. random_jobs)
+        cache_directory (str|None): каталог дискового кэша полей интенсивности (field_cache.FieldCache)
+
+    Returns:
+        list: результаты испытаний - словари с полями FIELDS
+
+    """
+
+    cache = None
+    if cache_directory is not None:
+        from field_cache import FieldCache
+
+        cache = FieldCache(cache_directory)
+
+    pool = Pool(job['height'], job['heightmap'], 'arrays', Instrumentation(quiet=True))
+    pool.add_sound_source(job['sound_intensity'], *job['source'], enhanced_realism=job['enhanced_realism'],
+                          mode=job['mode'], cache=cache)
+    if not job['starts']:
+        return []
+
+    result = move_submarines(pool, job['starts'], job['metres'], paths=True)
+    source = job['source']
+    rows = []
+    for i, start in enumerate(job['starts']):
+        path = result['paths'][result['path_offsets'][i]:result['path_offsets'][i + 1]].astype(float)
+        end = result['endpoints'][i].tolist()
+        rows.append({'heightmap': os.path.basename(job['heightmap']), 'mode': job['mode'],
+                     'source_x': int(source[0]), 'source_y': int(source[1]), 'source_z': int(source[2]),
+                     'start_x': int(start[0]), 'start_y': int(start[1]), 'start_z': int(start[2]),
+                     'end_x': end[0], 'end_y': end[1], 'end_z': end[2],
+                     'status': STATUS_NAMES.get(int(result['status'][i]), 'moving'),
+                     'success': max(abs(a - b) for a, b in zip(end, source)) <= 1,
+                     'steps': int(result['steps'][i]),
+                     'path_length': float(np.sqrt((np.diff(path, axis=0) ** 2).sum(axis=1)).sum()),
+                     'final_distance': sqrt(sum((a - b) ** 2 for a, b in zip(end, source)))})
+    return rows
+
+
+class CsvSink:
+    """ Построчная запись результатов испытаний в файл CSV """
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.DictWriter(self.file, FIELDS)
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """ Запись результатов испытаний в файл Parquet группами строк; требует pyarrow """
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('Writing .parquet results requires pyarrow; install it or use a .csv output file')
+
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([('heightmap', pyarrow.string()), ('mode', pyarrow.string())] +
+                                     [(name, pyarrow.int32()) for name in FIELDS[2:11]] +
+                                     [('status', pyarrow.string()), ('success', pyarrow.bool_()),
+                                      ('steps', pyarrow.int32()), ('path_length', pyarrow.float64()),
+                                      ('final_distance', pyarrow.float64())])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        if rows:
+            self.writer.write_table(self.pyarrow.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def open_sink(path):
+    """ Открывает запись результатов: Parquet для файлов .parquet, CSV для остальных """
+
+    if path.endswith('.parquet'):
+        return ParquetSink(path)
+    return CsvSink(path)
+
+
+def _bounded_map(processes, jobs, cache_directory, window):
+    """ Выполняет задания в пуле процессов, передавая в него не больше window заданий одновременно, и возвращает
+    результаты в порядке заданий. В отличие от Pool.imap, не вычитывает весь генератор заданий заранее. """
+
+    pending = deque()
+    for job in jobs:
+        pending.append(processes.apply_async(run_job, (job, cache_directory)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def run_sweep(jobs, output, workers=1, cache_directory=None, progress=None):
+    """ Выполняет задания в пуле процессов и записывает результаты испытаний в файл по мере готовности заданий
+
+    Задания берутся из jobs по мере выполнения (не больше двух на процесс одновременно), поэтому в памяти находятся
+    только выполняемые задания и их результаты, а не вся серия.
+
+    Args:
+        jobs (iterable): задания - список или генератор (см. random_jobs, grid_jobs)
+        output (str): файл результатов (.csv или .parquet)
+        workers (int): количество процессов; 1 - задания выполняются в текущем процессе
+        cache_directory (str|None): каталог дискового кэша полей интенсивности
+        progress (callable|None): функция progress(completed, total), вызываемая после каждого задания; total - None,
+            если количество заданий заранее неизвестно (генератор)
+
+    Returns:
+        dict: количество испытаний и успешных испытаний
+
+    """
+
+    total = len(jobs) if hasattr(jobs, '__len__') else None
+    trials = 0
+    successes = 0
+
+    def write(results):
+        nonlocal trials, successes
+        for completed, rows in enumerate(results, 1):
+            sink.write(rows)
+            trials += len(rows)
+            successes += sum(row['success'] for row in rows)
+            if progress is not None:
+                progress(completed, total)
+
+    sink = open_sink(output)
+    try:
+        if workers > 1:
+            # при ошибке (например, в записи результатов) рабочие процессы завершаются при выходе из with
+            with ProcessPool(workers) as processes:
+                write(_bounded_map(processes, jobs, cache_directory, 2 * workers))
+        else:
+            write(run_job(job, cache_directory) for job in jobs)
+    finally:
+        sink.close()
+    return {'trials': trials, 'successes': successes}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run Monte Carlo sweeps of sound source searches.')
+    parser.add_argument('--maps', nargs='+', default=['Heightmaps/heightmap15.jpg'], help='heightmaps to sweep')
+    parser.add_argument('--sources', type=int, default=5, help='random sound sources per heightmap')
+    parser.add_argument('--starts', type=int, default=100, help='random submarine starts per sound source')
+    parser.add_argument('--grid', type=int, nargs=2, metavar=('SOURCE_STEP', 'START_STEP'),
+                        help='use grid scenarios instead of random ones')
+    parser.add_argument('--mode', default='wavefront', choices=PROPAGATION_MODES)
+    parser.add_argument('--simple-curves', action='store_true', help='enhanced_realism=False for mode "curves"')
+    parser.add_argument('--metres', type=int, help='metres for each submarine (default: until it stops)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--cache', help='intensity field cache directory')
+    parser.add_argument('--output', default='sweep.csv', help='results file (.csv or .parquet)')
+    args = parser.parse_args(argv)
+
+    metres = True if args.metres is None else args.metres
+    if args.grid:
+        jobs = grid_jobs(args.maps, args.grid[0], args.grid[1], args.mode, not args.simple_curves, metres=metres)
+    else:
+        jobs = random_jobs(args.maps, args.sources, args.starts, args.mode, not args.simple_curves, seed=args.seed,
+                           metres=metres)
+
+    summary = run_sweep(jobs, args.output, args.workers, args.cache,
+                        lambda completed, total: print('\tField', completed, 'completed.', flush=True))
+    print('Trials:', summary['trials'], 'successful:', summary['successes'], 'results written to', args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
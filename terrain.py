@@ -0,0 +1,299 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+import os
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+HEIGHTS_CACHE_SIZE = 16  # количество карт высот, запоминаемых load_heights()
+_heights_cache = OrderedDict()
+
+
+def _to_heights(pixels):
+    """ Переводит пиксели карты высот (или значения массива .npy) в целочисленные высоты ландшафта: у цветных
+    изображений берется первый канал, значения округляются до целого.
+
+    Raises:
+        ValueError: если карта не двухмерна, пуста, содержит нечисловые или отрицательные высоты
+
+    """
+
+    pixels = np.asarray(pixels)
+    if pixels.ndim == 3:
+        pixels = pixels[..., 0]
+    assert pixels.ndim == 2 and pixels.size, ValueError('A heightmap must be a non-empty two-dimensional array')
+    assert np.isfinite(pixels).all(), ValueError('A heightmap must not contain NaN or infinite heights')
+    assert pixels.min() >= 0, ValueError('A heightmap must not contain negative heights')
+    return np.rint(pixels).astype(int)
+
+
+def _decode_heights(heightmap):
+    """ Декодирует файл карты высот в массив высот без запоминания (см. load_heights) """
+
+    if heightmap.endswith('.npy'):
+        return _to_heights(np.load(heightmap))
+    im = Image.open(heightmap, 'r')
+    if im.mode == 'P':
+        im = im.convert('L')  # палитровое изображение: высота - яркость цвета палитры
+    return _to_heights(np.asarray(im))
+
+
+def load_heights(heightmap):
+    """ Читает карту высот и возвращает двухмерный массив высот ландшафта с индексацией [y, x].
+
+    Поддерживаются изображения (.jpg, 8- и 16-битные .png в оттенках серого или цветные - по первому каналу) и массивы
+    NumPy .npy с высотами батиметрии. Карта декодируется один раз: результат запоминается по расположению файла и
+    декодируется заново, только если файл изменился. Все потребители получают один и тот же массив, поэтому он
+    доступен только для чтения.
+
+    Args:
+        heightmap (str): расположение карты высот (.jpg, .png или .npy)
+
+    Returns:
+        numpy.ndarray: целочисленные высоты ландшафта (значение первого канала пикселя, округленное до целого), только
+        для чтения
+
+    Raises:
+        ValueError: если карта не двухмерна, пуста, содержит нечисловые или отрицательные высоты
+
+    """
+
+    path = os.path.abspath(heightmap)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _heights_cache.get(path)
+    if cached is not None and cached[0] == version:
+        _heights_cache.move_to_end(path)
+        return cached[1]
+
+    heights = _decode_heights(path)
+    heights.flags.writeable = False
+    _heights_cache[path] = (version, heights)
+    _heights_cache.move_to_end(path)
+    if len(_heights_cache) > HEIGHTS_CACHE_SIZE:
+        _heights_cache.popitem(last=False)
+    return heights
+
+
+def _terrain_runs(terrain):
+    """ Находит отрезки ландшафта в каждой строке двухмерной маски ландшафта.
+
+    Returns:
+        tuple: (rows, lengths) - номера строк и длины отрезков в порядке обхода строк слева направо
+
+    """
+
+    edges = np.diff(np.pad(terrain, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1]
+    return rows, ends - starts
+
+
+def _shrink_by_runs(rows, lengths, count):
+    """ Уменьшает размер параллелепипеда допущений по отрезкам ландшафта так же, как построчный обход
+    classes.parallelepiped_dimensions(): в каждой строке отрезки принимаются по порядку, пока каждый следующий короче
+    текущего размера, а на первом не более коротком отрезке обход строки прекращается. """
+
+    current_row = -1
+    blocked = False
+    for row, length in zip(rows.tolist(), lengths.tolist()):
+        if row != current_row:
+            current_row = row
+            blocked = False
+        if blocked:
+            continue
+        if length < count:
+            count = length
+        else:
+            blocked = True
+    return count
+
+
+class ColumnTerrain:
+    """ Компактное представление ландшафта водоема по столбцам.
+
+    Ландшафт в точке (x; y) занимает все кубы ниже высоты heights[y, x], остальные кубы - вода. Отдельные кубы,
+    отличающиеся от карты высот (например, источник звука, заменяющий куб воды), хранятся как разреженные исключения.
+    Занимаемая память пропорциональна площади карты, а не объему водоема.
+
+    Attributes:
+        heights (numpy.ndarray): высоты ландшафта с индексацией [y, x]
+        height (int): высота водоема
+        length (int): длина водоема (значение по X)
+        width (int): ширина водоема (значение по Y)
+        overrides (dict): исключения по столбцам: {(x, y): {z: is_water}}
+
+    Methods:
+        from_mask: строит представление по плотной маске воды
+        is_water: проверяет, состоит ли куб из воды
+        set_water: делает куб водой или ландшафтом
+        set_heights: заменяет участок карты высот
+        seabed: возвращает наименьшую высоту куба воды в столбце
+        row_runs: возвращает длины отрезков ландшафта вдоль оси X
+        column_runs: возвращает длины отрезков ландшафта вдоль оси Y
+        layer: возвращает маску воды горизонтального слоя
+        block: возвращает маску воды вертикального блока по прямоугольнику карты
+        to_mask: возвращает плотную маску воды всего водоема
+        parallelepiped_dimensions: определяет размеры параллелепипеда допущений
+
+    """
+
+    def __init__(self, heights, height, overrides=None):
+        """ Инициализация ландшафта
+
+        Args:
+            heights (numpy.ndarray): высоты ландшафта с индексацией [y, x]
+            height (int): высота водоема
+            overrides (dict|None): исключения по столбцам: {(x, y): {z: is_water}}
+
+        """
+
+        self.heights = np.asarray(heights)
+        self.height = height
+        self.width, self.length = self.heights.shape
+        self.overrides = {} if overrides is None else overrides
+        # размеры параллелепипеда допущений после обработки слоев 0..z и слои, измененные после их вычисления
+        self._prefix = None
+        self._dirty_layers = set()
+
+    @classmethod
+    def from_mask(cls, water):
+        """ Строит представление по плотной маске воды с индексацией [z, y, x]: высотой столбца считается количество
+        кубов ландшафта от дна до первого куба воды, остальные отличия сохраняются как исключения. """
+
+        height = water.shape[0]
+        heights = np.where(water.any(axis=0), np.argmax(water, axis=0), height)
+        terrain = cls(heights, height)
+        for z, y, x in np.argwhere(water != terrain.to_mask()).tolist():
+            terrain.overrides.setdefault((x, y), {})[z] = bool(water[z, y, x])
+        return terrain
+
+    def is_water(self, x_position, y_position, z_position):
+        """ Возвращает True, если куб на заданных координатах состоит из воды """
+
+        column = self.overrides.get((x_position, y_position))
+        if column is not None and z_position in column:
+            return column[z_position]
+        return bool(z_position >= self.heights[y_position, x_position])
+
+    def set_water(self, x_position, y_position, z_position, is_water):
+        """ Делает куб на заданных координатах водой (is_water=True) или ландшафтом (is_water=False) """
+
+        column = self.overrides.setdefault((x_position, y_position), {})
+        if bool(z_position >= self.heights[y_position, x_position]) == is_water:
+            column.pop(z_position, None)
+        else:
+            column[z_position] = is_water
+        if not column:
+            del self.overrides[(x_position, y_position)]
+        self._dirty_layers.add(z_position)
+
+    def set_heights(self, x_start, y_start, heights):
+        """ Заменяет участок карты высот, начинающийся в точке (x_start; y_start): столбцы участка становятся
+        ландшафтом ниже новой высоты и водой выше нее, исключения в этих столбцах отбрасываются
+
+        Args:
+            x_start (int): координата участка по оси X
+            y_start (int): координата участка по оси Y
+            heights (numpy.ndarray): новые высоты ландшафта участка с индексацией [y, x]
+
+        """
+
+        heights = np.asarray(heights)
+        y_stop, x_stop = y_start + heights.shape[0], x_start + heights.shape[1]
+        old = self.heights[y_start:y_stop, x_start:x_stop]
+        changed = old != heights
+        if changed.any():
+            self._dirty_layers.update(range(int(np.minimum(old, heights)[changed].min()),
+                                            min(int(np.maximum(old, heights)[changed].max()), self.height)))
+        for x_position, y_position in list(self.overrides):
+            if x_start <= x_position < x_stop and y_start <= y_position < y_stop:
+                self._dirty_layers.update(self.overrides.pop((x_position, y_position)))
+        # массив высот может быть общим для нескольких водоемов, поэтому изменяется копия
+        self.heights = self.heights.copy()
+        self.heights[y_start:y_stop, x_start:x_stop] = heights
+
+    def seabed(self, x_position, y_position, z_min=1):
+        """ Возвращает наименьшую высоту куба воды в столбце (x; y) не ниже z_min или None, если в столбце нет воды.
+
+        Без исключений в столбце ответ находится за O(1), иначе - за длину отрезка ландшафта.
+
+        """
+
+        z_position = max(z_min, int(self.heights[y_position, x_position]))
+        if (x_position, y_position) not in self.overrides:
+            return z_position if z_position < self.height else None
+        for z_position in range(z_min, self.height):
+            if self.is_water(x_position, y_position, z_position):
+                return z_position
+        return None
+
+    def layer(self, z_position):
+        """ Возвращает маску воды горизонтального слоя z с индексацией [y, x] """
+
+        water = z_position >= self.heights
+        for (x_position, y_position), column in self.overrides.items():
+            if z_position in column:
+                water[y_position, x_position] = column[z_position]
+        return water
+
+    def block(self, x_start, x_stop, y_start, y_stop):
+        """ Возвращает маску воды блока водоема над прямоугольником [x_start; x_stop) x [y_start; y_stop) карты на всю
+        высоту водоема, с индексацией [z, y - y_start, x - x_start] """
+
+        heights = np.asarray(self.heights[y_start:y_stop, x_start:x_stop])
+        water = np.arange(self.height)[:, None, None] >= heights[None, :, :]
+        for (x_position, y_position), column in self.overrides.items():
+            if x_start <= x_position < x_stop and y_start <= y_position < y_stop:
+                for z_position, is_water in column.items():
+                    water[z_position, y_position - y_start, x_position - x_start] = is_water
+        return water
+
+    def to_mask(self):
+        """ Возвращает плотную маску воды всего водоема с индексацией [z, y, x] """
+
+        return self.block(0, self.length, 0, self.width)
+
+    def row_runs(self, y_position, z_position):
+        """ Возвращает длины отрезков ландшафта вдоль оси X в строке y слоя z (слева направо) """
+
+        return _terrain_runs(~self.layer(z_position)[y_position:y_position + 1])[1]
+
+    def column_runs(self, x_position, z_position):
+        """ Возвращает длины отрезков ландшафта вдоль оси Y в столбце x слоя z (по возрастанию y) """
+
+        return _terrain_runs(~self.layer(z_position).T[x_position:x_position + 1])[1]
+
+    def parallelepiped_dimensions(self):
+        """ Определяет размеры параллелепипеда допущений по отрезкам ландшафта; результат совпадает с
+        classes.parallelepiped_dimensions() для плотной маски воды, но слои обрабатываются по одному.
+
+        Размеры после каждого слоя запоминаются. После изменения ландшафта слои пересчитываются начиная с самого
+        нижнего измененного, и пересчет прекращается, как только выше всех измененных слоев размеры совпадут с
+        запомненными.
+
+        Returns:
+            tuple: (parallelepiped_length, parallelepiped_width) - размеры параллелепипеда по осям X и Y
+
+        """
+
+        if self._prefix is None:
+            self._prefix = [None] * self.height
+            self._dirty_layers = set(range(self.height))
+        if self._dirty_layers:
+            first, last = min(self._dirty_layers), max(self._dirty_layers)
+            dimensions = self._prefix[first - 1] if first else (self.length, self.width)  # (x, y)
+            for z_position in range(first, self.height):
+                terrain = ~self.layer(z_position)
+                dimensions = (_shrink_by_runs(*_terrain_runs(terrain), dimensions[0]),
+                              _shrink_by_runs(*_terrain_runs(terrain.T), dimensions[1]))
+                previous = self._prefix[z_position]
+                self._prefix[z_position] = dimensions
+                if z_position >= last and dimensions == previous:
+                    break
+            self._dirty_layers = set()
+        return self._prefix[-1] if self.height else (self.length, self.width)
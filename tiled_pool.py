@@ -0,0 +1,240 @@
+"""
+Created by Ivan Danylenko
+Date 09.11.21
+"""
+
+import os
+from heapq import heappush, heappop
+from math import inf
+import numpy as np
+from numpy.lib.format import open_memmap
+from PIL import Image
+from classes import Pool, _FillingAxis
+from instrumentation import Instrumentation
+from propagation import wavefront_path_lengths
+from terrain import ColumnTerrain, _to_heights
+
+
+def _ingest_heights(heightmap, path, height, band=256):
+    """ Переписывает карту высот полосами по band строк в отображенный в память массив высот на диске.
+
+    Файлы .npy читаются через отображение в память и не загружаются целиком. Изображения читаются полосами через
+    Image.crop, однако декодер PIL распаковывает сжатое изображение целиком, поэтому для карт, не помещающихся в
+    память, следует использовать .npy.
+
+    Args:
+        heightmap (str): расположение карты высот (.jpg, .png или .npy)
+        path (str): расположение создаваемого файла высот .npy
+        height (int): высота водоема; каждая полоса проверяется на то, что ландшафт ниже водоема
+        band (int): количество строк карты, читаемых за раз
+
+    Returns:
+        numpy.memmap: высоты ландшафта int32 с индексацией [y, x]
+
+    Raises:
+        ValueError: если заданная высота бассейна ниже или равняется максимальной высоте ландшафта или карта высот
+            содержит нечисловые или отрицательные высоты
+
+    """
+
+    if heightmap.endswith('.npy'):
+        source = np.load(heightmap, mmap_mode='r')
+        width, length = source.shape[:2]
+
+        def read(y_start, y_stop):
+            return np.asarray(source[y_start:y_stop])
+    else:
+        im = Image.open(heightmap, 'r')
+        if im.mode == 'P':
+            im = im.convert('L')
+        length, width = im.size
+
+        def read(y_start, y_stop):
+            return np.asarray(im.crop((0, y_start, length, y_stop)))
+
+    heights = open_memmap(path, mode='w+', dtype=np.int32, shape=(width, length))
+    for y_start in range(0, width, band):
+        pixels = _to_heights(read(y_start, min(y_start + band, width)))
+        assert height > pixels.max(), ValueError('The height parameter must be greater than ' + str(int(pixels.max())))
+        heights[y_start:y_start + len(pixels)] = pixels
+    heights.flush()
+    return heights
+
+
+class TiledPool(Pool):
+    """ Водоем для карт высот, не помещающихся в оперативную память.
+
+    Высоты ландшафта, длины путей звука и интенсивности звука хранятся в отображенных в память файлах .npy в каталоге
+    directory, а поле звука вычисляется по тайлам - вертикальным блокам tile x tile кубов на всю высоту водоема.
+    В память одновременно загружается только один тайл с окаймлением в один куб, поэтому пиковое потребление памяти
+    определяется размером тайла, а не размером карты. Субмарины (Submarine) читают интенсивности прямо из файла.
+
+    Поддерживается только способ распространения звука mode='wavefront'. Операции, которым нужен весь водоем в
+    памяти, отклоняются с ошибкой ValueError: маска воды всего водоема (water_mask, а значит SoundSources, прогрессивное,
+    пирамидальное и ленивое поля), поле переходов (precompute_navigation) и редактирование ландшафта с восстановлением
+    поля звука (edit_terrain, set_box, set_heights).
+
+    Attributes:
+        directory (str): каталог с файлами водоема
+        tile (int): длина стороны тайла в кубах
+
+    """
+
+    def __init__(self, height, heightmap, directory, tile=64, instrumentation=None):
+        """ Инициализация водоема
+
+        Args:
+            height (int): высота водоема
+            heightmap (str): расположение карты высот (.jpg, .png или .npy)
+            directory (str): каталог для файлов водоема; создается, если не существует
+            tile (int): длина стороны тайла в кубах
+            instrumentation (Instrumentation|None): сбор сообщений, прогресса, времени фаз и счетчиков водоема
+
+        Raises:
+            ValueError: если заданная высота бассейна ниже или равняется максимальной высоте ландшафта
+
+        """
+
+        self.instrumentation = Instrumentation() if instrumentation is None else instrumentation
+        os.makedirs(directory, exist_ok=True)
+        with self.instrumentation.phase('heightmap_ingestion'):
+            heights = _ingest_heights(heightmap, os.path.join(directory, 'heights.npy'), height)
+
+        self.height = height  # z
+        self.width, self.length = heights.shape  # y, x
+        self.storage = 'columns'
+        self.heightmap = heightmap
+        self.navigation = None
+        self.propagation = None
+        self.sound_sources = None
+        self.terrain = ColumnTerrain(heights, height)
+        self.directory = directory
+        self.tile = tile
+
+        self.intensity = open_memmap(os.path.join(directory, 'intensity.npy'), mode='w+', dtype=np.float32,
+                                     shape=(height, self.width, self.length))
+        for z_position in range(height):
+            self.intensity[z_position] = np.nan
+        self.filling = _FillingAxis(self)
+
+    def tiles(self):
+        """ Возвращает прямоугольники всех тайлов (x_start, x_stop, y_start, y_stop) """
+
+        return [(x_start, min(x_start + self.tile, self.length), y_start, min(y_start + self.tile, self.width))
+                for y_start in range(0, self.width, self.tile) for x_start in range(0, self.length, self.tile)]
+
+    def water_mask(self):
+        """ Не поддерживается: маска воды всего водоема не помещается в память. Маску тайла возвращает
+        terrain.block(x_start, x_stop, y_start, y_stop). """
+
+        raise ValueError('TiledPool does not build the water mask of the whole pool in memory: '
+                         'read it tile by tile with terrain.block()')
+
+    def precompute_navigation(self):
+        """ Не поддерживается: поле переходов хранится для всего водоема в памяти. Субмарины TiledPool выбирают
+        переходы по интенсивностям, читая их из файла. """
+
+        raise ValueError('TiledPool does not support precompute_navigation: '
+                         'the navigation field would hold the whole pool in memory')
+
+    def edit_terrain(self, cells, is_water):
+        """ Не поддерживается: восстановление поля звука (_repair_field) работает с массивами всего водоема. Ландшафт
+        не изменяется. """
+
+        raise ValueError('TiledPool does not support terrain editing: '
+                         'repairing the sound field would load the whole pool into memory')
+
+    def set_box(self, x_start, y_start, z_start, x_stop, y_stop, z_stop, is_water):
+        """ Не поддерживается, см. edit_terrain() """
+
+        self.edit_terrain([], is_water)
+
+    def set_heights(self, x_start, y_start, heights):
+        """ Не поддерживается, см. edit_terrain() """
+
+        self.edit_terrain([], False)
+
+    def _propagate(self, mode, enhanced_realism, workers):
+        """ Вычисляет поле звука по тайлам. Параметры описаны в add_sound_source(). """
+
+        assert mode == 'wavefront', ValueError('TiledPool supports only mode="wavefront"')
+
+        self.instrumentation.message('Определяю звуковое давление волновым фронтом по тайлам...')
+        with self.instrumentation.phase('intensity_computation'):
+            self.path_lengths = self._tiled_wavefront()
+
+            for x_start, x_stop, y_start, y_stop in self.tiles():
+                distances = np.asarray(self.path_lengths[:, y_start:y_stop, x_start:x_stop])
+                reached = self.terrain.block(x_start, x_stop, y_start, y_stop) & np.isfinite(distances) & (distances > 0)
+                intensity = np.array(self.intensity[:, y_start:y_stop, x_start:x_stop])
+                intensity[reached] = self.sound_source.sound_intensity / distances[reached].astype(np.float64) ** 2
+                self.intensity[:, y_start:y_stop, x_start:x_stop] = intensity
+            self.intensity.flush()
+
+    def _tiled_wavefront(self):
+        """ Определяет длины кратчайших путей звука от источника до всех кубов воды, обрабатывая по одному тайлу.
+
+        Тайл обрабатывается алгоритмом Дейкстры, в котором известные длины путей самого тайла и его окаймления служат
+        источниками фронта. Если при этом уменьшились длины у края тайла, в очередь ставятся соседние тайлы; очередь
+        упорядочена по наименьшей изменившейся длине. Процесс повторяется, пока длины не перестанут уменьшаться, и
+        сходится к тем же длинам, что и wavefront_path_lengths() для всего водоема.
+
+        Returns:
+            numpy.memmap: длины путей float32 с индексацией [z, y, x]; inf для кубов, до которых звук не доходит
+
+        """
+
+        distances = open_memmap(os.path.join(self.directory, 'path_lengths.npy'), mode='w+', dtype=np.float32,
+                                shape=(self.height, self.width, self.length))
+        for z_position in range(self.height):
+            distances[z_position] = inf
+        ss_xyz = (self.sound_source.x_position, self.sound_source.y_position, self.sound_source.z_position)
+        distances[ss_xyz[2], ss_xyz[1], ss_xyz[0]] = 0
+
+        tiles_x = -(-self.length // self.tile)
+        tiles_y = -(-self.width // self.tile)
+        start = (ss_xyz[1] // self.tile, ss_xyz[0] // self.tile)
+        queue = [(0.0, start)]
+        queued = {start}
+        processed = 0
+        while queue:
+            key, (tile_y, tile_x) = heappop(queue)
+            queued.discard((tile_y, tile_x))
+            processed += 1
+
+            x_start, x_stop = tile_x * self.tile, min((tile_x + 1) * self.tile, self.length)
+            y_start, y_stop = tile_y * self.tile, min((tile_y + 1) * self.tile, self.width)
+            # тайл с окаймлением в один куб
+            x_low, x_high = max(0, x_start - 1), min(self.length, x_stop + 1)
+            y_low, y_high = max(0, y_start - 1), min(self.width, y_stop + 1)
+
+            old = np.array(distances[:, y_low:y_high, x_low:x_high], dtype=np.float64)
+            new = wavefront_path_lengths(self.terrain.block(x_low, x_high, y_low, y_high), initial=old)
+
+            inner = (slice(None), slice(y_start - y_low, y_stop - y_low), slice(x_start - x_low, x_stop - x_low))
+            old = old[inner].astype(np.float32)
+            new = new[inner].astype(np.float32)
+            changed = new < old
+            if not changed.any():
+                continue
+            distances[:, y_start:y_stop, x_start:x_stop] = np.minimum(old, new)
+
+            # ставлю в очередь соседние тайлы, в окаймление которых попали уменьшившиеся длины
+            changed_columns = changed.any(axis=0)
+            lowest = np.where(changed, new, inf).min(axis=0)
+            for d_tile_y in (-1, 0, 1):
+                for d_tile_x in (-1, 0, 1):
+                    neighbour = (tile_y + d_tile_y, tile_x + d_tile_x)
+                    if (d_tile_y, d_tile_x) == (0, 0) or neighbour in queued:
+                        continue
+                    if not (0 <= neighbour[0] < tiles_y and 0 <= neighbour[1] < tiles_x):
+                        continue
+                    rows = {-1: slice(0, 1), 0: slice(None), 1: slice(-1, None)}[d_tile_y]
+                    columns = {-1: slice(0, 1), 0: slice(None), 1: slice(-1, None)}[d_tile_x]
+                    if changed_columns[rows, columns].any():
+                        heappush(queue, (float(lowest[rows, columns].min()), neighbour))
+                        queued.add(neighbour)
+
+        self.instrumentation.count('tiles_processed', processed)
+        distances.flush()
+        return distances